@@ -2,61 +2,581 @@
 import struct
 import datetime
 import binascii
+import mmap
+import operator
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Mapping of the struct format characters to the NumPy type codes
+NUMPY_CODES = {
+    "b": "i1",
+    "B": "u1",
+    "?": "b1",
+    "h": "i2",
+    "H": "u2",
+    "i": "i4",
+    "I": "u4",
+    "l": "i4",
+    "L": "u4",
+    "q": "i8",
+    "Q": "u8",
+    "f": "f4",
+    "d": "f8",
+}
 
 
 def get_fields_size(spec):
     # Prepend an endianness mark to prevent calcsize to insert padding bytes
-    fmt_str = "=" + "".join(x[1] for x in spec)
+    fmt_str = "=" + "".join(x[1] for x in spec if isinstance(x[1], str))
     return struct.calcsize(fmt_str)
 
 
-class BStruct:
-    def __init__(self, buf, offset=0):
-        for (name, fmt, *rest) in self._fields:
-            field_size = struct.calcsize(fmt)
-            val = struct.unpack_from(self._endianness + fmt, buf, offset)
+def get_fmt_count(fmt):
+    """Number of values packed or unpacked by the format string 'fmt'"""
+    fmt = "=" + fmt
+    return len(struct.unpack(fmt, bytes(struct.calcsize(fmt))))
+
+
+def get_fields_dtype(spec, endianness):
+    """NumPy structured dtype equivalent to the given _fields"""
+    dtype = []
+    for (name, fmt, *_) in spec:
+        m = re.fullmatch(r"(\d*)([a-zA-Z?])", fmt)
+        if m is None:
+            raise ValueError("Unsupported format '{}' for field {}".format(fmt, name))
+        count = int(m.group(1) or 1)
+        code = m.group(2)
+
+        if code == "s":
+            dtype.append((name, "S{}".format(count)))
+        elif code == "c":
+            dtype.append((name, "S1", (count,)) if count > 1 else (name, "S1"))
+        elif code == "x":
+            dtype.append((name, "V{}".format(count)))
+        elif code in NUMPY_CODES:
+            t = endianness + NUMPY_CODES[code]
+            dtype.append((name, t, (count,)) if count > 1 else (name, t))
+        else:
+            raise ValueError("Unsupported format '{}' for field {}".format(fmt, name))
+
+    return np.dtype(dtype)
+
+
+class Field:
+    """Descriptor giving access to a single field of a BStruct"""
+
+    __slots__ = ("name", "index", "offset", "struct", "count")
+
+    def __init__(self, name, index, offset, struct, count):
+        self.name = name
+        self.index = index
+        self.offset = offset
+        self.struct = struct
+        self.count = count
+
+    def decode(self, buf, offset):
+        vals = self.struct.unpack_from(buf, offset + self.offset)
+        return vals[0] if self.count == 1 else vals
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        val = obj._values[self.index]
+        if val is _UNDECODED:
+            val = self.decode(obj._buf, obj._offset)
+            obj._values[self.index] = val
+        return val
+
+    def __set__(self, obj, value):
+        obj._values[self.index] = value
+        if obj._bound:
+            self.encode(obj._buf, obj._offset, value)
+
+    def encode(self, buf, offset, value):
+        vals = (value,) if self.count == 1 else value
+        self.struct.pack_into(buf, offset + self.offset, *vals)
+
+
+# Placeholder for the fields of the lazy objects not decoded yet
+_UNDECODED = object()
+
+
+#
+# Variable-length fields
+#
+# These can be used in place of a format string in _fields, after all the
+# fixed-size fields. Tails and arrays are laid out one after the other right
+# after the fixed part, pointers refer to a structure found elsewhere in the
+# buffer. None of them is decoded before its first access, and they're neither
+# printed nor repacked along with the fixed fields.
+#
+class DynamicField:
+    inline = True
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def start(self, obj):
+        if self.prev is None:
+            return obj._offset + obj._struct.size
+        return self.prev.end(obj)
+
+    def end(self, obj):
+        return self._cached(obj)[1]
+
+    def _cached(self, obj):
+        try:
+            cache = obj._extra
+        except AttributeError:
+            cache = obj._extra = {}
+        entry = cache.get(self.name)
+        if entry is None:
+            entry = cache[self.name] = self.decode(obj)
+        return entry
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return self._cached(obj)[0]
+
+
+class Tail(DynamicField):
+    """
+    Raw bytes whose count is computed by length(), called with the values of
+    the given fixed-size fields
+    """
+
+    def __init__(self, length, *fields):
+        self.length = length
+        self.fields = fields
+
+    def decode(self, obj):
+        start = self.start(obj)
+        end = start + self.length(*(getattr(obj, f) for f in self.fields))
+        if end > len(obj._buf):
+            raise struct.error("{} runs past the end of the buffer".format(self.name))
+        return (bytes(obj._buf[start:end]), end)
+
+
+class Array(DynamicField):
+    """
+    Consecutive structures of type strucc. Their number is either held by the
+    field named by count or computed by count(obj); otherwise the array ends
+    with the first element for which until(element) is true, which isn't part
+    of the array.
+    """
+
+    def __init__(self, strucc, count=None, until=None):
+        self.strucc = strucc
+        self.count = count
+        self.until = until
+
+    def offsets(self, obj, end=False):
+        """
+        Offsets of the elements of obj's array, building none of them. With
+        end=True the offset following the array is yielded last.
+        """
+        strucc = self.strucc
+        step = strucc._step
+        buf = obj._buf
+        pos = self.start(obj)
+
+        if self.count is None:
+            while not self.until(strucc(buf, pos, True)):
+                yield pos
+                pos = step(buf, pos)
+            # Skip the terminating element as well
+            pos = step(buf, pos)
+        else:
+            count = self.count
+            if isinstance(count, str):
+                count = getattr(obj, count)
+            else:
+                count = count(obj)
+            for _ in range(count):
+                yield pos
+                pos = step(buf, pos)
+
+        if end:
+            yield pos
+
+    def iter(self, obj, lazy=False):
+        """
+        Iterate over the elements of obj's array without storing them. Lazy
+        elements are only decoded as their fields are accessed.
+        """
+        strucc = self.strucc
+        buf = obj._buf
+        for pos in self.offsets(obj):
+            yield strucc(buf, pos, lazy)
+
+    def decode(self, obj):
+        positions = list(self.offsets(obj, end=True))
+        end = positions.pop()
+        return ([self.strucc(obj._buf, pos) for pos in positions], end)
+
+
+class Pointer(DynamicField):
+    """Structure of type strucc found at the absolute offset held by field"""
+
+    inline = False
+
+    def __init__(self, strucc, field):
+        self.strucc = strucc
+        self.field = field
+
+    def decode(self, obj):
+        return (self.strucc(obj._buf, getattr(obj, self.field)), None)
+
+
+class BStructMeta(type):
+    """
+    Compile every BStruct subclass once: the fields are merged into a single
+    struct.Struct and each of them is exposed through a Field descriptor
+    indexing the list of values held by the instances.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        namespace.setdefault("__slots__", ())
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        fields = namespace.get("_fields")
+        if fields is not None:
+            cls._compile(fields)
+
+        return cls
+
+    def _compile(cls, fields):
+        dynamic = [f for f in fields if not isinstance(f[1], str)]
+        fields = [f for f in fields if isinstance(f[1], str)]
+        if fields != list(cls._fields[: len(fields)]):
+            raise TypeError("The fixed-size fields must precede the other ones")
+
+        cls._struct = struct.Struct(cls._endianness + "".join(f[1] for f in fields))
+        cls._names = tuple(f[0] for f in fields)
+        cls._layout = tuple(fields)
+        cls._by_name = {f[0]: f for f in fields}
 
-            # Flatten the single-element arrays
-            if type(val) is tuple and len(val) == 1:
-                val = val[0]
+        # Fields packing more than one value (e.g. '1508c') are kept as tuples
+        counts = [get_fmt_count(f[1]) for f in fields]
+        cls._groups = None
+        if any(n != 1 for n in counts):
+            starts = [sum(counts[:i]) for i in range(len(counts))]
+            cls._groups = tuple(zip(starts, counts))
+
+        offset = 0
+        for i, (name, fmt, *_) in enumerate(fields):
+            fs = struct.Struct(cls._endianness + fmt)
+            setattr(cls, name, Field(name, i, offset, fs, counts[i]))
+            offset += fs.size
+
+        # The inline fields are chained, each one starting where the previous
+        # one ends
+        cls._last_inline = None
+        inline = []
+        for name, field in dynamic:
+            field.__set_name__(cls, name)
+            setattr(cls, name, field)
+            if isinstance(field, Tail):
+                field.deps = [cls.__dict__[f] for f in field.fields]
+            if field.inline:
+                field.prev = cls._last_inline
+                cls._last_inline = field
+                inline.append(field)
+
+        cls._step = staticmethod(cls._compile_step(inline))
+
+    def _compile_step(cls, inline):
+        """
+        Function returning the end offset of an object given the buffer and
+        its start offset, used to walk the arrays of cls
+        """
+        size = cls._struct.size
+
+        if not inline:
+            return lambda buf, pos: pos + size
+
+        if len(inline) == 1 and isinstance(inline[0], Tail):
+            # The most common layout, a tail sized after a single field
+            (tail,) = inline
+            if len(tail.deps) == 1 and tail.deps[0].count == 1:
+                length = tail.length
+                unpack = tail.deps[0].struct.unpack_from
+                offset = tail.deps[0].offset
+
+                def step(buf, pos):
+                    return pos + size + length(unpack(buf, pos + offset)[0])
+
+                return step
+
+        if all(isinstance(f, Tail) for f in inline):
+            tails = [(f.length, f.deps) for f in inline]
+
+            def step(buf, pos):
+                end = pos + size
+                for length, deps in tails:
+                    end += length(*[d.decode(buf, pos) for d in deps])
+                return end
+
+            return step
+
+        return lambda buf, pos: cls(buf, pos, True)._end()
 
-            setattr(self, name, val)
 
-            offset += field_size
+class BStruct(metaclass=BStructMeta):
+    """
+    Base class of the binary structures described by _fields.
+
+    With lazy=True nothing is decoded up front: the object keeps a reference
+    to the source buffer and every field is unpacked on its first access.
+    The objects returned by bind() also write every assignment back into it.
+    """
+
+    __slots__ = ("_values", "_buf", "_offset", "_bound", "_extra")
+
+    def __init__(self, buf, offset=0, lazy=False):
+        if lazy:
+            if len(buf) - offset < self._struct.size:
+                raise struct.error(
+                    "{} requires a buffer of at least {} bytes".format(
+                        self.__class__.__name__, offset + self._struct.size
+                    )
+                )
+            self._values = [_UNDECODED] * len(self._names)
+            self._buf = buf
+            self._offset = offset
+            self._bound = False
+            return
+
+        self._buf = buf
+        self._offset = offset
+        self._bound = False
+        vals = self._struct.unpack_from(buf, offset)
+
+        # Flatten the single-element arrays
+        if self._groups is not None:
+            vals = [vals[s] if n == 1 else vals[s : s + n] for (s, n) in self._groups]
+
+        self._values = list(vals)
+
+    @classmethod
+    def bind(cls, buf, offset=0):
+        """
+        Lazy object bound to a writable buffer, such as a mmap opened with
+        ACCESS_WRITE: assigning a field packs it straight into the buffer.
+        """
+        with memoryview(buf) as view:
+            if view.readonly:
+                raise TypeError(
+                    "{} can't be bound to a read-only buffer".format(cls.__name__)
+                )
+
+        obj = cls(buf, offset, lazy=True)
+        obj._bound = True
+        return obj
+
+    def _decode_all(self):
+        if _UNDECODED in self._values:
+            for name in self._names:
+                getattr(self, name)
+
+    def _end(self):
+        """Offset of the first byte following the object in its buffer"""
+        # Going through the class, not to trigger the descriptor
+        last = type(self)._last_inline
+        if last is None:
+            return self._offset + self._struct.size
+        return last.end(self)
+
+    def __copy__(self):
+        self._decode_all()
+        obj = self.__class__.__new__(self.__class__)
+        obj._values = list(self._values)
+        obj._buf = self._buf
+        obj._offset = self._offset
+        obj._bound = False
+        return obj
 
     def __str__(self):
+        return self.format_fields()
+
+    @classmethod
+    def _select(cls, fields):
+        # Spec of the named fields, all of them by default
+        if fields is None:
+            return cls._layout
+
+        try:
+            return [cls._by_name[name] for name in fields]
+        except KeyError:
+            unknown = [name for name in fields if name not in cls._by_name]
+            raise AttributeError(
+                "{} has no field {}".format(cls.__name__, ", ".join(unknown))
+            )
+
+    def to_dict(self, fields=None):
+        """
+        The fields named in 'fields' (all of them by default) as plain values
+        fit for JSON or CSV: text fields are decoded, binary ones hex encoded
+        """
+        ret = {}
+
+        for (name, _, *fmt) in self._select(fields):
+            ret[name] = plain_value(getattr(self, name), *fmt)
+
+        return ret
+
+    @classmethod
+    def iter_plain(cls, buf, fields=None):
+        """
+        Decode all the records held by buf at once and yield the plain values
+        (see to_dict) of the named fields as lists
+        """
+        starts = cls._groups or [(i, 1) for i in range(len(cls._names))]
+        keys = []
+        convert = []
+        for (name, fmt, *pp) in cls._select(fields):
+            start, count = starts[cls._names.index(name)]
+            if count == 1:
+                keys.append(start)
+            else:
+                keys.append(slice(start, start + count))
+            # Single numbers are plain already
+            if count != 1 or fmt[-1] not in NUMPY_CODES:
+                convert.append((len(keys) - 1, pp[0] if pp else None))
+
+        get = operator.itemgetter(*keys)
+        single = len(keys) == 1
+
+        for vals in cls._struct.iter_unpack(buf):
+            row = [get(vals)] if single else list(get(vals))
+            for i, pp in convert:
+                row[i] = plain_value(row[i], pp)
+            yield row
+
+    def format_fields(self, fields=None):
+        """
+        Pretty print the fields named in 'fields' (all of them by default), in
+        the order they're given. Only the printed fields get decoded.
+        """
         ret = ""
 
-        for (name, _, *fmt) in self._fields:
+        for (name, _, *fmt) in self._select(fields):
             val_repr = getattr(self, name)
             # Pretty print the value using the custom formatter.
             if len(fmt):
                 (pp,) = fmt
-                val_repr = pp(self, getattr(self, name))
+                val_repr = pp(self, val_repr)
 
             ret += "{} = {}\n".format(name, val_repr)
 
         return ret
 
-    def repack(self):
-        blob_size = get_fields_size(self._fields)
+    def _flat_values(self):
+        self._decode_all()
+        if self._groups is None:
+            return self._values
 
-        if blob_size == 0:
+        vals = []
+        for v, (_, n) in zip(self._values, self._groups):
+            if n == 1:
+                vals.append(v)
+            else:
+                vals.extend(v)
+        return vals
+
+    def repack(self):
+        if self._struct.size == 0:
             return b""
 
-        offset = 0
-        blob = bytearray(b"\x00" * blob_size)
-        for (name, fmt, *_) in self._fields:
-            field_size = struct.calcsize(fmt)
-            v = getattr(self, name)
+        blob = bytearray(self._struct.size)
+        self._struct.pack_into(blob, 0, *self._flat_values())
 
-            if fmt[-1] == "s" or len(fmt) == 1:
-                v = [v]
+        return blob
 
-            struct.pack_into(self._endianness + fmt, blob, offset, *v)
-            offset += field_size
 
-        return blob
+class BStructArray:
+    """
+    Zero-copy array of BStruct records over a buffer, with column access and
+    filtering through NumPy. Single records are materialized as BStruct
+    objects only when they are accessed.
+    """
+
+    def __init__(self, strucc, buf=None, offset=0, count=-1, records=None):
+        if np is None:
+            raise ImportError("NumPy is required by BStructArray")
+
+        self.strucc = strucc
+        if records is None:
+            dtype = self.dtype_of(strucc)
+            if count < 0:
+                count = (len(buf) - offset) // dtype.itemsize
+            records = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+        self.records = records
+
+    @staticmethod
+    def dtype_of(strucc):
+        # Cache the dtype on the class itself
+        dtype = strucc.__dict__.get("_dtype")
+        if dtype is None:
+            dtype = get_fields_dtype(strucc._layout, strucc._endianness)
+            assert dtype.itemsize == strucc._struct.size
+            strucc._dtype = dtype
+        return dtype
+
+    @classmethod
+    def from_file(cls, strucc, filename, offset=0):
+        """Map the records of the file starting at offset"""
+        with open(filename, "rb") as fp:
+            try:
+                buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                buf = b""
+        return cls(strucc, buf, offset)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.records[key]
+        if isinstance(key, (int, np.integer)):
+            i = range(len(self.records))[key]
+            return self.strucc(self.records[i : i + 1].tobytes())
+        return BStructArray(self.strucc, records=self.records[key])
+
+    def __iter__(self):
+        for i in range(len(self.records)):
+            yield self[i]
+
+    def where(self, mask=None, **values):
+        """Filter by a boolean mask and/or by field=value equalities"""
+        if mask is None:
+            mask = np.ones(len(self.records), dtype=bool)
+        for name, value in values.items():
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            mask = mask & (self.records[name] == value)
+        return self[mask]
+
+
+def plain_value(value, pp=None):
+    if isinstance(value, bytes):
+        if pp is pretty_print_string:
+            return value.decode("utf-8", "replace").rstrip("\0")
+        if pp is pretty_print_wstring:
+            return value.decode("utf-16", "replace").rstrip("\0")
+        return value.hex()
+    if isinstance(value, tuple):
+        if value and isinstance(value[0], bytes):
+            return b"".join(value).hex()
+        return list(value)
+    return value
 
 
 #
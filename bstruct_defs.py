@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from bstruct import *
 
+
 #
 # Structure definitions
 #
@@ -146,6 +147,22 @@ class SymbolsRaw(BStruct):
     assert _size == 1936
 
 
+class HstHeader(BStruct):
+    _endianness = "<"
+    _fields = [
+        ("version", "i"),
+        ("copyright", "64s", pretty_print_string),
+        ("symbol", "12s", pretty_print_string),
+        ("period", "i"),
+        ("digits", "i"),
+        ("timesign", "i", pretty_print_time),
+        ("lastSync", "i", pretty_print_time),
+        ("unused", "52s", pretty_print_ignore),
+    ]
+    _size = get_fields_size(_fields)
+    assert _size == 148
+
+
 class FxtHeader(BStruct):
     _endianness = "<"
     _fields = [
@@ -219,42 +236,64 @@ class FxtHeader(BStruct):
     assert _size == 728
 
 
-class HccHeader(BStruct):
+class FxtRecord(BStruct):
     _endianness = "<"
     _fields = [
-        ("magic", "I"),
-        ("copyright", "128s", pretty_print_wstring),
-        ("name", "32s", pretty_print_wstring),
-        ("title", "64s", pretty_print_wstring),
+        ("barTime", "q", pretty_print_time),
+        ("open", "d"),
+        ("high", "d"),
+        ("low", "d"),
+        ("close", "d"),
+        ("volume", "Q"),
+        ("tickTime", "i", pretty_print_time),
+        ("flag", "i"),
     ]
     _size = get_fields_size(_fields)
-    assert _size == 228
+    assert _size == 56
 
 
-class HccTable(BStruct):
+class HstRecord(BStruct):
     _endianness = "<"
     _fields = [
-        ("unknown_0", "I"),
-        ("unknown_1", "I", pretty_print_time),
-        ("unknown_2", "H"),
-        ("size", "I"),
-        ("off", "I", pretty_print_hex),
+        ("time", "q", pretty_print_time),
+        ("open", "d"),
+        ("high", "d"),
+        ("low", "d"),
+        ("close", "d"),
+        ("volume", "Q"),
+        ("spread", "i"),
+        ("realVolume", "Q"),
     ]
     _size = get_fields_size(_fields)
-    assert _size == 18
+    assert _size == 60
 
 
-class HccRecordHeader(BStruct):
+# Records of the HST files up to build 509 (version 400)
+class Hst509Record(BStruct):
     _endianness = "<"
     _fields = [
-        ("magic", "H"),
-        ("label", "64s", pretty_print_wstring),
-        ("unknown_0", "18s", pretty_print_ignore),
-        ("rows", "I"),
-        ("unknown_1", "101s", pretty_print_ignore),
+        ("time", "i", pretty_print_time),
+        ("open", "d"),
+        ("low", "d"),
+        ("high", "d"),
+        ("close", "d"),
+        ("volume", "d"),
     ]
     _size = get_fields_size(_fields)
-    assert _size == 189
+    assert _size == 44
+
+
+def hcc_trailing_bytes(separator):
+    # Number of bytes following a HCC record, encoded in its separator
+    return (
+        ((separator >> 28) & 15) + ((separator >> 24) & 15) + ((separator >> 20) & 15)
+    )
+
+
+def hcc_record_tail(separator):
+    if separator & 0x00088884 != 0x00088884:
+        raise ValueError("Invalid record separator 0x{:08x}".format(separator))
+    return hcc_trailing_bytes(separator)
 
 
 class HccRecord(BStruct):
@@ -266,11 +305,54 @@ class HccRecord(BStruct):
         ("high", "d"),
         ("low", "d"),
         ("close", "d"),
+        ("trailing", Tail(hcc_record_tail, "separator")),
     ]
     _size = get_fields_size(_fields)
     assert _size == 40
 
 
+class HccRecordHeader(BStruct):
+    _endianness = "<"
+    _fields = [
+        ("magic", "H"),
+        ("label", "64s", pretty_print_wstring),
+        ("unknown_0", "18s", pretty_print_ignore),
+        ("rows", "I"),
+        ("unknown_1", "101s", pretty_print_ignore),
+        ("records", Array(HccRecord, count="rows")),
+    ]
+    _size = get_fields_size(_fields)
+    assert _size == 189
+
+
+class HccTable(BStruct):
+    _endianness = "<"
+    _fields = [
+        ("unknown_0", "I"),
+        ("unknown_1", "I", pretty_print_time),
+        ("unknown_2", "H"),
+        ("size", "I"),
+        ("off", "I", pretty_print_hex),
+        ("header", Pointer(HccRecordHeader, "off")),
+    ]
+    _size = get_fields_size(_fields)
+    assert _size == 18
+
+
+class HccHeader(BStruct):
+    _endianness = "<"
+    _fields = [
+        ("magic", "I"),
+        ("copyright", "128s", pretty_print_wstring),
+        ("name", "32s", pretty_print_wstring),
+        ("title", "64s", pretty_print_wstring),
+        # Quite crude, but seems to work
+        ("tables", Array(HccTable, until=lambda t: t.off == t.size == 0)),
+    ]
+    _size = get_fields_size(_fields)
+    assert _size == 228
+
+
 class SrvHeader(BStruct):
     _endianness = "<"
     _fields = [
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Writers for the columnar export targets.
+
+The columns are passed around as a dict of equally long NumPy arrays, keyed by
+the column name. NPY stores them as a single structured array, NPZ as one
+array per column; Arrow IPC and Parquet need pyarrow.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+FORMATS = ("npy", "npz", "arrow", "parquet")
+
+# Extensions used to guess the format from the output file name
+EXTENSIONS = {
+    ".npy": "npy",
+    ".npz": "npz",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".parquet": "parquet",
+}
+
+
+class MissingDependency(Exception):
+    pass
+
+
+def guess_format(filename, default="csv"):
+    """Output format matching the extension of filename"""
+    if filename:
+        for ext, fmt in EXTENSIONS.items():
+            if filename.lower().endswith(ext):
+                return fmt
+    return default
+
+
+def to_records(columns):
+    """Pack the columns into a single structured array"""
+    dtype = [(name, col.dtype) for name, col in columns.items()]
+    length = len(next(iter(columns.values()))) if columns else 0
+    rec = np.empty(length, dtype=dtype)
+    for name, col in columns.items():
+        rec[name] = col
+    return rec
+
+
+def to_table(columns):
+    """Convert the columns into a pyarrow Table"""
+    return pa.table({name: pa.array(col) for name, col in columns.items()})
+
+
+def write_columns(columns, filename, fmt):
+    """Write the columns into filename using the fmt target"""
+    if np is None:
+        raise MissingDependency("NumPy is required for the '%s' output" % fmt)
+
+    if fmt == "npy":
+        np.save(filename, to_records(columns), allow_pickle=False)
+    elif fmt == "npz":
+        np.savez(filename, **columns)
+    elif fmt in ("arrow", "parquet"):
+        if pa is None:
+            raise MissingDependency("pyarrow is required for the '%s' output" % fmt)
+        table = to_table(columns)
+        if fmt == "parquet":
+            pa.parquet.write_table(table, filename)
+        else:
+            with pa.OSFile(filename, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+    else:
+        raise ValueError("Unknown columnar format '%s'" % fmt)
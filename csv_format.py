@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the CSV writers.
+
+Formatting every timestamp through datetime/strftime dominates the cost of
+dumping large history files. TimestampFormatter renders the date part once per
+day and builds the time of day from precomputed tables, format_timestamps does
+the same for whole NumPy arrays at once.
+"""
+
+import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+_MINUTES = ["%02d:%02d:" % divmod(m, 60) for m in range(24 * 60)]
+_SECONDS = ["%02d" % s for s in range(60)]
+_MILLIS = [".%03d" % ms for ms in range(1000)]
+
+
+class TimestampFormatter:
+    """
+    Format Unix timestamps (in UTC) as 'YYYY.MM.DD HH:MM:SS[.mmm]', the date
+    separator being configurable.
+    """
+
+    def __init__(self, dateSeparator="."):
+        self.dateFormat = dateSeparator.join(("%Y", "%m", "%d")) + " "
+        self._day = None
+        self._prefix = None
+
+    def __call__(self, timestamp, millis=None):
+        day, sec = divmod(int(timestamp), 86400)
+        if day != self._day:
+            self._day = day
+            self._prefix = (EPOCH + datetime.timedelta(days=day)).strftime(
+                self.dateFormat
+            )
+        text = self._prefix + _MINUTES[sec // 60] + _SECONDS[sec % 60]
+        if millis is not None:
+            text += _MILLIS[millis]
+        return text
+
+    def fromDatetime(self, dt, millis=False):
+        """Format a naive (UTC) or aware datetime object"""
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        us = (dt - EPOCH) // datetime.timedelta(microseconds=1)
+        sec, us = divmod(us, 1000000)
+        return self(sec, us // 1000 if millis else None)
+
+
+def format_timestamps(t, dateSeparator=".", unit="s"):
+    """Vectorized TimestampFormatter over an array of Unix timestamps"""
+    t = np.asarray(t)
+    if not np.issubdtype(t.dtype, np.datetime64):
+        t = t.astype(np.int64).astype("datetime64[%s]" % unit)
+    text = np.datetime_as_string(t, unit=unit)
+    text = np.char.replace(text, "T", " ")
+    if dateSeparator != "-":
+        text = np.char.replace(text, "-", dateSeparator)
+    return text
+
+
+def price_format(digits):
+    """Fixed-precision formatter for prices with the given number of digits"""
+    return ("{:.%df}" % digits).format
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import urllib.request
+import io
 from urllib.error import URLError
 import re
 from datetime import date
@@ -16,8 +16,14 @@
 import datetime
 import csv
 
+from csv_format import TimestampFormatter, price_format
+from http_pool import HttpPool
+
 userAgent = "Mozilla/5.0 (X11; Linux x86_64; rv:42.0) Gecko/20100101 Firefox/42.0)"
 
+# Connections are kept alive between the list and history files
+http = HttpPool({"User-Agent": userAgent}, compress=True)
+
 
 def error(message, exit=True):
     print("[ERROR] ", message)
@@ -26,17 +32,14 @@ def error(message, exit=True):
 
 
 def fetchHistoryList(pair):
-    listUrlTemplate = "http://history.metaquotes.net/symbols/%s/list.txt"
-    listUrl = listUrlTemplate % pair
+    listUrl = "%s/%s/list.txt" % (args.url, pair)
     if args.verbose:
         print("Downloading %s list file from %s ..." % (pair, listUrl))
 
     history = []
     try:
-        request = urllib.request.Request(listUrl, None, {"User-Agent": userAgent})
-        with urllib.request.urlopen(request) as response:
-            for line in response:
-                history += [line.decode("utf-8").rstrip("\n")]
+        for line in io.BytesIO(http.get(listUrl)):
+            history += [line.decode("utf-8").rstrip("\n")]
     except URLError as e:
         if hasattr(e, "reason"):
             error(e.reason)
@@ -63,15 +66,14 @@ def downloadHistoryFile(pair, year, month, historyFile, destination):
             print("Skipping, file already exists.")
         return
 
-    historyUrlTemplate = "http://history.metaquotes.net/symbols/%s/%s"
-    historyUrl = historyUrlTemplate % (pair, historyFile)
+    historyUrl = "%s/%s/%s" % (args.url, pair, historyFile)
     if args.verbose:
         print("Downloading history file from %s to %s ..." % (historyUrl, destination))
     try:
-        request = urllib.request.Request(historyUrl, None, {"User-Agent": userAgent})
+        data = http.get(historyUrl)
         os.makedirs(os.path.dirname(historyPath), mode=0o755, exist_ok=True)
-        with urllib.request.urlopen(request) as response, open(historyPath, "wb") as h:
-            h.write(response.read())
+        with open(historyPath, "wb") as h:
+            h.write(data)
     except URLError as e:
         if hasattr(e, "reason"):
             error(e.reason)
@@ -408,14 +410,18 @@ def convertToCsv(pair, year, month, historyFile, destination):
         else:
             timeOffset = datetime.timedelta(0)
 
+        formatTime = TimestampFormatter("-")
+        formatPrice = price_format(5)
+        timeOffset = int(timeOffset.total_seconds())
+
         for bar in bars:
             csvWriter.writerow(
                 [
-                    (bar["timestamp"] + timeOffset).strftime("%Y-%m-%d %H:%M:%S"),
-                    bar["open"] / 1e5,
-                    bar["high"] / 1e5,
-                    bar["low"] / 1e5,
-                    bar["close"] / 1e5,
+                    formatTime(bar["timestamp"].timestamp() + timeOffset),
+                    formatPrice(bar["open"] / 1e5),
+                    formatPrice(bar["high"] / 1e5),
+                    formatPrice(bar["low"] / 1e5),
+                    formatPrice(bar["close"] / 1e5),
                     bar["volume"],
                 ]
             )
@@ -478,6 +484,14 @@ def convertToCsv(pair, year, month, historyFile, destination):
         dest="anomaly",
         help="Run anomaly tests during conversion.",
     )
+    argumentParser.add_argument(
+        "-u",
+        "--url",
+        action="store",
+        dest="url",
+        help="Base URL of the history files.",
+        default="http://history.metaquotes.net/symbols",
+    )
     argumentParser.add_argument(
         "-v",
         "--verbose",
@@ -13,6 +13,8 @@
 import sys
 import time
 
+import tick_store
+
 
 class Spinner:
     """Displays an ASCII spinner"""
@@ -41,11 +43,13 @@ def spin(self):
 
 
 class Input:
+    mode = "r"
+
     def __init__(self, path):
         if args.verbose:
             print("[INFO] Trying to read data from %s..." % path)
         try:
-            self.path = open(path, "r")
+            self.path = open(path, self.mode)
         except OSError as e:
             print(
                 "[ERROR] '%s' raised when tried to read the file '%s'"
@@ -121,6 +125,48 @@ def _parseLine(self, line):
         }
 
 
+class TickFile(Input):
+    """Binary tick file, as stored by fx-data-download.py --store"""
+
+    mode = "rb"
+
+    def __init__(self, path):
+        super().__init__(path)
+        size = os.fstat(self.path.fileno()).st_size
+        self.count = (size - tick_store.HEADER.size) // tick_store.RECORD.size
+
+    def __iter__(self):
+        try:
+            ticks = tick_store.iter_ticks(self.path)
+            for (n, (t, bid, ask, bidVolume, askVolume)) in enumerate(ticks, 1):
+                tick = {
+                    # Whole seconds, as the CSV ticks
+                    "timestamp": float(t // 1000),
+                    "bidPrice": bid,
+                    "askPrice": ask,
+                    "bidVolume": bidVolume,
+                    "askVolume": askVolume,
+                }
+                yield (tick, n == self.count)
+        except ValueError as e:
+            print("[ERROR] %s: %s" % (self.path.name, e))
+            sys.exit(1)
+
+
+def open_input(path):
+    """The ticks of either a CSV or a binary tick file"""
+    if os.path.isfile(path) and tick_store.is_tick_file(path):
+        return TickFile(path)
+    return CSV(path)
+
+
+def iter_inputs(paths):
+    """The ticks of all the input files, one after the other"""
+    for (n, path) in enumerate(paths, 1):
+        for (tick, isLastRow) in open_input(path):
+            yield (tick, isLastRow and n == len(paths))
+
+
 class Output:
     def __init__(self, timeframe, path_suffix, symbol, output_dir):
         self.deltaTimestamp = timeframe * 60
@@ -656,8 +702,9 @@ def config_argparser():
         "-i",
         "--input-file",
         action="store",
-        dest="inputFile",
-        help="Input filename (in CSV format)",
+        nargs="+",
+        dest="inputFiles",
+        help="Input filename(s), in CSV or binary tick format, read in order",
         default=None,
         required=True,
     )
@@ -776,7 +823,7 @@ def process_queue(queue):
     try:
         for obj in queue:
 
-            ticks = CSV(args.inputFile)
+            ticks = iter_inputs(args.inputFiles)
 
             startTimestamp = None
 
@@ -846,7 +893,7 @@ def process_queue(queue):
 
     # Checking input file argument.
     if args.verbose:
-        print("[INFO] Input file: %s" % args.inputFile)
+        print("[INFO] Input file(s): %s" % ", ".join(args.inputFiles))
 
     # Checking symbol pair argument.
     if args.pair and len(args.pair) > 12:
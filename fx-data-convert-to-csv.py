@@ -2,21 +2,41 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import bstruct
-import csv
-import datetime
-import math
+import mmap
+import multiprocessing
+import os
+import shutil
 import struct
 import sys
+import tempfile
+
+from columnar import MissingDependency, guess_format, write_columns
+from csv_format import TimestampFormatter
+from hcc_reader import HccReader
+from history_summary import HistorySummary
+import hcc_reader
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Smallest record range formatted by a single worker
+PARALLEL_MIN_ROWS = 1 << 16
 
 
 class Input:
-    def __init__(self, fileName):
-        if args.verbose:
+    def __init__(self, fileName, verbose=False):
+        if verbose:
             print("[INFO] Trying to read data from %s..." % fileName)
         try:
             with open(fileName, "rb") as inputFile:
-                self.content = inputFile.read()
+                if os.fstat(inputFile.fileno()).st_size:
+                    self.content = mmap.mmap(
+                        inputFile.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+                else:
+                    self.content = b""
         except OSError as e:
             print(
                 "[ERROR] '%s' raised when tried to read the file '%s'"
@@ -24,12 +44,13 @@ def __init__(self, fileName):
             )
             sys.exit(1)
 
+        self.fileName = fileName
         self._checkFormat()
         if self.rowLength != 0:
             self.numberOfRows = (
                 len(self.content) - self.headerLength
             ) // self.rowLength
-        self._parse()
+        self._rows = None
 
     def _checkFormat(self):
         if (len(self.content) - self.headerLength) % self.rowLength != 0:
@@ -39,324 +60,306 @@ def _checkFormat(self):
             print("[ERROR] Unsupported format version!")
             sys.exit(1)
 
+    @property
+    def rows(self):
+        # Rows are only decoded when a textual output is requested
+        if self._rows is None:
+            self._rows = self._parse()
+        return self._rows
+
     def _parse(self):
-        pass
+        return list(self._parseRange(0, self.numberOfRows))
+
+    def _parseRange(self, start, stop):
+        # Decode the records in the [start, stop) range, one tuple per record
+        body = memoryview(self.content)[
+            self.headerLength
+            + start * self.rowLength : self.headerLength
+            + stop * self.rowLength
+        ]
+        return struct.iter_unpack(self.rowFormat, body)
+
+    def _lines(self, fmt, rows):
+        return []
+
+    def __str__(self):
+        return "\n".join(self._lines(self.tableFormat, self.rows))
+
+    def toCsv(self, fileName):
+        with open(fileName, "w", newline="") as csvFile:
+            # Keep the line terminator used by csv.writer
+            csvFile.writelines(
+                line + "\r\n" for line in self._lines(self.csvFormat, self.rows)
+            )
+
+    def toCsvParallel(self, fileName, jobs):
+        """
+        Format the body in record ranges on several processes, then join the
+        pieces in order into fileName
+        """
+        if not self.rowLength or jobs < 2:
+            return self.toCsv(fileName)
+
+        step = max(PARALLEL_MIN_ROWS, -(-self.numberOfRows // (jobs * 4)))
+        partDir = tempfile.mkdtemp(
+            prefix=".parts-", dir=os.path.dirname(os.path.abspath(fileName))
+        )
+        ranges = [
+            (
+                type(self),
+                self.fileName,
+                start,
+                min(start + step, self.numberOfRows),
+                os.path.join(partDir, "%08d.csv" % n),
+            )
+            for (n, start) in enumerate(range(0, self.numberOfRows, step))
+        ]
+
+        try:
+            with multiprocessing.Pool(jobs) as pool, open(fileName, "wb") as csvFile:
+                # Parts are joined as soon as they are done, in order
+                for partName in pool.imap(formatRange, ranges):
+                    with open(partName, "rb") as part:
+                        copyFile(part, csvFile)
+                    os.remove(partName)
+        finally:
+            shutil.rmtree(partDir, ignore_errors=True)
+
+    def iterColumns(self, chunkRows=1 << 20):
+        """Yield the body as consecutive chunks of records viewed as columns"""
+        if np is None:
+            raise MissingDependency("NumPy is required for the columnar access")
+
+        dtype = np.dtype(self.recordLayout)
+        for start in range(0, self.numberOfRows, chunkRows):
+            yield np.frombuffer(
+                self.content,
+                dtype=dtype,
+                count=min(chunkRows, self.numberOfRows - start),
+                offset=self.headerLength + start * self.rowLength,
+            )
+
+    def columns(self):
+        """Decode the whole body at once as a dict of NumPy columns"""
+        body = np.concatenate(
+            list(self.iterColumns()) or [np.empty(0, self.recordLayout)]
+        )
+        columns = {}
+        for name in body.dtype.names:
+            # Skip the padding
+            if name.startswith("_"):
+                continue
+            col = body[name]
+            if name in self.timeColumns:
+                col = col.astype("datetime64[s]")
+            columns[name] = np.ascontiguousarray(col)
+        return columns
+
+    def summary(self, period="day"):
+        """Compute the per-period statistics in one streaming pass"""
+        if np is None:
+            raise MissingDependency("NumPy is required for the summary")
+
+        summary = HistorySummary(period)
+        state = {}
+        for chunk in self.iterColumns():
+            summary.update(
+                chunk[self.summaryTimeColumn],
+                chunk["low"],
+                chunk["high"],
+                self.summaryVolume(chunk, state),
+            )
+        return summary
+
+    def summaryVolume(self, chunk, state):
+        """The volume of every record of the chunk, None when there is none"""
+        return chunk[self.volumeColumn] if self.volumeColumn else None
 
 
 class HCC(Input):
     rowLength = 0
     headerLength = 228
     version = 501
+    summaryTimeColumn = "time"
+    volumeColumn = None
+    csvFormat = "{},{:.5f},{:.5f},{:.5f},{:.5f}"
+    tableFormat = "{:<19},{:>9.5f},{:>9.5f},{:>9.5f},{:>9.5f}"
 
-    def _checkFormat(self):
-        header = HccHeader(self.content)
-
-        if header.magic != 501:
+    def __init__(self, fileName, verbose=False, cacheIndex=False):
+        if verbose:
+            print("[INFO] Trying to read data from %s..." % fileName)
+        try:
+            # The tables are indexed and decoded lazily, nothing but the
+            # headers is read here
+            self.reader = HccReader(fileName, cache_index=cacheIndex)
+        except OSError as e:
+            print(
+                "[ERROR] '%s' raised when tried to read the file '%s'"
+                % (e.strerror, fileName)
+            )
+            sys.exit(1)
+        except (ValueError, struct.error):
             print("[ERROR] Unsupported format version!")
             sys.exit(1)
 
+        self._rows = None
+
     def _parse(self):
-        self.rows = []
-
-        # Skip the header
-        base = HccHeader._size
-
-        # Consume all the tables
-        while True:
-            t = HccTable(self.content, base)
-
-            if t.off == t.size == 0:
-                break
-
-            # Consume all the records
-            rh = HccRecordHeader(self.content, t.off)
-            assert rh.magic == 0x81
-
-            # We have to keep track of the cursor as some records have various
-            # trailing bytes
-            row_base = t.off + HccRecordHeader._size
-            for i in range(rh.rows):
-                tick = HccRecord(self.content, row_base)
-
-                assert tick.separator & 0x00088884 == 0x00088884
-
-                self.rows += [
-                    {
-                        "timestamp": datetime.datetime.fromtimestamp(tick.time),
-                        "open": tick.open,
-                        "high": tick.high,
-                        "low": tick.low,
-                        "close": tick.close,
-                    }
-                ]
-
-                row_base += HccRecord._size + (
-                    ((tick.separator >> 28) & 15)
-                    + ((tick.separator >> 24) & 15)
-                    + ((tick.separator >> 20) & 15)
+        rows = []
+
+        for table in self.reader:
+            cols = table.read()
+            rows += zip(
+                *(
+                    cols[name].tolist() if np is not None else cols[name]
+                    for name in hcc_reader.COLUMNS
                 )
+            )
 
-            base += HccTable._size
+        return rows
 
-    def __str__(self):
-        table = ""
-        separator = ","
-        for row in self.rows:
-            table += "{:<19}".format("{:%Y.%m.%d %H:%M:%S}".format(row["timestamp"]))
-            table += separator
-            table += "{:>9.5f}".format(row["open"])
-            table += separator
-            table += "{:>9.5f}".format(row["high"])
-            table += separator
-            table += "{:>9.5f}".format(row["low"])
-            table += separator
-            table += "{:>9.5f}".format(row["close"])
-            table += "\n"
-        return table[:-1]
+    def _lines(self, fmt, rows):
+        formatTime = TimestampFormatter()
+        for t, o, h, l, c in rows:
+            yield fmt.format(formatTime(t), o, h, l, c)
 
-    def toCsv(self, fileName):
-        with open(fileName, "w", newline="") as csvFile:
-            writer = csv.writer(csvFile, quoting=csv.QUOTE_NONE)
-            for row in self.rows:
-                writer.writerow(
-                    [
-                        "{:%Y.%m.%d %H:%M:%S}".format(row["timestamp"]),
-                        "{:.5f}".format(row["open"]),
-                        "{:.5f}".format(row["high"]),
-                        "{:.5f}".format(row["low"]),
-                        "{:.5f}".format(row["close"]),
-                    ]
-                )
+    def iterColumns(self, chunkRows=1 << 20):
+        if np is None:
+            raise MissingDependency("NumPy is required for the columnar access")
+
+        for table in self.reader:
+            for start in range(0, table.rows, chunkRows):
+                yield table.read(start, start + chunkRows)
+
+    def columns(self):
+        parts = list(self.iterColumns())
+        columns = {}
+        for name in hcc_reader.COLUMNS:
+            col = np.concatenate([p[name] for p in parts]) if parts else np.empty(0)
+            if name == "time":
+                col = col.astype("datetime64[s]")
+            columns[name] = np.ascontiguousarray(col)
+        return columns
 
 
 class HST509(Input):
     version = 400
     headerLength = 148
     rowLength = 44
-
-    def _parse(self):
-        self.rows = []
-        for i in range(0, self.numberOfRows):
-            base = self.headerLength + i * self.rowLength
-            self.rows += [
-                {
-                    "timestamp": datetime.datetime.fromtimestamp(
-                        struct.unpack("<i", self.content[base : base + 4])[0],
-                        datetime.timezone.utc,
-                    ),
-                    "open": struct.unpack("<d", self.content[base + 4 : base + 4 + 8])[
-                        0
-                    ],
-                    "low": struct.unpack(
-                        "<d", self.content[base + 4 + 8 : base + 4 + 2 * 8]
-                    )[0],
-                    "high": struct.unpack(
-                        "<d", self.content[base + 4 + 2 * 8 : base + 4 + 3 * 8]
-                    )[0],
-                    "close": struct.unpack(
-                        "<d", self.content[base + 4 + 3 * 8 : base + 4 + 4 * 8]
-                    )[0],
-                    "volume": struct.unpack(
-                        "<d", self.content[base + 4 + 4 * 8 : base + 4 + 5 * 8]
-                    )[0],
-                }
-            ]
-
-    def __str__(self):
-        table = ""
-        separator = ","
-        for row in self.rows:
-            table += "{:<19}".format("{:%Y.%m.%d %H:%M:%S}".format(row["timestamp"]))
-            table += separator
-            table += "{:>9.5f}".format(row["open"])
-            table += separator
-            table += "{:>9.5f}".format(row["high"])
-            table += separator
-            table += "{:>9.5f}".format(row["low"])
-            table += separator
-            table += "{:>9.5f}".format(row["close"])
-            table += separator
-            table += "{:>12.2f}".format(row["volume"])
-            table += "\n"
-        return table[:-1]
-
-    def toCsv(self, fileName):
-        with open(fileName, "w", newline="") as csvFile:
-            writer = csv.writer(csvFile, quoting=csv.QUOTE_NONE)
-            for row in self.rows:
-                writer.writerow(
-                    [
-                        "{:%Y.%m.%d %H:%M:%S}".format(row["timestamp"]),
-                        "{:.5f}".format(row["open"]),
-                        "{:.5f}".format(row["high"]),
-                        "{:.5f}".format(row["low"]),
-                        "{:.5f}".format(row["close"]),
-                        "{:.2f}".format(row["volume"]),
-                    ]
-                )
+    recordLayout = [
+        ("timestamp", "<i4"),
+        ("open", "<f8"),
+        ("low", "<f8"),
+        ("high", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<f8"),
+    ]
+    timeColumns = ("timestamp",)
+    summaryTimeColumn = "timestamp"
+    volumeColumn = "volume"
+    rowFormat = "<iddddd"
+    csvFormat = "{},{:.5f},{:.5f},{:.5f},{:.5f},{:.2f}"
+    tableFormat = "{:<19},{:>9.5f},{:>9.5f},{:>9.5f},{:>9.5f},{:>12.2f}"
+
+    def _lines(self, fmt, rows):
+        formatTime = TimestampFormatter()
+        for t, o, l, h, c, v in rows:
+            yield fmt.format(formatTime(t), o, h, l, c, v)
 
 
 class HST(Input):
     version = 401
     headerLength = 148
     rowLength = 60
-
-    def _parse(self):
-        self.rows = []
-        for i in range(0, self.numberOfRows):
-            base = self.headerLength + i * self.rowLength
-            self.rows += [
-                {
-                    "timestamp": datetime.datetime.fromtimestamp(
-                        struct.unpack("<i", self.content[base : base + 4])[0],
-                        datetime.timezone.utc,
-                    ),
-                    "open": struct.unpack("<d", self.content[base + 8 : base + 2 * 8])[
-                        0
-                    ],
-                    "high": struct.unpack(
-                        "<d", self.content[base + 2 * 8 : base + 3 * 8]
-                    )[0],
-                    "low": struct.unpack(
-                        "<d", self.content[base + 3 * 8 : base + 4 * 8]
-                    )[0],
-                    "close": struct.unpack(
-                        "<d", self.content[base + 4 * 8 : base + 5 * 8]
-                    )[0],
-                    "volume": struct.unpack(
-                        "<Q", self.content[base + 5 * 8 : base + 6 * 8]
-                    )[0],
-                    "spread": struct.unpack(
-                        "<i", self.content[base + 6 * 8 : base + 4 + 6 * 8]
-                    )[0],
-                    "realVolume": struct.unpack(
-                        "<Q", self.content[base + 4 + 6 * 8 : base + 4 + 7 * 8]
-                    )[0],
-                }
-            ]
-
-    def __str__(self):
-        table = ""
-        separator = ","
-        for row in self.rows:
-            table += "{:<19}".format("{:%Y.%m.%d %H:%M:%S}".format(row["timestamp"]))
-            table += separator
-            table += "{:>.5f}".format(row["open"])
-            table += separator
-            table += "{:>.5f}".format(row["high"])
-            table += separator
-            table += "{:>.5f}".format(row["low"])
-            table += separator
-            table += "{:>.5f}".format(row["close"])
-            table += separator
-            table += "{:>d}".format(row["volume"])
-            table += separator
-            table += "{:>d}".format(row["spread"])
-            table += separator
-            table += "{:>d}".format(row["realVolume"])
-            table += "\n"
-        return table[:-1]
-
-    def toCsv(self, fileName):
-        with open(fileName, "w", newline="") as csvFile:
-            writer = csv.writer(csvFile, quoting=csv.QUOTE_NONE)
-            for row in self.rows:
-                writer.writerow(
-                    [
-                        "{:%Y.%m.%d %H:%M:%S}".format(row["timestamp"]),
-                        "{:.5f}".format(row["open"]),
-                        "{:.5f}".format(row["high"]),
-                        "{:.5f}".format(row["low"]),
-                        "{:.5f}".format(row["close"]),
-                        "{:d}".format(row["volume"]),
-                        "{:d}".format(row["spread"]),
-                        "{:d}".format(row["realVolume"]),
-                    ]
-                )
+    recordLayout = [
+        ("timestamp", "<i4"),
+        ("_padding", "V4"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<u8"),
+        ("spread", "<i4"),
+        ("realVolume", "<u8"),
+    ]
+    timeColumns = ("timestamp",)
+    summaryTimeColumn = "timestamp"
+    volumeColumn = "volume"
+    rowFormat = "<i4xddddQiQ"
+    csvFormat = tableFormat = "{},{:.5f},{:.5f},{:.5f},{:.5f},{:d},{:d},{:d}"
+
+    def _lines(self, fmt, rows):
+        formatTime = TimestampFormatter()
+        for t, o, h, l, c, v, spread, realVolume in rows:
+            yield fmt.format(formatTime(t), o, h, l, c, v, spread, realVolume)
 
 
 class FXT(Input):
     version = 405
     headerLength = 728
     rowLength = 56
-
-    def _parse(self):
-        self.rows = []
-        for i in range(0, self.numberOfRows):
-            base = self.headerLength + i * self.rowLength
-            self.rows += [
-                {
-                    "barTimestamp": datetime.datetime.fromtimestamp(
-                        struct.unpack("<i", self.content[base : base + 4])[0],
-                        datetime.timezone.utc,
-                    ),
-                    "open": struct.unpack("<d", self.content[base + 8 : base + 2 * 8])[
-                        0
-                    ],
-                    "high": struct.unpack(
-                        "<d", self.content[base + 2 * 8 : base + 3 * 8]
-                    )[0],
-                    "low": struct.unpack(
-                        "<d", self.content[base + 3 * 8 : base + 4 * 8]
-                    )[0],
-                    "close": struct.unpack(
-                        "<d", self.content[base + 4 * 8 : base + 5 * 8]
-                    )[0],
-                    "volume": struct.unpack(
-                        "<Q", self.content[base + 5 * 8 : base + 6 * 8]
-                    )[0],
-                    "tickTimestamp": datetime.datetime.fromtimestamp(
-                        struct.unpack(
-                            "<i", self.content[base + 6 * 8 : base + 4 + 6 * 8]
-                        )[0],
-                        datetime.timezone.utc,
-                    ),
-                    "flag": struct.unpack(
-                        "<i", self.content[base + 4 + 6 * 8 : base + 7 * 8]
-                    )[0],
-                }
-            ]
-
-    def __str__(self):
-        table = ""
-        separator = ","
-        for row in self.rows:
-            table += "{:<19}".format("{:%Y.%m.%d %H:%M:%S}".format(row["barTimestamp"]))
-            table += separator
-            table += "{:>.5f}".format(row["open"])
-            table += separator
-            table += "{:>.5f}".format(row["high"])
-            table += separator
-            table += "{:>.5f}".format(row["low"])
-            table += separator
-            table += "{:>.5f}".format(row["close"])
-            table += separator
-            table += "{:>d}".format(row["volume"])
-            table += separator
-            table += "{:<19}".format(
-                "{:%Y.%m.%d %H:%M:%S}".format(row["tickTimestamp"])
+    recordLayout = [
+        ("barTimestamp", "<i4"),
+        ("_padding", "V4"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<u8"),
+        ("tickTimestamp", "<i4"),
+        ("flag", "<i4"),
+    ]
+    timeColumns = ("barTimestamp", "tickTimestamp")
+    summaryTimeColumn = "tickTimestamp"
+    volumeColumn = "volume"
+    rowFormat = "<i4xddddQii"
+    csvFormat = tableFormat = "{},{:.5f},{:.5f},{:.5f},{:.5f},{:d},{},{:d}"
+
+    def summaryVolume(self, chunk, state):
+        # The volume of a tick is the running total of its bar, so only what
+        # it adds to the previous tick of the same bar is counted. The last
+        # tick of the previous chunk is kept in state.
+        bars = chunk["barTimestamp"].astype(np.int64)
+        volumes = chunk[self.volumeColumn].astype(np.float64)
+        prevBars = np.concatenate(([state.get("bar", -1)], bars[:-1]))
+        prevVolumes = np.concatenate(([state.get("volume", 0.0)], volumes[:-1]))
+        state["bar"], state["volume"] = bars[-1], volumes[-1]
+        return np.where(bars == prevBars, volumes - prevVolumes, volumes)
+
+    def _lines(self, fmt, rows):
+        # Bar and tick times share the cached date prefix
+        formatTime = TimestampFormatter()
+        for barTime, o, h, l, c, v, tickTime, flag in rows:
+            yield fmt.format(
+                formatTime(barTime), o, h, l, c, v, formatTime(tickTime), flag
             )
-            table += separator
-            table += "{:>d}".format(row["flag"])
-            table += "\n"
-        return table[:-1]
 
-    def toCsv(self, fileName):
-        with open(fileName, "w", newline="") as csvFile:
-            writer = csv.writer(csvFile, quoting=csv.QUOTE_NONE)
-            for row in self.rows:
-                writer.writerow(
-                    [
-                        "{:%Y.%m.%d %H:%M:%S}".format(row["barTimestamp"]),
-                        "{:.5f}".format(row["open"]),
-                        "{:.5f}".format(row["high"]),
-                        "{:.5f}".format(row["low"]),
-                        "{:.5f}".format(row["close"]),
-                        "{:d}".format(row["volume"]),
-                        "{:%Y.%m.%d %H:%M:%S}".format(row["tickTimestamp"]),
-                        "{:d}".format(row["flag"]),
-                    ]
-                )
+
+def copyFile(src, dst):
+    """Append the content of src to dst, in kernel space when possible"""
+    if hasattr(os, "copy_file_range"):
+        dst.flush()
+        try:
+            while os.copy_file_range(src.fileno(), dst.fileno(), 1 << 30):
+                pass
+            return
+        except OSError:
+            # Not supported between these file systems, carry on from the
+            # current position of src
+            pass
+    shutil.copyfileobj(src, dst)
+
+
+def formatRange(job):
+    """Worker of Input.toCsvParallel, writes the CSV of a record range"""
+    cls, fileName, start, stop, partName = job
+    data = cls(fileName)
+    with open(partName, "w", newline="") as part:
+        part.writelines(
+            line + "\r\n"
+            for line in data._lines(data.csvFormat, data._parseRange(start, stop))
+        )
+    return partName
 
 
 if __name__ == "__main__":
@@ -386,6 +389,47 @@ def toCsv(self, fileName):
         help="Output CSV file",
         default=None,
     )
+    argumentParser.add_argument(
+        "-t",
+        "--output-type",
+        action="store",
+        dest="outputType",
+        choices=["csv", "npy", "npz", "arrow", "parquet"],
+        help="Type of the output file (default: guessed from its extension)",
+        default=None,
+    )
+    argumentParser.add_argument(
+        "-s",
+        "--summary",
+        action="store",
+        dest="summary",
+        nargs="?",
+        const="day",
+        choices=["day", "month"],
+        help="Print per-day or per-month statistics instead of the records",
+        default=None,
+    )
+    argumentParser.add_argument(
+        "--json",
+        action="store_true",
+        dest="json",
+        help="Print the summary in JSON format",
+    )
+    argumentParser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        dest="jobs",
+        type=int,
+        help="Number of processes formatting the CSV output (0: all CPUs)",
+        default=1,
+    )
+    argumentParser.add_argument(
+        "--cache-index",
+        action="store_true",
+        dest="cacheIndex",
+        help="Keep the record offsets of a HCC file in a .idx file next to it",
+    )
     argumentParser.add_argument(
         "-v",
         "--verbose",
@@ -405,18 +449,45 @@ def toCsv(self, fileName):
     )
     args = argumentParser.parse_args()
 
+    outputType = args.outputType or guess_format(args.outputFile)
+    if outputType != "csv" and not args.outputFile and not args.summary:
+        print("[ERROR] The '%s' output requires an output file!" % outputType)
+        sys.exit(1)
+
     if args.inputFormat == "hst509":
-        hst509 = HST509(args.inputFile)
-        hst509.toCsv(args.outputFile) if args.outputFile else print(hst509)
+        data = HST509(args.inputFile, args.verbose)
     elif args.inputFormat == "hst":
-        hst = HST(args.inputFile)
-        hst.toCsv(args.outputFile) if args.outputFile else print(hst)
+        data = HST(args.inputFile, args.verbose)
     elif args.inputFormat == "fxt":
-        fxt = FXT(args.inputFile)
-        fxt.toCsv(args.outputFile) if args.outputFile else print(fxt)
+        data = FXT(args.inputFile, args.verbose)
     elif args.inputFormat == "hcc":
-        hcc = HCC(args.inputFile)
-        hcc.toCsv(args.outputFile) if args.outputFile else print(hcc)
+        data = HCC(args.inputFile, args.verbose, args.cacheIndex)
     else:
         print("[ERROR] Unknown input file format '%s'!" % args.inputFormat)
         sys.exit(1)
+
+    try:
+        if args.summary:
+            summary = data.summary(args.summary)
+            report = summary.toJson() if args.json else str(summary)
+            if args.outputFile:
+                with open(args.outputFile, "w") as outputFile:
+                    outputFile.write(report + "\n")
+            else:
+                print(report)
+        elif outputType == "csv":
+            if not args.outputFile:
+                print(data)
+            elif args.jobs != 1:
+                data.toCsvParallel(args.outputFile, args.jobs or os.cpu_count())
+            else:
+                data.toCsv(args.outputFile)
+        else:
+            write_columns(data.columns(), args.outputFile, outputType)
+    except MissingDependency as e:
+        print("[ERROR] %s!" % e)
+        sys.exit(1)
+
+    if args.inputFormat == "hcc":
+        # Stores the offset index with --cache-index
+        data.reader.close()
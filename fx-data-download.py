@@ -9,8 +9,11 @@
 import argparse
 import datetime
 import time
-import urllib.request
 import socket
+import json
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import HTTPError, ContentTooShortError
 
 try:
@@ -18,9 +21,18 @@
 except ImportError:
     from backports import lzma
 from struct import *
-import csv
+import calendar
 import subprocess
 
+from csv_format import TimestampFormatter, price_format
+from http_pool import HttpPool
+import tick_store
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 intlist = lambda l: list(map(int, l))
 
 # Create a mapping of currencies.
@@ -261,17 +273,171 @@
 }
 
 
+# A .bi5 tick: milliseconds in the hour, ask and bid in points, their volumes
+BI5_TICK = Struct(">iiiff")
+if np is not None:
+    BI5_DTYPE = np.dtype(
+        [
+            ("time", ">i4"),
+            ("ask", ">i4"),
+            ("bid", ">i4"),
+            ("askVolume", ">f4"),
+            ("bidVolume", ">f4"),
+        ]
+    )
+
+
+def ascii_decimals(values, decimals):
+    """
+    The non-negative integers in values written with the given number of
+    decimals, one row of ASCII codes per value: the rows are right-aligned
+    and padded with zeros, which are meant to be dropped at last.
+    """
+    unit = 10**decimals
+    whole = values // unit
+    wholeWidth = len(str(int(whole.max())))
+    width = wholeWidth + (decimals + 1 if decimals else 0)
+
+    out = np.empty((len(values), width), np.uint8)
+    rest = values.copy()
+    for col in range(width - 1, -1, -1):
+        if decimals and col == wholeWidth:
+            out[:, col] = ord(".")
+            continue
+        out[:, col] = ord("0") + rest % 10
+        rest //= 10
+    # Leading zeros of the whole part
+    for col in range(wholeWidth - 1):
+        out[whole < 10 ** (wholeWidth - 1 - col), col] = 0
+    return out
+
+
+def format_bi5(data, hourStart, point):
+    """
+    The CSV rows of the decompressed .bi5 ticks of the hour starting at
+    hourStart. With NumPy the whole hour is decoded at once and every row is
+    laid out in a byte matrix, its padding being removed in a single pass.
+    """
+    count = len(data) // BI5_TICK.size
+    digits = len(str(point)) - 1
+
+    if np is not None and count:
+        ticks = np.frombuffer(data, BI5_DTYPE, count)
+        ms = ticks["time"].astype(np.int64)
+        prices = np.concatenate((ticks["bid"], ticks["ask"])).astype(np.int64)
+        volumes = np.concatenate((ticks["bidVolume"], ticks["askVolume"]))
+        # float32 volumes times 100 are exact doubles, so rounding them
+        # matches "%.2f"
+        cents = np.rint(volumes.astype(np.float64) * 100)
+        vectorizable = (
+            0 <= ms.min()
+            and ms.max() < 3600000
+            and prices.min() >= 0
+            and np.isfinite(cents).all()
+            and cents.min() >= 0
+        )
+    else:
+        vectorizable = False
+
+    if not vectorizable:
+        formatTime = TimestampFormatter()
+        formatPrice = price_format(digits)
+        return "".join(
+            "%s,%s,%s,%.2f,%.2f\r\n"
+            % (
+                formatTime(hourStart + ms // 1000, ms % 1000),
+                formatPrice(bid / point),
+                formatPrice(ask / point),
+                bidVolume,
+                askVolume,
+            )
+            for (ms, ask, bid, askVolume, bidVolume) in BI5_TICK.iter_unpack(
+                data[: count * BI5_TICK.size]
+            )
+        ).encode("ascii")
+
+    # Only the minutes, seconds and milliseconds change within the hour
+    hour = TimestampFormatter()(hourStart)[:-5]
+    minutes, ms = np.divmod(ms, 60000)
+    seconds, ms = np.divmod(ms, 1000)
+
+    def text(s):
+        return np.broadcast_to(
+            np.frombuffer(s.encode("ascii"), np.uint8), (count, len(s))
+        )
+
+    def fixed(values, width):
+        out = np.empty((count, width), np.uint8)
+        for col in range(width - 1, -1, -1):
+            out[:, col] = ord("0") + values % 10
+            values = values // 10
+        return out
+
+    prices = ascii_decimals(prices, digits)
+    cents = ascii_decimals(cents.astype(np.int64), 2)
+    rows = np.hstack(
+        (
+            text(hour),
+            fixed(minutes, 2),
+            text(":"),
+            fixed(seconds, 2),
+            text("."),
+            fixed(ms, 3),
+            text(","),
+            prices[:count],
+            text(","),
+            prices[count:],
+            text(","),
+            cents[:count],
+            text(","),
+            cents[count:],
+            text("\r\n"),
+        )
+    )
+    return rows[rows != 0].tobytes()
+
+
+def bi5_records(data, hourStart):
+    """The decompressed .bi5 ticks of the hour as packed tick_store records"""
+    count = len(data) // BI5_TICK.size
+    if np is None:
+        return b"".join(
+            tick_store.RECORD.pack(
+                hourStart * 1000 + ms, bid, ask, bidVolume, askVolume
+            )
+            for (ms, ask, bid, askVolume, bidVolume) in BI5_TICK.iter_unpack(
+                data[: count * BI5_TICK.size]
+            )
+        )
+
+    ticks = np.frombuffer(data, BI5_DTYPE, count)
+    records = np.empty(count, tick_store.DTYPE)
+    records["time"] = hourStart * 1000 + ticks["time"].astype(np.int64)
+    for name in ("bid", "ask", "bidVolume", "askVolume"):
+        records[name] = ticks[name]
+    return records.tobytes()
+
+
 class Dukascopy:
-    url_tpl = "http://datafeed.dukascopy.com/datafeed/%s/%04d/%02d/%02d/%02dh_ticks.bi5"
+    base_url = "http://datafeed.dukascopy.com/datafeed"
+    url_tpl = "%s/%s/%04d/%02d/%02d/%02dh_ticks.bi5"
+    # Connections are kept alive between the downloads
+    http = HttpPool()
 
     def __init__(self, pair, year, month, day, hour, dest="download/dukascopy"):
-        if not os.path.exists(dest):
-            os.makedirs(dest)
+        # Several workers may create the same directories at once
+        os.makedirs(dest, exist_ok=True)
+        self.dest = dest
+        self.pair = pair
         self.year = year
         self.month = month
         self.day = day
         self.hour = hour
-        self.url = self.url_tpl % (pair, int(year), month - 1, day, hour)
+        # Outcome of download(), as recorded in the manifest
+        self.status = None
+        self.size = None
+        self.crc = None
+        self.url = self.url_tpl % (self.base_url, pair, int(year), month - 1, day, hour)
         self.path = "%s/%04d/%02d/%04d-%02d-%02d--%02dh_ticks.bi5" % (
             dest,
             year,
@@ -286,19 +452,25 @@ def download(self):
         print("Downloading %s into: %s..." % (self.url, self.path))
         if os.path.isfile(self.path):
             print("File (%s) exists, so skipping." % self.path)
+            self.check()
             return True
         elif os.path.isfile(self.path.replace("bi5", "csv")):
             print("File (%s) exists, so skipping." % self.path.replace("bi5", "csv"))
+            self.status = "ok"
             return True
         else:
-            if not os.path.exists(os.path.dirname(self.path)):
-                os.makedirs(os.path.dirname(self.path))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
             i = 1
             while i <= 5:
                 try:
-                    urllib.request.urlretrieve(self.url, filename=self.path)
+                    self.http.retrieve(self.url, self.path)
                     break
                 except HTTPError as err:
+                    if err.code == 404:
+                        # The hour doesn't exist, retrying won't change that
+                        print("Error: %s, reason: %s." % (err.code, err.reason))
+                        self.status = "missing"
+                        return False
                     print(
                         "Error: %s, reason: %s. Retrying (%i).."
                         % (err.code, err.reason, i)
@@ -322,25 +494,59 @@ def download(self):
                     )
                     i += 1
 
-            if i == 5:
+            if i > 5:
+                self.status = "failed"
                 return False
 
+        self.check()
         return True
 
-    def bt5_to_csv(self):
+    def check(self):
+        """Set the status, size and CRC-32 of the downloaded .bi5 file"""
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.status = "ok" if data else "empty"
+        self.size = len(data)
+        self.crc = "%08x" % zlib.crc32(data)
+
+    @property
+    def point(self):
+        """Scale of the prices stored in the .bi5 files"""
+        if self.pair in ("USDRUB", "XAGUSD", "XAUUSD") or self.pair.endswith("JPY"):
+            return 1000
+        return 100000
+
+    @property
+    def hourStart(self):
+        return calendar.timegm((self.year, self.month, self.day, self.hour, 0, 0))
+
+    def store_path(self, period):
+        """Path of the tick file holding the hour, one per day or month"""
+        if period == "month":
+            return "%s/%04d/%04d-%02d_ticks.bin" % (
+                self.dest,
+                self.year,
+                self.year,
+                self.month,
+            )
+        return "%s/%04d/%02d/%04d-%02d-%02d_ticks.bin" % (
+            self.dest,
+            self.year,
+            self.month,
+            self.year,
+            self.month,
+            self.day,
+        )
+
+    def read_bi5(self):
+        """The decompressed ticks, None if there are none"""
         try:
             fileSize = os.stat(self.path).st_size
             if fileSize == 0:
                 print("File (%s) is empty" % self.path)
-                return
+                return None
         except FileNotFoundError:
-            return False
-
-        new_path = self.path.replace("bi5", "csv")
-        if os.path.isfile(new_path):
-            print("CSV file (%s) exists, so skipping." % new_path)
-
-        print("Converting into CSV (%s)..." % new_path)
+            return None
 
         # Opening, uncompress & reading raw data
         try:
@@ -359,52 +565,244 @@ def bt5_to_csv(self):
                 print(
                     "Error: Unable to find the 'xz' LZMA decompressor utility in your PATH, moving on."
                 )
-                return False
+                return None
             data, error = pipe.communicate()
+        return data
 
-        # Opening output CSV file for write
-        f = open(new_path, "w", newline="")
-        w = csv.writer(f, quoting=csv.QUOTE_NONE)
+    def bt5_to_csv(self):
+        data = self.read_bi5()
+        if data is None:
+            return False
 
-        normSymbols = ["USDRUB", "XAGUSD", "XAUUSD"]
-        point = 100000
+        new_path = self.path.replace("bi5", "csv")
+        if os.path.isfile(new_path):
+            print("CSV file (%s) exists, so skipping." % new_path)
 
-        for sym in normSymbols:
-            if pair == sym:
-                point = 1000
-                break
+        print("Converting into CSV (%s)..." % new_path)
 
-        if pair.endswith("JPY"):
-            point = 1000
+        # Writing the rows in CSV format at once
+        with open(new_path, "wb") as f:
+            f.write(format_bi5(data, self.hourStart, self.point))
 
-        TICK_BYTES = 20
-        for i in range(0, len(data) // TICK_BYTES):
-            row = bytearray()
-            for j in range(0, TICK_BYTES):
-                row.append(data[i * TICK_BYTES + j])
+    def bi5_to_ticks(self):
+        """The hour as packed tick_store records"""
+        data = self.read_bi5()
+        if data is None:
+            return b""
+        return bi5_records(data, self.hourStart)
 
-            # Big-endian to Little-endian conversion
-            row = unpack(">iiiff", row)
 
-            # Calculating & formatting column values
-            minute = row[0] / 1000 // 60
-            second = row[0] / 1000 - minute * 60
-            timestamp = "%d.%02d.%02d %02d:%02d:%06.3f" % (
-                self.year,
-                self.month,
-                self.day,
-                self.hour,
-                minute,
-                second,
+class TickStores:
+    """Append the hours, in order, to one tick file per day or month"""
+
+    def __init__(self, period):
+        self.period = period
+        self.writer = None
+
+    def append(self, ds, records):
+        path = ds.store_path(self.period)
+        if self.writer is None or self.writer.path != path:
+            self.close()
+            print("Storing ticks into: %s..." % path)
+            self.writer = tick_store.TickWriter(path, ds.point)
+        self.writer.append(records)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class Manifest:
+    """
+    What is known of the hours of a pair, kept as compact JSON next to them:
+    [status, .bi5 size, CRC-32, fetch time] by hour start timestamp. The
+    status is "ok", "empty" (no ticks), "missing" (404) or "failed".
+    """
+
+    DONE = ("ok", "empty", "missing")
+    # Seconds after which a missing hour is taken as never coming
+    SETTLED = 24 * 3600
+
+    def __init__(self, path):
+        self.path = path
+        self.hours = {}
+        self.unsaved = 0
+        try:
+            with open(path, "r") as fp:
+                hours = json.load(fp)["hours"]
+            self.hours = {int(hour): entry for hour, entry in hours.items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError):
+            print("Manifest (%s) is unreadable, so starting over." % path)
+
+    def done(self, hour):
+        """Whether the hour doesn't need to be fetched again"""
+        entry = self.hours.get(hour)
+        return entry is not None and entry[0] in self.DONE
+
+    def watermark(self):
+        """The start of the latest hour done, None if there is none"""
+        return max(
+            (hour for hour, entry in self.hours.items() if entry[0] in self.DONE),
+            default=None,
+        )
+
+    def failed(self):
+        return sorted(
+            hour for hour, entry in self.hours.items() if entry[0] == "failed"
+        )
+
+    def record(self, ds):
+        now = int(time.time())
+        # An hour still going on would be missing its last ticks
+        if ds.status is None or ds.hourStart + 3600 > now:
+            return
+        status = ds.status
+        # The datafeed may not have published the latest hours yet
+        if status == "missing" and ds.hourStart + self.SETTLED > now:
+            status = "failed"
+        self.hours[ds.hourStart] = [status, ds.size, ds.crc, now]
+        self.unsaved += 1
+        if self.unsaved >= 1000:
+            self.save()
+
+    def save(self):
+        if not self.unsaved:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(
+                {
+                    "version": 1,
+                    "hours": {str(h): e for h, e in sorted(self.hours.items())},
+                },
+                fp,
+                separators=(",", ":"),
             )
-            askPrice = row[1] / point
-            bidPrice = row[2] / point
-            bidVolume = "%.2f" % (row[4])
-            askVolume = "%.2f" % (row[3])
+        os.replace(tmp, self.path)
+        self.unsaved = 0
+
+
+class Manifests:
+    """The manifests of the pairs downloaded into dest, loaded when needed"""
+
+    def __init__(self, dest):
+        self.dest = dest
+        self.manifests = {}
+
+    def __getitem__(self, pair):
+        if pair not in self.manifests:
+            path = "%s/%s/manifest.json" % (self.dest, pair)
+            self.manifests[pair] = Manifest(path)
+        return self.manifests[pair]
+
+    def record(self, ds):
+        self[ds.pair].record(ds)
 
-            # Writing one row in CSV format
-            w.writerow([timestamp, bidPrice, askPrice, bidVolume, askVolume])
-        f.close()
+    def save(self):
+        for manifest in self.manifests.values():
+            manifest.save()
+
+
+def hours_to_update(pairs, manifests, now=None):
+    """
+    Yield the (pair, year, month, day, hour) to download to bring the pairs
+    up to date: the hours which failed, then the ones after the watermark of
+    their manifest (or since the start of the pair), up to the last complete
+    one.
+    """
+    now = time.time() if now is None else now
+    end = int(now) // 3600 * 3600
+    for pair in sorted(pairs):
+        manifest = manifests[pair]
+        watermark = manifest.watermark()
+        if watermark is None:
+            start = -(-all_currencies[pair] // 3600) * 3600
+        else:
+            start = watermark + 3600
+        failed = [hour for hour in manifest.failed() if hour < start]
+        for hour in failed + list(range(start, end, 3600)):
+            tm = time.gmtime(hour)
+            yield (pair, tm.tm_year, tm.tm_mon, tm.tm_mday, tm.tm_hour)
+
+
+def hours_to_download(pairs, years, months, days, hours):
+    """Yield the (pair, year, month, day, hour) to download, in order"""
+    for pair in sorted(pairs):
+        for year in sorted(years):
+            for month in sorted(months):
+                for day in sorted(days):
+                    for hour in sorted(hours):
+                        try:
+                            dt = datetime.datetime(
+                                year=year, month=month, day=day, hour=hour
+                            )
+                        except ValueError:  # Ignore invalid dates.
+                            continue
+                        unix = time.mktime(dt.timetuple())
+
+                        # Validate dates
+                        if unix > all_currencies.get(pair) and unix < time.time():
+                            yield (pair, year, month, day, hour)
+
+
+def fetch(ds, convert, store):
+    try:
+        ds.download()
+        if convert:
+            ds.bt5_to_csv()
+        if store is not None:
+            return ds.bi5_to_ticks()
+    except ValueError as err:
+        # A single bad hour doesn't stop the others
+        print("Error: %s, so skipping %s." % (err, ds.url))
+        ds.status = "failed"
+        # Nothing to store
+        return b"" if store is not None else None
+
+
+def fetch_all(downloads, convert, jobs=1, store=None, manifests=None):
+    """
+    Download (and convert) every Dukascopy hour, keeping up to 'jobs' of them
+    in flight. They are still started and finished in order, at most twice as
+    many being queued so that long ranges aren't expanded at once. The ticks
+    of every hour are appended to the store, if any, in order too, and the
+    outcome recorded into the manifests, if any.
+    """
+    if jobs <= 1:
+        for ds in downloads:
+            records = fetch(ds, convert, store)
+            if store is not None:
+                store.append(ds, records)
+            if manifests is not None:
+                manifests.record(ds)
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+
+        def finish():
+            ds, future = pending.popleft()
+            records = future.result()
+            if store is not None:
+                store.append(ds, records)
+            if manifests is not None:
+                manifests.record(ds)
+
+        try:
+            for ds in downloads:
+                pending.append((ds, pool.submit(fetch, ds, convert, store)))
+                if len(pending) >= 2 * jobs:
+                    finish()
+            while pending:
+                finish()
+        except BaseException:
+            for ds, future in pending:
+                future.cancel()
+            raise
 
 
 if __name__ == "__main__":
@@ -475,7 +873,47 @@ def bt5_to_csv(self):
         help="Year(s) to download (separated by comma).",
         default="2020",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        dest="jobs",
+        type=int,
+        help="Number of hours downloaded in parallel.",
+        default=1,
+    )
+    parser.add_argument(
+        "-u",
+        "--url",
+        action="store",
+        dest="url",
+        help="Base URL of the datafeed.",
+        default=Dukascopy.base_url,
+    )
+    parser.add_argument(
+        "-s",
+        "--store",
+        action="store",
+        dest="store",
+        choices=["day", "month"],
+        help="Also store the ticks into a binary tick file per day or month.",
+    )
+    parser.add_argument(
+        "-M",
+        "--manifest",
+        action="store_true",
+        dest="manifest",
+        help="Record the hours fetched into a manifest per pair, and skip those done.",
+    )
+    parser.add_argument(
+        "-U",
+        "--update",
+        action="store_true",
+        dest="update",
+        help="Fetch the hours after the ones of the manifests, and the failed ones.",
+    )
     args = parser.parse_args()
+    Dukascopy.base_url = args.url
 
     curr_year = datetime.date.today().year
     pairs = (
@@ -492,37 +930,31 @@ def bt5_to_csv(self):
         else intlist(args.years.split(","))
     )
 
+    manifests = Manifests(args.dest) if args.manifest or args.update else None
+    if args.update:
+        todo = hours_to_update(pairs, manifests)
+    else:
+        todo = hours_to_download(pairs, years, months, days, hours)
+        if manifests is not None:
+            todo = (
+                (pair, year, month, day, hour)
+                for (pair, year, month, day, hour) in todo
+                if not manifests[pair].done(
+                    calendar.timegm((year, month, day, hour, 0, 0))
+                )
+            )
+
+    downloads = (
+        Dukascopy(pair, year, month, day, hour, dest=args.dest + "/" + pair)
+        for (pair, year, month, day, hour) in todo
+    )
+    store = TickStores(args.store) if args.store else None
     try:
-        currencies = []
-        for pair in sorted(pairs):
-            for year in sorted(years):
-                for month in sorted(months):
-                    for day in sorted(days):
-                        for hour in sorted(hours):
-                            try:
-                                dt = datetime.datetime(
-                                    year=year, month=month, day=day, hour=hour
-                                )
-                                unix = time.mktime(dt.timetuple())
-
-                                # Validate dates
-                                if (
-                                    unix > all_currencies.get(pair)
-                                    and unix < time.time()
-                                ):
-                                    ds = Dukascopy(
-                                        pair,
-                                        year,
-                                        month,
-                                        day,
-                                        hour,
-                                        dest=args.dest + "/" + pair,
-                                    )
-                                    ds.download()
-                                    if args.csv:
-                                        ds.bt5_to_csv()
-                                    # raise KeyboardInterrupt # perform one record for testing
-                            except ValueError:  # Ignore invalid dates.
-                                continue
+        fetch_all(downloads, args.csv, args.jobs, store, manifests)
     except KeyboardInterrupt:
         sys.exit()
+    finally:
+        if store is not None:
+            store.close()
+        if manifests is not None:
+            manifests.save()
@@ -11,6 +11,8 @@
 import random
 from math import ceil, exp, pi, sin
 
+from csv_format import TimestampFormatter, price_format
+
 
 def error(message, exit=True):
     print("[ERROR]", message)
@@ -216,14 +218,17 @@ def toCsv(rows, digits, output):
     csvWriter = csv.writer(
         output, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL
     )
+    formatTime = TimestampFormatter()
+    formatPrice = price_format(digits)
+    minPrice = 10 ** -digits
     for row in rows:
         csvWriter.writerow(
             [
-                row["timestamp"].strftime("%Y.%m.%d %H:%M:%S.%f")[:-3],
-                ("{:.%df}" % (digits)).format(max(row["bidPrice"], 10 ** -digits)),
-                ("{:.%df}" % (digits)).format(max(row["askPrice"], 10 ** -digits)),
-                ("{:.%df}" % (digits)).format(row["bidVolume"]),
-                ("{:.%df}" % (digits)).format(row["askVolume"]),
+                formatTime.fromDatetime(row["timestamp"], millis=True),
+                formatPrice(max(row["bidPrice"], minPrice)),
+                formatPrice(max(row["askPrice"], minPrice)),
+                formatPrice(row["bidVolume"]),
+                formatPrice(row["askVolume"]),
             ]
         )
 
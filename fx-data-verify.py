@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Script to verify a generated FXT file against the CSV ticks it was built from.
+# Example usage:
+#   ./fx-data-verify.py -i ticks.csv -f EURUSD1_0.fxt
+
+import argparse
+import calendar
+import mmap
+import os
+import struct
+import sys
+
+from bstruct_defs import FxtHeader
+
+FXT_VERSION = 405
+FXT_RECORD = struct.Struct("<i4xddddQii")
+
+# Number of FXT records decoded per step
+CHUNK_RECORDS = 1 << 16
+
+
+class Divergence(Exception):
+    pass
+
+
+class CsvTicks:
+    """Iterate over (line number, timestamp, bid) of the CSV ticks"""
+
+    def __init__(self, path):
+        self.path = open(path, "r")
+        self._days = {}
+
+    def __del__(self):
+        self.path.close()
+
+    def _timestamp(self, s):
+        # The date prefix is parsed once per day
+        day = self._days.get(s[:10])
+        if day is None:
+            day = calendar.timegm((int(s[0:4]), int(s[5:7]), int(s[8:10]), 0, 0, 0))
+            self._days = {s[:10]: day}
+        return day + int(s[11:13]) * 3600 + int(s[14:16]) * 60 + int(s[17:19])
+
+    def __iter__(self):
+        for n, line in enumerate(self.path, 1):
+            tick = line.split(",")
+            if len(tick) < 3:
+                continue
+            yield (n, self._timestamp(tick[0]), float(tick[1]))
+
+
+class FxtRecords:
+    """Iterate over (record index, record) of a FXT file, in constant memory"""
+
+    def __init__(self, path):
+        with open(path, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size < FxtHeader._size:
+                raise Divergence("The FXT file is shorter than its header")
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.header = FxtHeader(self._map)
+        if self.header.headerVersion != FXT_VERSION:
+            raise Divergence("Unsupported FXT version %d" % self.header.headerVersion)
+
+        body = len(self._map) - FxtHeader._size
+        if body % FXT_RECORD.size:
+            raise Divergence("The FXT body isn't a multiple of the record size")
+        self.count = body // FXT_RECORD.size
+
+    def offset(self, i):
+        return FxtHeader._size + i * FXT_RECORD.size
+
+    def __iter__(self):
+        for start in range(0, self.count, CHUNK_RECORDS):
+            stop = min(start + CHUNK_RECORDS, self.count)
+            chunk = self._map[self.offset(start) : self.offset(stop)]
+            yield from enumerate(FXT_RECORD.iter_unpack(chunk), start)
+
+
+def verify(csvPath, fxtPath, tolerance):
+    """
+    Walk both files side by side and raise Divergence at the first mismatch.
+
+    With the every tick model each CSV tick must have its own FXT record; with
+    the other models the FXT records must be an ordered subset of the ticks.
+    """
+    fxt = FxtRecords(fxtPath)
+    strict = fxt.header.modelType == 0
+    period = fxt.header.timeframe * 60
+
+    ticks = iter(CsvTicks(csvPath))
+    line = 0
+    bars = 0
+    lastBar = None
+
+    for i, (barTime, _, high, low, close, _, tickTime, _) in fxt:
+        where = "FXT record %d (offset 0x%x)" % (i, fxt.offset(i))
+
+        if barTime != lastBar:
+            if lastBar is not None and barTime < lastBar:
+                raise Divergence("%s: bar time goes backwards" % where)
+            lastBar = barTime
+            bars += 1
+
+        if low > high:
+            raise Divergence("%s: low %.5f above high %.5f" % (where, low, high))
+
+        while True:
+            try:
+                line, t, bid = next(ticks)
+            except StopIteration:
+                raise Divergence("%s: no matching tick left in the CSV" % where)
+
+            matches = t == tickTime and abs(bid - close) <= tolerance
+            if matches or strict or t > tickTime:
+                break
+
+        if not matches:
+            raise Divergence(
+                "%s, CSV line %d: expected tick %d @ %.5f, found %d @ %.5f"
+                % (where, line, t, bid, tickTime, close)
+            )
+
+        if strict and barTime != t - t % period:
+            raise Divergence(
+                "%s, CSV line %d: tick %d doesn't belong to bar %d"
+                % (where, line, t, barTime)
+            )
+
+    if strict:
+        for line, t, bid in ticks:
+            raise Divergence(
+                "FXT ends after %d records (offset 0x%x), CSV line %d is left"
+                % (fxt.count, fxt.offset(fxt.count), line)
+            )
+
+    return (fxt.count, line, bars)
+
+
+if __name__ == "__main__":
+    # Parse the arguments
+    argumentParser = argparse.ArgumentParser(add_help=False)
+    argumentParser.add_argument(
+        "-i",
+        "--input-file",
+        action="store",
+        dest="inputFile",
+        help="Source CSV file with the ticks",
+        required=True,
+    )
+    argumentParser.add_argument(
+        "-f",
+        "--fxt-file",
+        action="store",
+        dest="fxtFile",
+        help="FXT file generated from the input file",
+        required=True,
+    )
+    argumentParser.add_argument(
+        "-t",
+        "--tolerance",
+        action="store",
+        dest="tolerance",
+        type=float,
+        help="Maximum allowed price difference",
+        default=1e-8,
+    )
+    argumentParser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        help="Enables verbose messages",
+    )
+    argumentParser.add_argument(
+        "-h", "--help", action="help", help="Show this help message and exit"
+    )
+    args = argumentParser.parse_args()
+
+    try:
+        records, lines, bars = verify(args.inputFile, args.fxtFile, args.tolerance)
+    except OSError as e:
+        print(
+            "[ERROR] '%s' raised when tried to read the file '%s'"
+            % (e.strerror, e.filename)
+        )
+        sys.exit(1)
+    except Divergence as e:
+        print("[ERROR] %s" % e)
+        sys.exit(2)
+
+    if args.verbose:
+        print(
+            "[INFO] %d FXT records in %d bars match the first %d CSV lines"
+            % (records, bars, lines)
+        )
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy reader for the MetaTrader 5 HCC history caches.
+
+Each HCC record is 40 bytes long, optionally followed by some trailing bytes
+whose count is encoded in the upper nibbles of the 'separator' field. This
+makes it impossible to compute the position of the Nth record without looking
+at all the preceding ones, so the reader builds (once per table) a compact
+index holding the offset of every record and then decodes only the requested
+ranges.
+"""
+
+import array
+import mmap
+import os
+import struct
+
+from bstruct_defs import HccHeader, HccRecordHeader, HccRecord
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HCC_MAGIC = 501
+HCC_RECORD_MAGIC = 0x81
+HCC_SEPARATOR_MASK = 0x00088884
+
+# Layout of the index cache file: file size, file mtime and number of tables,
+# followed by the row count and the offsets of every table
+INDEX_CACHE_HEADER = struct.Struct("<QdI")
+INDEX_CACHE_SUFFIX = ".idx"
+
+COLUMNS = ("time", "open", "high", "low", "close")
+
+_uint32 = struct.Struct("<I")
+_record = struct.Struct("<IIdddd")
+
+if np is not None:
+    _record_dtype = np.dtype(
+        [
+            ("separator", "<u4"),
+            ("time", "<u4"),
+            ("open", "<f8"),
+            ("high", "<f8"),
+            ("low", "<f8"),
+            ("close", "<f8"),
+        ]
+    )
+
+
+class HccTableReader:
+    """
+    A single table of a HCC file. The record header and the offset index are
+    only read when they are needed for the first time.
+    """
+
+    def __init__(self, hcc, table, limit):
+        self._hcc = hcc
+        self._header = None
+        self._offsets = None
+        self._limit = limit
+        self.table = table
+
+    @property
+    def header(self):
+        if self._header is None:
+            header = self.table.header
+            if header.magic != HCC_RECORD_MAGIC:
+                raise ValueError("Invalid HCC record header magic 0x%x" % header.magic)
+            self._header = header
+        return self._header
+
+    @property
+    def label(self):
+        return self.header.label.decode("utf-16").rstrip("\0")
+
+    @property
+    def rows(self):
+        return self.header.rows
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def first_record(self):
+        return self.table.off + HccRecordHeader._size
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            self._offsets = self._build_index()
+        return self._offsets
+
+    def _build_index(self):
+        buf = self._hcc.buf
+        base = self.first_record
+        rows = self.rows
+
+        if np is not None and rows:
+            # Optimistic path, most of the tables have no trailing bytes at all
+            # so the records are laid out with a fixed stride
+            end = base + rows * HccRecord._size
+            if end <= len(buf):
+                seps = np.frombuffer(
+                    buf, dtype="<u4", count=rows * HccRecord._size // 4, offset=base
+                )[:: HccRecord._size // 4]
+                if not np.any(seps & 0xFFF00000):
+                    if not np.all(seps & HCC_SEPARATOR_MASK == HCC_SEPARATOR_MASK):
+                        raise ValueError("Invalid record separator")
+                    return array.array("Q", range(base, end, HccRecord._size))
+
+        # The separators are checked while walking the records
+        return array.array("Q", HccRecordHeader.records.offsets(self.header))
+
+    def extent(self):
+        """
+        Byte range of the table and time of its first and last records. When
+        the records fill exactly the space up to the next table (or the end
+        of the file) only these two records are read, otherwise the offset
+        index is built.
+        """
+        buf = self._hcc.buf
+        base = self.first_record
+        rows = self.rows
+        if not rows:
+            return (self.table.off, base, None, None)
+
+        if self._offsets is None and self._limit - base == rows * HccRecord._size:
+            last = base + (rows - 1) * HccRecord._size
+        else:
+            last = self.offsets[-1]
+
+        # Also checks the separator of the last record
+        end = HccRecord._step(buf, last)
+        first_time = _uint32.unpack_from(buf, base + 4)[0]
+        last_time = _uint32.unpack_from(buf, last + 4)[0]
+        return (self.table.off, end, first_time, last_time)
+
+    def time_at(self, i):
+        """Timestamp of the i-th record, decoding nothing else"""
+        return _uint32.unpack_from(self._hcc.buf, self.offsets[i] + 4)[0]
+
+    def bisect(self, timestamp):
+        """Index of the first record whose time is not lower than timestamp"""
+        lo, hi = 0, self.rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read(self, start=0, stop=None):
+        """
+        Decode the records in the [start, stop) range and return them as a
+        dict of columns (NumPy arrays when available, lists otherwise)
+        """
+        start, stop, _ = slice(start, stop).indices(self.rows)
+        stop = max(start, stop)
+        offsets = self.offsets[start:stop]
+        buf = self._hcc.buf
+
+        if np is not None:
+            count = len(offsets)
+            size = HccRecord._size
+            if count and offsets[-1] - offsets[0] == (count - 1) * size:
+                # No trailing bytes in the range, the records have a fixed
+                # stride (copied, not to hold the mapping open)
+                rec = np.frombuffer(
+                    buf, dtype=_record_dtype, count=count, offset=offsets[0]
+                ).copy()
+            else:
+                # Gather the records from a sliding window over the file, one
+                # row of bytes per position
+                raw = np.frombuffer(buf, dtype=np.uint8)
+                windows = np.lib.stride_tricks.as_strided(
+                    raw, shape=(max(len(raw) - size + 1, 0), size), strides=(1, 1)
+                )
+                idx = np.frombuffer(offsets, dtype=np.uint64).astype(np.intp)
+                rec = windows[idx].view(_record_dtype).reshape(-1)
+            return {name: rec[name] for name in COLUMNS}
+
+        cols = {name: [] for name in COLUMNS}
+        unpack_record = _record.unpack_from
+        for off in offsets:
+            _, t, o, h, l, c = unpack_record(buf, off)
+            cols["time"].append(t)
+            cols["open"].append(o)
+            cols["high"].append(h)
+            cols["low"].append(l)
+            cols["close"].append(c)
+        return cols
+
+    def read_between(self, start_time, end_time):
+        """Decode the records whose time falls in [start_time, end_time)"""
+        return self.read(self.bisect(start_time), self.bisect(end_time))
+
+
+class HccReader:
+    """
+    Read-only, memory-mapped view over a HCC file. Only the header and the
+    table chain are parsed when the file is opened.
+    """
+
+    def __init__(self, filename, cache_index=False):
+        self.filename = filename
+        self.cache_index = cache_index
+        self._index_loaded = False
+
+        with open(filename, "rb") as fp:
+            st = os.fstat(fp.fileno())
+            self._stat = (st.st_size, st.st_mtime)
+            if st.st_size:
+                self.buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.buf = b""
+
+        self.header = HccHeader(self.buf)
+        if self.header.magic != HCC_MAGIC:
+            raise ValueError("Unsupported HCC version %d" % self.header.magic)
+
+        # Each table is bounded by the next one or by the end of the file
+        tables = list(self.header.tables)
+        starts = sorted(t.off for t in tables) + [len(self.buf)]
+        self.tables = [
+            HccTableReader(self, t, starts[starts.index(t.off) + 1]) for t in tables
+        ]
+
+        if cache_index:
+            self._load_index()
+
+    def __len__(self):
+        return sum(t.rows for t in self.tables)
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def close(self):
+        if self.cache_index and not self._index_loaded:
+            self.save_index()
+            self._index_loaded = True
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_between(self, start_time, end_time):
+        """Decode the records of every table falling in [start_time, end_time)"""
+        cols = {name: [] for name in COLUMNS}
+        for t in self.tables:
+            if not t.rows:
+                continue
+            if t.time_at(0) >= end_time or t.time_at(t.rows - 1) < start_time:
+                continue
+            part = t.read_between(start_time, end_time)
+            for name in COLUMNS:
+                cols[name].append(part[name])
+
+        if np is not None:
+            return {
+                name: np.concatenate(v) if v else np.empty(0)
+                for name, v in cols.items()
+            }
+        return {name: [x for part in v for x in part] for name, v in cols.items()}
+
+    #
+    # Offset index cache
+    #
+    def _index_path(self):
+        return self.filename + INDEX_CACHE_SUFFIX
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), "rb") as fp:
+                data = fp.read()
+        except OSError:
+            return
+
+        # A short or corrupt cache is a miss, the index gets rebuilt
+        try:
+            size, mtime, count = INDEX_CACHE_HEADER.unpack_from(data)
+            if (size, mtime) != self._stat or count != len(self.tables):
+                return
+
+            pos = INDEX_CACHE_HEADER.size
+            indexes = []
+            for t in self.tables:
+                (rows,) = struct.unpack_from("<Q", data, pos)
+                pos += 8
+                offsets = array.array("Q")
+                offsets.frombytes(data[pos : pos + rows * offsets.itemsize])
+                pos += rows * offsets.itemsize
+                if len(offsets) != rows or rows != t.rows:
+                    return
+                indexes.append(offsets)
+        except (struct.error, ValueError):
+            return
+        if pos != len(data):
+            return
+
+        for t, offsets in zip(self.tables, indexes):
+            t._offsets = offsets
+        self._index_loaded = True
+
+    def save_index(self):
+        """Store the offset index of every table next to the file"""
+        with open(self._index_path(), "wb") as fp:
+            fp.write(INDEX_CACHE_HEADER.pack(*self._stat, len(self.tables)))
+            for t in self.tables:
+                fp.write(struct.pack("<Q", len(t.offsets)))
+                fp.write(t.offsets.tobytes())
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming per-day/per-month statistics over the binary history files.
+
+The records are fed in chunks of NumPy columns, every chunk is reduced with a
+handful of vectorized operations and merged into the running per-period
+aggregates, so the whole file is never materialized.
+"""
+
+import datetime
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PERIODS = ("day", "month")
+
+
+def period_keys(t, period):
+    """Map the timestamps to the integer key of their period"""
+    if period == "day":
+        return t // 86400
+    elif period == "month":
+        return t.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    raise ValueError("Unknown period '%s'" % period)
+
+
+def period_label(key, period):
+    if period == "day":
+        return str(np.datetime64(int(key), "D"))
+    return str(np.datetime64(int(key), "M"))
+
+
+def format_time(t):
+    return "{:%Y.%m.%d %H:%M:%S}".format(
+        datetime.datetime.fromtimestamp(t, datetime.timezone.utc)
+    )
+
+
+def as_float(value):
+    return None if value is None else float(value)
+
+
+class HistorySummary:
+    def __init__(self, period="day"):
+        if period not in PERIODS:
+            raise ValueError("Unknown period '%s'" % period)
+        self.period = period
+        self.periods = {}
+        self.count = 0
+        self.first = self.last = None
+        self.maxGap = 0
+        self.maxGapAt = None
+
+    def update(self, time, low, high, volume=None):
+        """Merge a chunk of records into the aggregates"""
+        if not len(time):
+            return
+
+        t = np.asarray(time, dtype=np.int64)
+        low = np.asarray(low, dtype=np.float64)
+        high = np.asarray(high, dtype=np.float64)
+
+        # The gap is accounted to the period holding the record closing it
+        prev = t[0] if self.last is None else self.last
+        gaps = np.diff(t, prepend=prev)
+
+        keys = period_keys(t, self.period)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        ends = np.append(starts[1:], len(t)) - 1
+
+        counts = np.diff(np.append(starts, len(t)))
+        lows = np.minimum.reduceat(low, starts)
+        highs = np.maximum.reduceat(high, starts)
+        maxGaps = np.maximum.reduceat(gaps, starts)
+        if volume is not None:
+            volumes = np.add.reduceat(np.asarray(volume, dtype=np.float64), starts)
+        else:
+            # Unknown rather than zero
+            volumes = [None] * len(starts)
+
+        for i, key in enumerate(keys[starts].tolist()):
+            p = self.periods.get(key)
+            if p is None:
+                self.periods[key] = {
+                    "count": int(counts[i]),
+                    "first": int(t[starts[i]]),
+                    "last": int(t[ends[i]]),
+                    "low": float(lows[i]),
+                    "high": float(highs[i]),
+                    "volume": as_float(volumes[i]),
+                    "maxGap": int(maxGaps[i]),
+                }
+            else:
+                p["count"] += int(counts[i])
+                p["first"] = min(p["first"], int(t[starts[i]]))
+                p["last"] = max(p["last"], int(t[ends[i]]))
+                p["low"] = min(p["low"], float(lows[i]))
+                p["high"] = max(p["high"], float(highs[i]))
+                if p["volume"] is not None and volumes[i] is not None:
+                    p["volume"] += float(volumes[i])
+                p["maxGap"] = max(p["maxGap"], int(maxGaps[i]))
+
+        g = int(np.argmax(gaps))
+        if gaps[g] > self.maxGap:
+            self.maxGap = int(gaps[g])
+            self.maxGapAt = int(t[g])
+
+        self.count += len(t)
+        self.first = int(t[0]) if self.first is None else self.first
+        self.last = int(t[-1])
+
+    def asDict(self):
+        return {
+            "period": self.period,
+            "count": self.count,
+            "first": format_time(self.first) if self.first is not None else None,
+            "last": format_time(self.last) if self.last is not None else None,
+            "maxGap": self.maxGap,
+            "maxGapAt": format_time(self.maxGapAt) if self.maxGapAt else None,
+            "periods": [
+                dict(
+                    p,
+                    period=period_label(key, self.period),
+                    first=format_time(p["first"]),
+                    last=format_time(p["last"]),
+                )
+                for key, p in sorted(self.periods.items())
+            ],
+        }
+
+    def toJson(self):
+        return json.dumps(self.asDict(), indent=2)
+
+    def __str__(self):
+        d = self.asDict()
+        table = "Records: {}, first: {}, last: {}, max gap: {}s at {}\n".format(
+            d["count"], d["first"], d["last"], d["maxGap"], d["maxGapAt"]
+        )
+        table += "{:<10} {:>10} {:<19} {:<19} {:>11} {:>11} {:>14} {:>8}\n".format(
+            "period", "count", "first", "last", "low", "high", "volume", "max gap"
+        )
+        for p in d["periods"]:
+            table += (
+                "{:<10} {:>10d} {:<19} {:<19} {:>11.5f} {:>11.5f} {:>14} {:>8d}\n"
+            ).format(
+                p["period"],
+                p["count"],
+                p["first"],
+                p["last"],
+                p["low"],
+                p["high"],
+                "-" if p["volume"] is None else "{:.2f}".format(p["volume"]),
+                p["maxGap"],
+            )
+        return table[:-1]
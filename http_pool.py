@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP client shared by the downloaders.
+
+urllib opens a new TCP connection for each request, so fetching thousands of
+small files costs a handshake each. HttpPool keeps the idle http.client
+connections of every host and reuses them: a request following another one
+costs about a single round trip. A connection is used by one thread at a
+time, so the pool can be shared by the workers of a download.
+
+Errors are raised as the urllib ones (HTTPError, URLError and
+ContentTooShortError), so callers handle them the same way. The proxies are
+the ones urllib would use (http_proxy, https_proxy and no_proxy).
+"""
+
+import base64
+import gzip
+import http.client
+import threading
+import urllib.parse
+import urllib.request
+from urllib.error import ContentTooShortError, HTTPError, URLError
+
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class HttpPool:
+    def __init__(
+        self, headers=None, timeout=60, maxIdle=8, compress=False, proxies=None
+    ):
+        """
+        headers are sent with every request, compress asks the servers for
+        gzip encoded responses. At most maxIdle connections are kept per host.
+        proxies maps the schemes to proxy URLs, 'no' to the hosts reached
+        directly, as urllib.request.getproxies() does (its default).
+        """
+        self.headers = dict(headers or {})
+        if compress:
+            self.headers["Accept-Encoding"] = "gzip"
+        self.timeout = timeout
+        self.maxIdle = maxIdle
+        self.proxies = urllib.request.getproxies() if proxies is None else proxies
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _proxy(self, scheme, host):
+        """The address and headers of the proxy to the host, None if direct"""
+        proxy = self.proxies.get(scheme)
+        if not proxy:
+            return None
+        hostname = urllib.parse.urlsplit("//" + host).hostname
+        if urllib.request.proxy_bypass_environment(hostname, self.proxies):
+            return None
+
+        parts = urllib.parse.urlsplit(proxy if "://" in proxy else "//" + proxy)
+        headers = {}
+        if parts.username is not None:
+            credentials = "%s:%s" % (
+                urllib.parse.unquote(parts.username),
+                urllib.parse.unquote(parts.password or ""),
+            )
+            headers["Proxy-Authorization"] = "Basic " + base64.b64encode(
+                credentials.encode("utf-8")
+            ).decode("ascii")
+        return (parts.netloc.rpartition("@")[2], headers)
+
+    def _connect(self, key):
+        """An idle connection to the host if there's one, and whether it is"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return (idle.pop(), True)
+
+        scheme, host = key
+        proxy = self._proxy(scheme, host)
+        if proxy is not None:
+            address, headers = proxy
+            if scheme == "https":
+                # Tunneled through the proxy with CONNECT
+                conn = http.client.HTTPSConnection(address, timeout=self.timeout)
+                conn.set_tunnel(host, headers=headers)
+                return (conn, False)
+            return (http.client.HTTPConnection(address, timeout=self.timeout), False)
+
+        if scheme == "https":
+            return (http.client.HTTPSConnection(host, timeout=self.timeout), False)
+        return (http.client.HTTPConnection(host, timeout=self.timeout), False)
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxIdle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _fetch(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        proxy = self._proxy(*key) if parts.scheme == "http" else None
+        if proxy is not None:
+            # Plain HTTP proxies are sent the whole URL
+            path = "http://%s%s" % (parts.netloc, path)
+            headers = dict(headers, **proxy[1])
+
+        while True:
+            conn, reused = self._connect(key)
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except http.client.IncompleteRead as e:
+                conn.close()
+                raise ContentTooShortError(
+                    "retrieval incomplete: got only %d out of %d bytes"
+                    % (len(e.partial), len(e.partial) + e.expected),
+                    e.partial,
+                )
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # The server may have closed an idle connection meanwhile
+                if not reused:
+                    raise URLError(e)
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return (response, body)
+
+    def get(self, url, headers=None):
+        """The body of the resource at url, following redirections"""
+        allHeaders = dict(self.headers)
+        allHeaders.update(headers or {})
+
+        for _ in range(10):
+            response, body = self._fetch(url, allHeaders)
+            location = response.getheader("Location")
+            if response.status not in REDIRECTS or location is None:
+                break
+            url = urllib.parse.urljoin(url, location)
+
+        if response.status >= 300:
+            raise HTTPError(url, response.status, response.reason, response.msg, None)
+
+        if response.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def retrieve(self, url, filename, headers=None):
+        """Save the resource at url into filename, the file being only
+        created once the whole resource is received"""
+        body = self.get(url, headers)
+        with open(filename, "wb") as fp:
+            fp.write(body)
+        return len(body)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Inventory of the history and tester files found under a MetaTrader data
+directory.
+
+Only the headers and the first and last records of every file are read, the
+record counts following from the fixed record sizes. The files are described
+in a thread pool and the results can be cached in a JSON file, where they're
+refreshed only for the files whose size or mtime changed.
+"""
+
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from bstruct_defs import FxtHeader, HstHeader, SymbolSel, SymbolsRaw
+from hcc_reader import HccReader
+
+# Size of the records by HST version
+HST_RECORD_SIZES = {400: 44, 401: 60}
+FXT_RECORD_SIZE = 56
+
+COLUMNS = (
+    "path",
+    "type",
+    "symbol",
+    "timeframe",
+    "model",
+    "version",
+    "records",
+    "first",
+    "last",
+)
+
+_time = struct.Struct("<i")
+
+
+def _boundary_times(fp, start, size, count):
+    # Time of the first and last records, stored first in both HST and FXT
+    if not count:
+        return (None, None)
+    times = []
+    for off in (start, start + (count - 1) * size):
+        fp.seek(off)
+        times.append(_time.unpack(fp.read(_time.size))[0])
+    return tuple(times)
+
+
+def describe_hst(path, fp, size):
+    header = HstHeader(fp.read(HstHeader._size))
+    if header.version not in HST_RECORD_SIZES:
+        raise ValueError("Unsupported HST version %d" % header.version)
+    recordSize = HST_RECORD_SIZES[header.version]
+    count = (size - HstHeader._size) // recordSize
+    first, last = _boundary_times(fp, HstHeader._size, recordSize, count)
+    return dict(
+        type="hst",
+        symbol=header.symbol.decode("utf-8", "replace").rstrip("\0"),
+        timeframe=header.period,
+        version=header.version,
+        records=count,
+        first=first,
+        last=last,
+    )
+
+
+def describe_fxt(path, fp, size):
+    header = FxtHeader(fp.read(FxtHeader._size))
+    count = (size - FxtHeader._size) // FXT_RECORD_SIZE
+    first, last = _boundary_times(fp, FxtHeader._size, FXT_RECORD_SIZE, count)
+    return dict(
+        type="fxt",
+        symbol=header.symbol.decode("utf-8", "replace").rstrip("\0"),
+        timeframe=header.timeframe,
+        model=header.modelType,
+        version=header.headerVersion,
+        records=count,
+        first=first,
+        last=last,
+    )
+
+
+def describe_hcc(path, fp, size):
+    with HccReader(path) as hcc:
+        extents = [t.extent() for t in hcc.tables if t.rows]
+        return dict(
+            type="hcc",
+            # The caches are stored in a directory named after the symbol
+            symbol=os.path.basename(os.path.dirname(os.path.abspath(path))),
+            version=hcc.header.magic,
+            records=len(hcc),
+            first=min((e[2] for e in extents), default=None),
+            last=max((e[3] for e in extents), default=None),
+        )
+
+
+def describe_sel(path, fp, size):
+    # There's a 4-byte magic preceding the data
+    (version,) = struct.unpack("<I", fp.read(4))
+    return dict(type="sel", version=version, records=(size - 4) // SymbolSel._size)
+
+
+def describe_symbols(path, fp, size):
+    return dict(type="symbolsraw", records=size // SymbolsRaw._size)
+
+
+def describer(path):
+    """Function describing the file, None when it's not inventoried"""
+    name = os.path.basename(path).lower()
+    if name == "symbols.raw":
+        return describe_symbols
+    return {
+        ".hst": describe_hst,
+        ".fxt": describe_fxt,
+        ".hcc": describe_hcc,
+        ".sel": describe_sel,
+    }.get(os.path.splitext(name)[1])
+
+
+def describe(path):
+    """Inventory entry of a single file"""
+    entry = dict.fromkeys(COLUMNS)
+    entry["path"] = path
+    try:
+        with open(path, "rb") as fp:
+            size = os.fstat(fp.fileno()).st_size
+            entry.update(describer(path)(path, fp, size))
+    except (OSError, ValueError, struct.error) as e:
+        entry["error"] = str(e)
+    return entry
+
+
+def find_files(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if describer(path) is not None:
+                yield path
+
+
+def load_cache(cacheFile):
+    try:
+        with open(cacheFile, "r") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cacheFile, cache):
+    tmp = cacheFile + ".tmp"
+    with open(tmp, "w") as fp:
+        json.dump(cache, fp)
+    os.replace(tmp, cacheFile)
+
+
+def scan(root, cacheFile=None, jobs=None):
+    """
+    Inventory of the files found under root, sorted by path. Only the files
+    missing from the cache, or changed since, are read.
+    """
+    cache = load_cache(cacheFile) if cacheFile else {}
+    fresh = {}
+    todo = []
+
+    for path in find_files(root):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stamp = [st.st_size, st.st_mtime]
+        cached = cache.get(path)
+        if cached is not None and cached["stamp"] == stamp:
+            fresh[path] = cached
+        else:
+            todo.append((path, stamp))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        entries = pool.map(describe, [path for (path, _) in todo])
+        for (path, stamp), entry in zip(todo, entries):
+            fresh[path] = dict(stamp=stamp, entry=entry)
+
+    if cacheFile:
+        # Keep the entries of the other scanned directories
+        prefix = os.path.join(root, "")
+        cache = {p: v for (p, v) in cache.items() if not p.startswith(prefix)}
+        cache.update(fresh)
+        save_cache(cacheFile, cache)
+
+    return [fresh[path]["entry"] for path in sorted(fresh)]
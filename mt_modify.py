@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
+import json
+import mmap
+import os
+import shutil
 import sys
 import struct
+import tempfile
 from copy import copy
 
 from bstruct import BStruct
-from bstruct_defs import SymbolsRaw
+from bstruct_defs import FxtHeader, SymbolSel, SymbolsRaw, Symgroups
+
 
 #
 # Exceptions for internal use
@@ -47,7 +53,7 @@ def modify_field(ss, field_name, value):
             break
 
     if fmts is None:
-        raise NoSuchField()
+        raise NoSuchField(field_name)
 
     # Try to perform the correct cast.
     if fmts[-1] == "c":
@@ -70,67 +76,506 @@ def modify_field(ss, field_name, value):
     setattr(ss, field_name, value)
 
 
-def parse_file(name, strucc):
-    try:
-        fp = open(name, "rb")
-    except OSError as e:
-        print("Cannot open file '{}' for reading".format(name))
-        sys.exit(1)
+class RecordFile:
+    """
+    The fixed-size records of a file described by a bundle, edited in place
+    in buf: either a writable mmap of the file or a bytearray holding its
+    content. Records are added and removed by shifting the following ones
+    with a single move, keeping them sorted when the bundle needs it.
+    Files with a fixed number of records (bundle.count) can only be modified.
+    fp is the file mapped by buf, resized with ftruncate and mapped again
+    (buf becoming an empty bytearray when no data is left, as an mmap can't
+    be empty).
+    """
 
-    content = []
+    def __init__(self, buf, bundle, fp=None):
+        self.buf = buf
+        self.fp = fp
+        self.bundle = bundle
+        self.strucc = bundle.strucc
+        self.size = bundle.strucc._size
+        self.base = bundle.header_size
+
+        # Position and length of the key fields in a record
+        field = getattr(self.strucc, bundle.name_field)
+        self._name = (field.offset, field.struct.size)
+        field = getattr(self.strucc, bundle.sort_field)
+        self._sort = (field.offset, field.struct.size)
+
+    def __len__(self):
+        count = (len(self.buf) - self.base) // self.size
+        if self.bundle.count is not None:
+            count = min(count, self.bundle.count)
+        return count
+
+    def pos(self, i):
+        return self.base + i * self.size
+
+    def raw(self, i):
+        return bytes(self.buf[self.pos(i) : self.pos(i) + self.size])
+
+    def _field(self, i, key):
+        off, n = key
+        start = self.pos(i) + off
+        return bytes(self.buf[start : start + n])
+
+    def name_at(self, i):
+        return self._field(i, self._name).decode("utf-8").rstrip("\0")
+
+    def sort_key(self, raw):
+        off, n = self._sort
+        return raw[off : off + n]
+
+    def record(self, i):
+        """The i-th record, writing its fields straight into the buffer"""
+        return self.strucc.bind(self.buf, self.pos(i))
+
+    def is_sorted(self):
+        keys = [self._field(i, self._sort) for i in range(len(self))]
+        return all(a <= b for (a, b) in zip(keys, keys[1:]))
+
+    def sort(self):
+        """Sort all the records, rewriting them"""
+        records = sorted((self.raw(i) for i in range(len(self))), key=self.sort_key)
+        self.buf[self.base : self.pos(len(records))] = b"".join(records)
+
+    def _bisect(self, key, lo=0, hi=None):
+        # Position of the first record whose sort key isn't lower than key
+        hi = len(self) if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._field(mid, self._sort) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name):
+        """Index of the record with the given name, None if there's none"""
+        bundle = self.bundle
+        if bundle.need_sort and bundle.sort_field == bundle.name_field:
+            key = name.encode("utf-8").ljust(self._name[1], b"\0")
+            i = self._bisect(key)
+            if i < len(self) and self.name_at(i) == name:
+                return i
+
+        for i in range(len(self)):
+            if self.name_at(i) == name:
+                return i
+
+        return None
+
+    def _resize(self, size):
+        if isinstance(self.buf, mmap.mmap):
+            if self.fp is None:
+                self.buf.resize(size)
+                return
+            # mmap.resize needs mremap, missing on macOS: the file is resized
+            # first, leaving the mapping intact if that fails, then mapped
+            # again (an mmap can't be empty)
+            self.buf.flush()
+            os.ftruncate(self.fp.fileno(), size)
+            self.buf.close()
+            self.buf = mmap.mmap(self.fp.fileno(), 0) if size else bytearray()
+        elif size < len(self.buf):
+            del self.buf[size:]
+        else:
+            self.buf.extend(bytes(size - len(self.buf)))
 
-    while True:
-        buf = fp.read(strucc._size)
+    def _move(self, dest, src, count):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.move(dest, src, count)
+        else:
+            self.buf[dest : dest + count] = self.buf[src : src + count]
+
+    def insert(self, raw):
+        """Add the record, at its sorted position if needed, and return its index"""
+        check_resizable(self.bundle)
+        count = len(self)
+        i = self._bisect(self.sort_key(raw)) if self.bundle.need_sort else count
+
+        end = self.pos(count)
+        self._resize(end + self.size)
+        self._move(self.pos(i + 1), self.pos(i), end - self.pos(i))
+        self.buf[self.pos(i) : self.pos(i + 1)] = raw
+        return i
+
+    def delete(self, i):
+        check_resizable(self.bundle)
+        end = self.pos(len(self))
+        raw = self.raw(i)
+        self._move(self.pos(i), self.pos(i + 1), end - self.pos(i + 1))
+        try:
+            self._resize(end - self.size)
+        except BaseException:
+            # Put the record back rather than leaving the last one twice
+            self._move(self.pos(i + 1), self.pos(i), end - self.pos(i + 1))
+            self.buf[self.pos(i) : self.pos(i + 1)] = raw
+            raise
+
+    def reposition(self, i):
+        """Move the i-th record to its sorted position, after its key changed"""
+        if not self.bundle.need_sort:
+            return i
+
+        raw = self.raw(i)
+        key = self.sort_key(raw)
+        # Search among the other records
+        if i > 0 and key < self._field(i - 1, self._sort):
+            j = self._bisect(key, 0, i)
+            self._move(self.pos(j + 1), self.pos(j), self.pos(i) - self.pos(j))
+        elif i + 1 < len(self) and self._field(i + 1, self._sort) < key:
+            j = self._bisect(key, i + 1) - 1
+            self._move(self.pos(i), self.pos(i + 1), self.pos(j) - self.pos(i))
+        else:
+            return i
 
-        if len(buf) != strucc._size:
-            break
+        self.buf[self.pos(j) : self.pos(j + 1)] = raw
+        return j
 
-        content.append(strucc(buf))
 
-    fp.close()
+def check_resizable(bundle):
+    if bundle.count is not None:
+        raise InvalidArgument(
+            "Records cannot be added to or deleted from {} files".format(bundle.name)
+        )
 
-    return content
 
+def modify_record(record, changes):
+    """
+    Apply the 'name=value' changes to the record, all of them or none: the
+    values are validated on a copy and only the changed fields are written.
+    """
+    new = copy(record)
+    names = []
 
-def write_file(name, content):
-    try:
-        fp = open(name, "wb")
-    except OSError as e:
-        print("Cannot open file '{}' for writing".format(name))
-        sys.exit(1)
+    for opt in changes:
+        # Options are in the 'name=value' format
+        val = opt.split("=", 1)
 
-    for r in content:
-        fp.write(r.repack())
+        val_name = val[0].strip()
+        val_value = val[1].strip()
 
-    fp.close()
+        modify_field(new, val_name, val_value)
+        names.append(val_name)
 
+    for name in names:
+        setattr(record, name, getattr(new, name))
 
-def find_in_content(content, field_name, value):
-    struct_type = type(content[0])
 
-    # Make sure the field exists and is a string
-    ex = [x[0] for x in struct_type._fields if x[0] == field_name and x[1][-1] == "s"]
+def changes_of(modify):
+    """The changes of an edit script, as a list of 'name=value' strings"""
+    if isinstance(modify, dict):
+        return ["{}={}".format(name, value) for (name, value) in modify.items()]
+    return list(modify)
 
-    if len(ex) == 0:
-        # The field isn't available in this BStruct
-        raise InvalidArgument(field_name)
 
-    for r in content:
-        v = getattr(r, ex[0])
-        # Sanitize the value before checking the value
-        if v.decode("utf-8").rstrip("\0") == value:
-            return r
+class RecordIndex:
+    """
+    All the records of a file held in memory with a name->position index
+    built once, so that many operations can be applied before writing the
+    file back in one go
+    """
+
+    def __init__(self, data, bundle):
+        self.bundle = bundle
+        self.strucc = bundle.strucc
+        self.header = bytes(data[: bundle.header_size])
+
+        size = self.strucc._size
+        self.records = [
+            bytearray(data[off : off + size])
+            for off in range(bundle.header_size, len(data) - size + 1, size)
+        ]
+        if bundle.count is not None:
+            del self.records[bundle.count :]
+        # Data following the records, kept as is
+        self.trailer = bytes(data[bundle.header_size + len(self.records) * size :])
+
+        self.index = {}
+        for i, rec in enumerate(self.records):
+            self.index.setdefault(self.name_of(rec), i)
+
+    def name_of(self, rec):
+        field = getattr(self.strucc, self.bundle.name_field)
+        return field.decode(rec, 0).decode("utf-8").rstrip("\0")
+
+    def apply(self, op):
+        """
+        Apply a single operation of an edit script: the record named by 'key'
+        gets either cloned under the 'add' name, deleted with 'delete' or
+        just modified. The 'modify' changes (a list of 'name=value' strings
+        or a dict) apply to the new record when adding one. The key can be
+        left out when the file holds a single record.
+        """
+        key = op.get("key")
+        if key is None and len(self.records) == 1:
+            # A single record needs no key
+            key = self.name_of(self.records[0])
+        i = self.index.get(key)
+        if i is None:
+            raise InvalidArgument("Could not find the key group '{}'".format(key))
+
+        if op.get("delete"):
+            check_resizable(self.bundle)
+            self.records[i] = None
+            del self.index[key]
+            return
+
+        changes = changes_of(op.get("modify", []))
+        if "add" in op:
+            check_resizable(self.bundle)
+            changes.insert(0, "{}={}".format(self.bundle.name_field, op["add"]))
+        elif not changes:
+            raise InvalidArgument("Nothing to do with '{}'".format(key))
+
+        # Work on a copy, left out if anything is wrong
+        new = bytearray(self.records[i])
+        modify_record(self.strucc.bind(new), changes)
+
+        name = self.name_of(new)
+        if (name != key or "add" in op) and name in self.index:
+            raise InvalidArgument(
+                "The symbol {} is already in the file, cannot overwrite it".format(name)
+            )
+
+        if "add" in op:
+            self.records.append(new)
+            self.index[name] = len(self.records) - 1
+        else:
+            self.records[i] = new
+            if name != key:
+                del self.index[key]
+                self.index[name] = i
+
+    def serialize(self):
+        records = [rec for rec in self.records if rec is not None]
+        if self.bundle.need_sort:
+            field = getattr(self.strucc, self.bundle.sort_field)
+            off, n = field.offset, field.struct.size
+            records.sort(key=lambda rec: rec[off : off + n])
+        return self.header + b"".join(records) + self.trailer
+
+
+def load_script(source):
+    """Operations of a JSON edit script, read from stdin when source is '-'"""
+    if source == "-":
+        ops = json.load(sys.stdin)
+    else:
+        with open(source, "r") as fp:
+            ops = json.load(fp)
+    return [ops] if isinstance(ops, dict) else ops
+
 
-    raise InvalidArgument(value)
+def write_atomically(name, data):
+    """Replace the file with data, never leaving it half written"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(name)))
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        shutil.copymode(name, tmp)
+        os.replace(tmp, name)
+    except BaseException:
+        os.remove(tmp)
+        raise
 
 
 #
 # Filetype specific options
 #
 class SymbolsRawBundle:
+    name = "symbols.raw"
+    strucc = SymbolsRaw
+    header_size = 0
     name_field = "name"
     sort_field = "name"
     need_sort = True
+    count = None
+
+
+class SymbolSelBundle:
+    name = "symbols.sel"
+    strucc = SymbolSel
+    # There's a 4-byte magic preceding the data
+    header_size = 4
+    name_field = "symbol"
+    sort_field = "symbol"
+    need_sort = False
+    count = None
+
+
+class SymgroupsBundle:
+    name = "symgroups.raw"
+    strucc = Symgroups
+    header_size = 0
+    name_field = "name"
+    sort_field = "name"
+    # The symbols refer to their group by its position
+    need_sort = False
+    count = None
+
+
+class FxtHeaderBundle:
+    name = "FXT"
+    strucc = FxtHeader
+    header_size = 0
+    name_field = "symbol"
+    sort_field = "symbol"
+    need_sort = False
+    # The header is followed by the ticks, left untouched
+    count = 1
+
+
+BUNDLES = {
+    "symbolsraw": SymbolsRawBundle,
+    "sel": SymbolSelBundle,
+    "symgroups": SymgroupsBundle,
+    "fxt-header": FxtHeaderBundle,
+}
+
+
+def apply_in_place(records, op):
+    """
+    Apply a single operation of an edit script to a RecordFile, modifying
+    the record named by 'key' in place: for the files with a fixed number of
+    records, which can't be added to or deleted from
+    """
+    key = op.get("key")
+    if key is None and len(records) == 1:
+        # A single record needs no key
+        i = 0
+    else:
+        i = records.find(key)
+    if i is None:
+        raise InvalidArgument("Could not find the key group '{}'".format(key))
+
+    if op.get("delete") or "add" in op:
+        check_resizable(records.bundle)
+
+    changes = changes_of(op.get("modify", []))
+    if not changes:
+        raise InvalidArgument("Nothing to do with '{}'".format(key))
+    modify_record(records.record(i), changes)
+
+
+def run_script(filename, bundle, ops):
+    """
+    Apply the edit script to the file, written back only on success. The
+    files with a fixed number of records (e.g. the header of an FXT) are
+    modified in place, leaving the data following the records untouched.
+    """
+    if bundle.count is not None:
+        try:
+            fp = open(filename, "r+b")
+            buf = mmap.mmap(fp.fileno(), 0)
+        except (OSError, ValueError) as e:
+            print("Cannot open file '{}' for writing".format(filename))
+            sys.exit(1)
+        records = RecordFile(buf, bundle, fp)
+        # Restored if an operation fails
+        saved = buf[: records.pos(len(records))]
+        apply = lambda op: apply_in_place(records, op)
+    else:
+        try:
+            with open(filename, "rb") as fp:
+                records = RecordIndex(fp.read(), bundle)
+        except OSError as e:
+            print("Cannot open file '{}' for reading".format(filename))
+            sys.exit(1)
+        apply = records.apply
+
+    error = None
+    for n, op in enumerate(ops, 1):
+        try:
+            apply(op)
+        except NoSuchField as e:
+            error = "{}: operation {}: no such field '{}'".format(filename, n, e)
+        except (InvalidArgument, InvalidDataFormat, ValueError) as e:
+            error = "{}: operation {}: {}".format(filename, n, e)
+        if error is not None:
+            break
+
+    if bundle.count is not None:
+        if error is not None:
+            buf[: len(saved)] = saved
+        buf.flush()
+        buf.close()
+        fp.close()
+    elif error is None:
+        try:
+            write_atomically(filename, records.serialize())
+        except OSError as e:
+            print("Cannot open file '{}' for writing".format(filename))
+            sys.exit(1)
+
+    if error is not None:
+        print(error)
+        sys.exit(1)
+
+
+def run_options(filename, bundle, args):
+    """Apply the -a, -m or -d option to the file, in place"""
+    try:
+        fp = open(filename, "r+b")
+        buf = mmap.mmap(fp.fileno(), 0)
+    except (OSError, ValueError) as e:
+        print("Cannot open file '{}' for writing".format(filename))
+        sys.exit(1)
+
+    records = RecordFile(buf, bundle, fp)
+
+    # The records are kept sorted from now on
+    if bundle.need_sort and not records.is_sorted():
+        records.sort()
+
+    # Find the key group first, a single record needs none
+    if args.keyGroup is None:
+        key_index = 0 if len(records) == 1 else None
+    else:
+        key_index = records.find(args.keyGroup)
+    if key_index is None:
+        print("Could not find the -k group '{}' in {}".format(args.keyGroup, filename))
+        sys.exit(1)
+    key_group = records.record(key_index)
+
+    try:
+        if not args.doAdd is None:
+            # We can't have two symbols with the same name
+            if records.find(args.doAdd) is not None:
+                print(
+                    "The symbol {} is already in the file, cannot overwrite it".format(
+                        args.doAdd
+                    )
+                )
+                sys.exit(1)
+
+            # Clone the old object and modify its name
+            new_group = copy(key_group)
+            modify_field(new_group, bundle.name_field, args.doAdd)
+            records.insert(new_group.repack())
+        elif not args.doModify is None:
+            # Perform the modification in place
+            modify_record(key_group, args.doModify)
+            records.reposition(key_index)
+        elif args.doDelete:
+            records.delete(key_index)
+    except NoSuchField as e:
+        print("No such field '{}'".format(e))
+        sys.exit(1)
+    except (InvalidArgument, InvalidDataFormat, ValueError) as e:
+        print("Invalid modification: {}".format(e))
+        sys.exit(1)
+    except OSError as e:
+        print("Cannot resize file '{}': {}".format(filename, e.strerror))
+        sys.exit(1)
+
+    # The file may have been emptied, leaving no mapping
+    if isinstance(records.buf, mmap.mmap):
+        records.buf.flush()
+        records.buf.close()
+    fp.close()
 
 
 if __name__ == "__main__":
@@ -140,8 +585,9 @@ class SymbolsRawBundle:
         "-i",
         "--input-file",
         action="store",
-        dest="inputFile",
-        help="input file",
+        nargs="+",
+        dest="inputFiles",
+        help="input file(s), all edited the same way",
         required=True,
     )
     argumentParser.add_argument(
@@ -150,6 +596,7 @@ class SymbolsRawBundle:
         action="store",
         dest="inputType",
         help="input type",
+        choices=BUNDLES,
         required=True,
     )
     argumentParser.add_argument(
@@ -158,7 +605,6 @@ class SymbolsRawBundle:
         action="store",
         dest="keyGroup",
         help="group key",
-        required=True,
     )
     argumentParser.add_argument(
         "-d",
@@ -182,57 +628,36 @@ class SymbolsRawBundle:
         dest="doModify",
         help="Modify the record data",
     )
+    argumentParser.add_argument(
+        "-s",
+        "--script",
+        action="store",
+        dest="script",
+        help="Apply the operations of a JSON edit script ('-' for stdin)",
+    )
     argumentParser.add_argument(
         "-h", "--help", action="help", help="Show this help message and exit"
     )
     args = argumentParser.parse_args()
 
-    if args.inputType != "symbolsraw":
-        print("Invalid input type")
-        sys.exit(1)
-
     # A bundle keeps track of various options that are filetype-specific
-    bundle = SymbolsRawBundle
+    bundle = BUNDLES[args.inputType]
 
-    cont = parse_file(args.inputFile, SymbolsRaw)
+    if args.keyGroup is None and args.script is None and bundle.count != 1:
+        argumentParser.error("either -k or --script is required")
 
-    # Find the key group first
-    try:
-        key_group = find_in_content(cont, bundle.name_field, args.keyGroup)
-    except InvalidArgument as e:
-        print("Could not find the -k group '{}'".format(args.keyGroup))
-        sys.exit(1)
-
-    if not args.doAdd is None:
-        # We can't have two symbols with the same name
+    if args.script is not None:
         try:
-            is_present = find_in_content(cont, bundle.name_field, args.doAdd)
-        except InvalidArgument as e:
-            pass
-        else:
-            print("The symbol {} is already in the file, cannot overwrite it".format(e))
+            ops = load_script(args.script)
+        except OSError as e:
+            print("Cannot open file '{}' for reading".format(e.filename))
+            sys.exit(1)
+        except ValueError as e:
+            print("Invalid edit script: {}".format(e))
             sys.exit(1)
 
-        # Clone the old object and modify its name
-        new_group = copy(key_group)
-        modify_field(new_group, bundle.name_field, args.doAdd)
-        cont.append(new_group)
-    elif not args.doModify is None:
-        for opt in args.doModify:
-            # Options are in the 'name=value' format
-            val = opt.split("=")
-
-            val_name = val[0].strip()
-            val_value = val[1].strip()
-
-            # Perform the modification in place
-            modify_field(key_group, val_name, val_value)
-    elif not args.doDelete is None:
-        cont.remove(key_group)
-
-    # Sort the file content if needed
-    if bundle.need_sort:
-        cont.sort(key=lambda x: getattr(x, bundle.sort_field))
-
-    # Serialize the file
-    write_file(args.inputFile, cont)
+        for filename in args.inputFiles:
+            run_script(filename, bundle, ops)
+    else:
+        for filename in args.inputFiles:
+            run_options(filename, bundle, args)
@@ -1,64 +1,179 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
+import calendar
+import csv
+import json
+import mmap
+import os
+import struct
 import sys
+import time
 
 from bstruct_defs import *
+from csv_format import TimestampFormatter
+from hcc_reader import HccReader
+import inventory
+
+# Number of records read and decoded at once
+CHUNK_RECORDS = 4096
+
+# Offset of the first record and structure of the fixed-size records
+RECORD_TYPES = {
+    # There's a 4-byte magic preceding the data
+    "sel": (4, SymbolSel),
+    "ticksraw": (0, TicksRaw),
+    "symbolsraw": (0, SymbolsRaw),
+    "symgroups": (0, Symgroups),
+    "fxt-header": (0, FxtHeader),
+    "fxt": (FxtHeader._size, FxtRecord),
+    "hst": (HstHeader._size, HstRecord),
+    "hst509": (HstHeader._size, Hst509Record),
+}
+
+# Field the records of these types are sorted by
+TIME_FIELDS = {
+    "ticksraw": "time",
+    "fxt": "barTime",
+    "hst": "time",
+    "hst509": "time",
+}
+
+TIME_FORMATS = (
+    "%Y.%m.%d %H:%M:%S",
+    "%Y.%m.%d %H:%M",
+    "%Y.%m.%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+)
 
 
 def dump_hcc_content(filename):
     try:
         fp = open(filename, "rb")
+        buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
     except OSError as e:
         print(
             "[ERROR] '%s' raised when tried to read the file '%s'"
             % (e.strerror, filename)
         )
         sys.exit(1)
+    except ValueError as e:
+        # An empty file can't be mapped
+        print("[ERROR] '%s' raised when tried to read the file '%s'" % (e, filename))
+        sys.exit(1)
 
-    buf = fp.read(HccHeader._size)
     obj = HccHeader(buf)
 
     assert obj.magic == 501
 
     print(obj)
 
-    while True:
-        buf = fp.read(HccTable._size)
-        obj = HccTable(buf)
-
-        # Quite crude, but seems to work
-        if obj.off == obj.size == 0:
-            break
-
-        print(obj)
-
-        was = fp.tell()
-        fp.seek(obj.off)
+    for table in obj.tables:
+        print(table)
 
-        buf = fp.read(HccRecordHeader._size)
-        obj = HccRecordHeader(buf)
+        obj = table.header
 
         assert obj.magic == 0x81
 
         print(obj)
 
-        for i in range(obj.rows):
-            buf = fp.read(HccRecord._size)
-            obj = HccRecord(buf)
+        # The records are walked one by one, checking their separator and
+        # skipping their trailing bytes
+        for rec in HccRecordHeader.records.iter(obj):
+            print(rec)
 
-            assert obj.separator & 0x00088884 == 0x00088884
 
-            print(obj)
+def index_hcc_content(filename, fmt="text"):
+    """
+    Print the table of contents of a HCC file: label, row count, byte range
+    and time span of every table. Only the headers and the boundary records
+    are read.
+    """
+    columns = ["table", "label", "rows", "start", "end", "first", "last"]
+    formatTime = TimestampFormatter()
+    rows = []
+    try:
+        with HccReader(filename) as hcc:
+            for i, table in enumerate(hcc):
+                start, end, first, last = table.extent()
+                rows.append([i, table.label, table.rows, start, end, first, last])
+    except OSError as e:
+        print(
+            "[ERROR] '%s' raised when tried to read the file '%s'"
+            % (e.strerror, filename)
+        )
+        sys.exit(1)
+    except (ValueError, struct.error) as e:
+        # Empty, truncated or not a HCC file
+        print("[ERROR] '%s' raised when tried to read the file '%s'" % (e, filename))
+        sys.exit(1)
 
-            # Skip the eventual trailing bytes
-            extra1 = (obj.separator >> 28) & 15
-            extra2 = (obj.separator >> 24) & 15
-            extra3 = (obj.separator >> 20) & 15
+    if fmt == "ndjson":
+        for row in rows:
+            print(json.dumps(dict(zip(columns, row))))
+    elif fmt == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        print(
+            "{:>5}  {:<16} {:>10}  {:>21}  {:<19}  {:<19}".format(
+                "table", "label", "rows", "bytes", "first", "last"
+            )
+        )
+        for i, label, count, start, end, first, last in rows:
+            print(
+                "{:>5}  {:<16} {:>10}  0x{:08x}-0x{:08x}  {:<19}  {:<19}".format(
+                    i,
+                    label,
+                    count,
+                    start,
+                    end,
+                    "" if first is None else formatTime(first),
+                    "" if last is None else formatTime(last),
+                )
+            )
+
+
+def dump_inventory(root, fmt="text", cacheFile=None, jobs=None):
+    """Print the inventory of the history and tester files found under root"""
+    if not os.path.isdir(root):
+        print("[ERROR] '%s' isn't a directory" % root)
+        sys.exit(1)
 
-            fp.seek(extra1 + extra2 + extra3, 1)
+    entries = inventory.scan(root, cacheFile, jobs)
 
-        fp.seek(was)
+    if fmt == "ndjson":
+        for entry in entries:
+            print(json.dumps(entry))
+    elif fmt == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(inventory.COLUMNS)
+        writer.writerows(
+            [entry[name] for name in inventory.COLUMNS] for entry in entries
+        )
+    else:
+        formatTime = TimestampFormatter()
+        for entry in entries:
+            if "error" in entry:
+                print("{}: [ERROR] {}".format(entry["path"], entry["error"]))
+                continue
+            print(
+                "{}: {} {} {} {} {} {} records {} - {}".format(
+                    entry["path"],
+                    entry["type"],
+                    entry["symbol"] or "-",
+                    "-" if entry["timeframe"] is None else "M%d" % entry["timeframe"],
+                    "-" if entry["model"] is None else "model %d" % entry["model"],
+                    "-" if entry["version"] is None else "v%d" % entry["version"],
+                    entry["records"],
+                    "-" if entry["first"] is None else formatTime(entry["first"]),
+                    "-" if entry["last"] is None else formatTime(entry["last"]),
+                )
+            )
 
 
 def dump_srv_content(filename):
@@ -86,10 +201,166 @@ def dump_srv_content(filename):
         print(obj)
 
 
-def dump_content(filename, offset, strucc):
+def parse_where(conditions):
+    """Parse the field=value conditions, the values being numbers if possible"""
+    where = []
+    for cond in conditions:
+        name, sep, value = cond.partition("=")
+        if not sep:
+            raise ValueError("Invalid condition '{}'".format(cond))
+        for conv in (int, float):
+            try:
+                value = conv(value)
+                break
+            except ValueError:
+                pass
+        where.append((name, value))
+    return where
+
+
+class RecordWriter:
+    """
+    Write the records held by blocks of raw data as text, NDJSON or CSV
+    lines, keeping those matching the (field, value) conditions of where
+    """
+
+    def __init__(self, strucc, out, fmt="text", fields=None, where=()):
+        self.strucc = strucc
+        self.out = out
+        self.fields = list(fields or strucc._names)
+        self.where = list(where)
+        # Raise early on unknown fields
+        strucc._select(self.fields + [name for (name, _) in self.where])
+
+        if fmt == "csv":
+            self.csv = csv.writer(out, lineterminator="\n")
+            self.csv.writerow(self.fields)
+            self.write_rows = self.csv.writerows
+        elif fmt == "ndjson":
+            self.write_rows = self.write_ndjson
+        else:
+            self.write = self.write_text
+
+    def write(self, buf):
+        # The conditions are checked on extra columns following the output
+        n = len(self.fields)
+        rows = self.strucc.iter_plain(
+            buf, self.fields + [name for (name, _) in self.where]
+        )
+        if self.where:
+            values = [value for (_, value) in self.where]
+            rows = (row[:n] for row in rows if row[n:] == values)
+        self.write_rows(rows)
+
+    def write_ndjson(self, rows):
+        dumps = json.dumps
+        fields = self.fields
+        self.out.write("".join(dumps(dict(zip(fields, row))) + "\n" for row in rows))
+
+    def write_text(self, buf):
+        strucc = self.strucc
+        size = strucc._size
+        # Only decode the selected fields
+        lazy = len(self.fields) < len(strucc._names)
+        fields = self.fields if lazy else None
+        records = (strucc(buf, off, lazy) for off in range(0, len(buf), size))
+
+        if self.where:
+            names = [name for (name, _) in self.where]
+            values = [value for (_, value) in self.where]
+            records = (
+                obj for obj in records if list(obj.to_dict(names).values()) == values
+            )
+
+        self.out.write("".join(obj.format_fields(fields) + "\n" for obj in records))
+
+
+def read_blocks(fp, size, count=None):
+    """
+    Read whole records of the given size from fp, in large blocks, up to
+    count records when given
+    """
+    while count is None or count > 0:
+        n = CHUNK_RECORDS if count is None else min(count, CHUNK_RECORDS)
+        buf = fp.read(size * n)
+        end = len(buf) - len(buf) % size
+        if end:
+            yield memoryview(buf)[:end]
+        if len(buf) < size * n:
+            break
+        if count is not None:
+            count -= n
+
+
+def parse_time(text):
+    """Unix timestamp (UTC) given as a number or as a date and time"""
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    for fmt in TIME_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(text, fmt))
+        except ValueError:
+            pass
+    raise ValueError("Invalid time '{}'".format(text))
+
+
+def bisect_time(buf, offset, strucc, field, timestamp):
+    """
+    Index of the first record of buf whose field isn't lower than timestamp,
+    found by a binary search decoding nothing but that field
+    """
+    size = strucc._size
+    decode = getattr(strucc, field).decode
+    lo, hi = 0, (len(buf) - offset) // size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if decode(buf, offset + mid * size) < timestamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def select_records(filename, offset, strucc, index=None, span=None, at=None):
+    """
+    Range [start, stop) of the records selected by their index, by a slice
+    'A:B' of indexes or by the timestamp of the first record to show
+    """
+    try:
+        with open(filename, "rb") as fp:
+            size = os.fstat(fp.fileno()).st_size
+            count = max(0, size - offset) // strucc._size
+            if at is not None and count:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    start = bisect_time(buf, offset, strucc, at[0], at[1])
+                return (start, min(start + 1, count))
+    except OSError as e:
+        print(
+            "[ERROR] '%s' raised when tried to read the file '%s'"
+            % (e.strerror, filename)
+        )
+        sys.exit(1)
+
+    if index is not None:
+        start = index + count if index < 0 else index
+        if not 0 <= start < count:
+            return (0, 0)
+        return (start, start + 1)
+    if span is not None:
+        start, stop, _ = slice(*span).indices(count)
+        return (start, max(start, stop))
+    return (0, count) if at is None else (0, 0)
+
+
+def dump_content(
+    filename, offset, strucc, fmt="text", fields=None, where=(), start=0, stop=None
+):
     """
     Dump the content of the file "filename" starting from offset and using the
-    BStruct subclass pointed by strucc
+    BStruct subclass pointed by strucc, optionally limited to the records in
+    the [start, stop) range
     """
     try:
         fp = open(filename, "rb")
@@ -100,16 +371,149 @@ def dump_content(filename, offset, strucc):
         )
         sys.exit(1)
 
-    fp.seek(offset)
+    try:
+        writer = RecordWriter(strucc, sys.stdout, fmt, fields, where)
+    except AttributeError as e:
+        print("[ERROR] %s" % e)
+        sys.exit(1)
 
-    while True:
-        buf = fp.read(strucc._size)
+    fp.seek(offset + start * strucc._size)
+    count = None if stop is None else stop - start
 
-        if len(buf) != strucc._size:
-            break
+    for buf in read_blocks(fp, strucc._size, count):
+        writer.write(buf)
 
-        obj = strucc(buf)
-        print(obj)
+
+class Follower:
+    """
+    Track the whole records appended to a growing file. The file may be
+    truncated, in which case it's read again from the start, or replaced by
+    a new one (rotation), in which case the rest of the old file is read
+    before switching to the new one.
+    """
+
+    def __init__(self, filename, offset, size):
+        self.filename = filename
+        self.start = offset
+        self.size = size
+        self.pos = offset
+        self.fp = None
+        self.ident = None
+
+    def _open(self):
+        try:
+            self.fp = open(self.filename, "rb")
+        except FileNotFoundError:
+            return False
+        st = os.fstat(self.fp.fileno())
+        self.ident = (st.st_dev, st.st_ino)
+        return True
+
+    def _read(self):
+        self.fp.seek(self.pos)
+        for buf in read_blocks(self.fp, self.size):
+            self.pos += len(buf)
+            yield buf
+
+    def poll(self):
+        """Return the blocks of records appended since the last call"""
+        if self.fp is None and not self._open():
+            return []
+
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            st = None
+
+        if st is None or (st.st_dev, st.st_ino) != self.ident:
+            # Rotated (or removed), drain the old file first
+            blocks = list(self._read())
+            self.fp.close()
+            self.fp = None
+            self.pos = self.start
+            if st is not None and self._open():
+                blocks += self._read()
+            return blocks
+
+        if st.st_size < self.pos:
+            # Truncated
+            self.pos = self.start
+
+        if st.st_size - self.pos < self.size:
+            return []
+        return list(self._read())
+
+    def load_state(self, filename):
+        """Resume from the position saved by save_state(), if still valid"""
+        try:
+            with open(filename, "r") as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if self.fp is None and not self._open():
+            return
+        if tuple(state["ident"]) == self.ident:
+            self.pos = state["offset"]
+
+    def save_state(self, filename):
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump({"ident": self.ident, "offset": self.pos}, fp)
+        os.replace(tmp, filename)
+
+
+def follow_content(
+    filename,
+    offset,
+    strucc,
+    interval=1.0,
+    state=None,
+    appendTo=None,
+    fmt="text",
+    fields=None,
+    where=(),
+):
+    """
+    Dump the records of the file "filename" like dump_content() does, then
+    keep polling it every interval seconds for new records. These are either
+    output or appended as they are to the binary file appendTo.
+    """
+    try:
+        if appendTo:
+            out = open(appendTo, "ab")
+
+            def write(buf):
+                out.write(buf)
+                out.flush()
+
+        else:
+            write = RecordWriter(strucc, sys.stdout, fmt, fields, where).write
+    except OSError as e:
+        print(
+            "[ERROR] '%s' raised when tried to open the file '%s'"
+            % (e.strerror, e.filename)
+        )
+        sys.exit(1)
+    except AttributeError as e:
+        print("[ERROR] %s" % e)
+        sys.exit(1)
+
+    follower = Follower(filename, offset, strucc._size)
+    if state:
+        follower.load_state(state)
+
+    try:
+        while True:
+            blocks = follower.poll()
+            for buf in blocks:
+                write(buf)
+            if blocks:
+                sys.stdout.flush()
+                if state:
+                    follower.save_state(state)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -120,7 +524,7 @@ def dump_content(filename, offset, strucc):
         "--input-file",
         action="store",
         dest="inputFile",
-        help="input file",
+        help="input file (directory for the inventory type)",
         required=True,
     )
     argumentParser.add_argument(
@@ -131,25 +535,158 @@ def dump_content(filename, offset, strucc):
         help="input type",
         required=True,
     )
+    argumentParser.add_argument(
+        "-f",
+        "--format",
+        action="store",
+        dest="format",
+        choices=["text", "ndjson", "csv"],
+        help="output format of the records",
+        default="text",
+    )
+    argumentParser.add_argument(
+        "--fields",
+        action="store",
+        dest="fields",
+        help="comma separated list of the fields to output",
+    )
+    argumentParser.add_argument(
+        "--where",
+        action="append",
+        dest="where",
+        metavar="FIELD=VALUE",
+        help="only output the records whose field has the given value",
+        default=[],
+    )
+    argumentParser.add_argument(
+        "--follow",
+        action="store_true",
+        dest="follow",
+        help="keep reading the records appended to the file (ticksraw only)",
+    )
+    argumentParser.add_argument(
+        "--interval",
+        action="store",
+        dest="interval",
+        type=float,
+        help="polling interval of --follow, in seconds",
+        default=1.0,
+    )
+    argumentParser.add_argument(
+        "--state",
+        action="store",
+        dest="state",
+        help="file where --follow saves its position, to resume from it",
+    )
+    argumentParser.add_argument(
+        "--append-to",
+        action="store",
+        dest="appendTo",
+        help="append the raw records read by --follow to this file",
+    )
+    argumentParser.add_argument(
+        "--index",
+        action="store",
+        dest="index",
+        nargs="?",
+        const="toc",
+        metavar="N",
+        help="only print the record N, or without N the table of contents of a "
+        "HCC file",
+    )
+    argumentParser.add_argument(
+        "--range",
+        action="store",
+        dest="range",
+        metavar="A:B",
+        help="only print the records from index A to index B (excluded)",
+    )
+    argumentParser.add_argument(
+        "--at",
+        action="store",
+        dest="at",
+        metavar="TIMESTAMP",
+        help="only print the first record not older than TIMESTAMP (Unix time "
+        "or date)",
+    )
+    argumentParser.add_argument(
+        "--cache",
+        action="store",
+        dest="cache",
+        help="JSON file caching the inventory between runs",
+    )
+    argumentParser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        dest="jobs",
+        type=int,
+        help="number of files read in parallel by the inventory",
+        default=None,
+    )
     argumentParser.add_argument(
         "-h", "--help", action="help", help="Show this help message and exit"
     )
     args = argumentParser.parse_args()
 
-    if args.inputType == "sel":
-        # There's a 4-byte magic preceding the data
-        dump_content(args.inputFile, 4, SymbolSel)
-    elif args.inputType == "ticksraw":
-        dump_content(args.inputFile, 0, TicksRaw)
-    elif args.inputType == "symbolsraw":
-        dump_content(args.inputFile, 0, SymbolsRaw)
-    elif args.inputType == "symgroups":
-        dump_content(args.inputFile, 0, Symgroups)
-    elif args.inputType == "fxt-header":
-        dump_content(args.inputFile, 0, FxtHeader)
+    if args.follow and args.inputType != "ticksraw":
+        argumentParser.error("--follow is only supported by the ticksraw type")
+
+    fields = args.fields.split(",") if args.fields else None
+    try:
+        where = parse_where(args.where)
+    except ValueError as e:
+        argumentParser.error(str(e))
+    options = dict(fmt=args.format, fields=fields, where=where)
+
+    # Seeks in the fixed-size record files
+    index = span = at = None
+    try:
+        if args.index is not None and args.inputType != "hcc-header":
+            if args.index == "toc":
+                raise ValueError("--index requires a record number")
+            index = int(args.index)
+        if args.range is not None:
+            span = [int(x) if x else None for x in args.range.split(":")]
+            if len(span) != 2:
+                raise ValueError("Invalid range '{}'".format(args.range))
+        if args.at is not None:
+            if args.inputType not in TIME_FIELDS:
+                raise ValueError("--at isn't supported by the %s type" % args.inputType)
+            at = (TIME_FIELDS[args.inputType], parse_time(args.at))
+    except ValueError as e:
+        argumentParser.error(str(e))
+
+    if args.inputType in RECORD_TYPES:
+        offset, strucc = RECORD_TYPES[args.inputType]
+        if args.follow:
+            follow_content(
+                args.inputFile,
+                offset,
+                strucc,
+                args.interval,
+                args.state,
+                args.appendTo,
+                **options
+            )
+        else:
+            if index is None and span is None and at is None:
+                start, stop = (0, None)
+            else:
+                start, stop = select_records(
+                    args.inputFile, offset, strucc, index, span, at
+                )
+            dump_content(
+                args.inputFile, offset, strucc, start=start, stop=stop, **options
+            )
+    elif args.inputType == "inventory":
+        dump_inventory(args.inputFile, args.format, args.cache, args.jobs)
     elif args.inputType == "srv":
         dump_srv_content(args.inputFile)
     elif args.inputType == "hcc-header":
-        dump_hcc_content(args.inputFile)
+        if args.index is not None:
+            index_hcc_content(args.inputFile, args.format)
+        else:
+            dump_hcc_content(args.inputFile)
     else:
         print("Invalid type {}!".format(args.inputType))
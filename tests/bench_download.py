@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the downloaders against the local mock datafeed.
+
+fx-data-download.py (with each of the given --jobs values) and
+dl_bt_metaquotes.py download the ticks generated by fx-data-generate.py,
+served by mock_datafeed.MockServer, and the time taken, the requests, the
+connections and the failures are reported.
+
+Example usage:
+  ./bench_download.py --days 5 --latency 0.02 --connect-latency 0.02 -j 1,4,8
+"""
+
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_datafeed import MockDatafeed, MockServer, metaquotes, read_ticks
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def script(name, *args):
+    return [sys.executable, os.path.join(ROOT, name)] + [str(a) for a in args]
+
+
+def run(server, command, dest):
+    """Run the command against a fresh server state and report it"""
+    server.stats.clear()
+    start = time.perf_counter()
+    result = subprocess.run(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        return "failed (%s)" % result.stderr.strip().splitlines()[-1]
+
+    files = sum(len(names) for (_, _, names) in os.walk(dest))
+    stats = server.stats
+    failures = stats[503] + stats["truncated"]
+    return (
+        "%6.2fs %5.1f files/s %8.1f kB/s %5d requests %4d connections %4d failures"
+        % (
+            elapsed,
+            files / elapsed,
+            stats["bytes"] / 1024 / elapsed,
+            stats["requests"],
+            stats["connections"],
+            failures,
+        )
+    )
+
+
+if __name__ == "__main__":
+    argumentParser = argparse.ArgumentParser()
+    argumentParser.add_argument(
+        "-i",
+        "--input-file",
+        dest="inputFile",
+        help="CSV ticks to serve, generated by fx-data-generate.py when missing.",
+    )
+    argumentParser.add_argument("-p", "--pair", dest="pair", default="EURUSD")
+    argumentParser.add_argument(
+        "--start", default="2019.01.01", help="First day of the generated ticks."
+    )
+    argumentParser.add_argument(
+        "--days", type=int, default=3, help="Days of generated ticks."
+    )
+    argumentParser.add_argument(
+        "-j",
+        "--jobs",
+        default="1,4,8",
+        help="fx-data-download.py --jobs values to compare (separated by comma).",
+    )
+    argumentParser.add_argument("--latency", type=float, default=0.01)
+    argumentParser.add_argument(
+        "--connect-latency", dest="connectLatency", type=float, default=0.01
+    )
+    argumentParser.add_argument(
+        "--error-rate", dest="errorRate", type=float, default=0.0
+    )
+    argumentParser.add_argument(
+        "--truncate-rate", dest="truncateRate", type=float, default=0.0
+    )
+    argumentParser.add_argument(
+        "--closed-weekends", dest="closedWeekends", action="store_true"
+    )
+    args = argumentParser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = datetime.datetime.strptime(args.start, "%Y.%m.%d")
+        end = start + datetime.timedelta(days=args.days - 1)
+        csvFile = args.inputFile
+        if csvFile is None:
+            csvFile = os.path.join(tmp, "ticks.csv")
+            subprocess.run(
+                script(
+                    "fx-data-generate.py",
+                    "-p",
+                    "wave",
+                    "-d",
+                    "4",
+                    "-o",
+                    csvFile,
+                    start.strftime("%Y.%m.%d"),
+                    end.strftime("%Y.%m.%d"),
+                    1.1,
+                    1.2,
+                ),
+                check=True,
+            )
+
+        feed = MockDatafeed(
+            read_ticks(csvFile), args.pair, closedWeekends=args.closedWeekends
+        )
+        options = (args.latency, args.connectLatency, args.errorRate, args.truncateRate)
+        with MockServer(feed, 0, *options) as server:
+            days = ",".join(str(start.day + i) for i in range(args.days))
+            for jobs in args.jobs.split(","):
+                dest = os.path.join(tmp, "dukascopy-%s" % jobs)
+                command = script(
+                    "fx-data-download.py",
+                    "-p",
+                    args.pair,
+                    "-y",
+                    start.year,
+                    "-m",
+                    start.month,
+                    "-d",
+                    days,
+                    "-D",
+                    dest,
+                    "-u",
+                    server.url + "/datafeed",
+                    "-j",
+                    jobs,
+                )
+                print("dukascopy  -j %-3s %s" % (jobs, run(server, command, dest)))
+
+            if metaquotes is None:
+                print("metaquotes        skipped, the lzo module is missing")
+            else:
+                dest = os.path.join(tmp, "metaquotes")
+                command = script(
+                    "dl_bt_metaquotes.py",
+                    "-p",
+                    args.pair,
+                    "-y",
+                    start.year,
+                    "-m",
+                    start.month,
+                    "-d",
+                    dest,
+                    "-u",
+                    server.url + "/symbols",
+                )
+                print("metaquotes        %s" % run(server, command, dest))
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Dukascopy and MetaQuotes history servers.
+
+The ticks of a CSV file (as written by fx-data-generate.py) are served as
+the hourly .bi5 files of the Dukascopy datafeed under /datafeed, and as the
+list.txt and monthly .dat files of MetaQuotes under /symbols, the latter
+only when the lzo module is available. Latency, server errors, truncated
+bodies and closed (weekend) hours can be simulated, all reproducibly.
+
+Example usage:
+  ./mock_datafeed.py -i ticks.csv -p EURUSD --port 8000 --latency 0.05
+"""
+
+import argparse
+import calendar
+import collections
+import hashlib
+import lzma
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+try:
+    import dl_bt_metaquotes as metaquotes
+except ImportError:
+    metaquotes = None
+
+BI5_TICK = struct.Struct(">iiiff")
+DAT_BAR = struct.Struct("<IIHHhH")
+
+
+def read_ticks(path):
+    """(ms timestamp, bid, ask, bid volume, ask volume) of the CSV ticks"""
+    ticks = []
+    with open(path, "r") as fp:
+        for line in fp:
+            row = line.rstrip("\n").split(",")
+            if len(row) < 5:
+                continue
+            s = row[0]
+            sec = calendar.timegm(
+                (
+                    int(s[0:4]),
+                    int(s[5:7]),
+                    int(s[8:10]),
+                    int(s[11:13]),
+                    int(s[14:16]),
+                    int(s[17:19]),
+                )
+            )
+            ms = int(s[20:23]) if len(s) > 19 else 0
+            ticks.append((sec * 1000 + ms, *map(float, row[1:5])))
+    return ticks
+
+
+def encode_bi5(ticks, hourStart, point=100000):
+    """The LZMA compressed .bi5 of the ticks of the hour starting at hourStart"""
+    data = b"".join(
+        BI5_TICK.pack(
+            t - hourStart * 1000,
+            round(ask * point),
+            round(bid * point),
+            askVolume,
+            bidVolume,
+        )
+        for (t, bid, ask, bidVolume, askVolume) in ticks
+    )
+    return lzma.compress(data, format=lzma.FORMAT_ALONE)
+
+
+def minute_bars(ticks):
+    """(time, open, high, low, close, volume) M1 bars of the bids, in points"""
+    bars = []
+    for (t, bid, *_) in ticks:
+        minute = t // 60000 * 60
+        price = round(bid * 1e5)
+        if bars and bars[-1][0] == minute:
+            bar = bars[-1]
+            bar[2] = max(bar[2], price)
+            bar[3] = min(bar[3], price)
+            bar[4] = price
+            bar[5] += 1
+        else:
+            bars.append([minute, price, price, price, price, 1])
+    return bars
+
+
+def encode_dat(bars, seed=0):
+    """A MetaQuotes .dat file made of Type-1 blocks only"""
+    blocks = []
+    for i in range(0, len(bars), 64):
+        streak = bars[i : i + 64]
+        blocks.append(bytes([0x3F + len(streak)]))
+        for t, o, h, l, c, v in streak:
+            blocks.append(DAT_BAR.pack(t, o, h - o, o - l, c - o, min(v, 0xFFFF)))
+    data = b"".join(blocks)
+
+    # python-lzo prefixes the LZO1X stream with its own 5-byte header
+    stream = metaquotes.lzo.compress(data)[5:]
+    body = struct.pack("<LI", len(stream), len(data)) + stream
+
+    # Any key lower than the modulus does, the body is xored with its decoding
+    key = bytes(random.Random(seed).randrange(256) for _ in range(127)) + b"\0"
+    head = b"MetaQuotes history file".ljust(0x88, b"\0")
+    return head + key + metaquotes.xor_data(metaquotes.decode_key(key), body)
+
+
+class MockDatafeed:
+    """
+    The files served, by URL path. Hours without ticks are missing, hence
+    answered with 404, as are the weekends with closedWeekends.
+    """
+
+    def __init__(self, ticks, pair="EURUSD", point=100000, closedWeekends=False):
+        self.files = {}
+
+        hours = collections.defaultdict(list)
+        for tick in ticks:
+            hours[tick[0] // 3600000].append(tick)
+
+        for hour, hourTicks in hours.items():
+            tm = time.gmtime(hour * 3600)
+            if closedWeekends and tm.tm_wday >= 5:
+                continue
+            path = "/datafeed/%s/%04d/%02d/%02d/%02dh_ticks.bi5" % (
+                pair,
+                tm.tm_year,
+                tm.tm_mon - 1,
+                tm.tm_mday,
+                tm.tm_hour,
+            )
+            self.files[path] = encode_bi5(hourTicks, hour * 3600, point)
+
+        if metaquotes is None:
+            return
+
+        months = collections.defaultdict(list)
+        for tick in ticks:
+            tm = time.gmtime(tick[0] // 1000)
+            months[(tm.tm_year, tm.tm_mon)].append(tick)
+
+        names = []
+        for (year, month), monthTicks in sorted(months.items()):
+            dat = encode_dat(minute_bars(monthTicks), year * 12 + month)
+            name = "%s_%d_%02d_%s.dat" % (
+                pair,
+                year,
+                month,
+                hashlib.md5(dat).hexdigest(),
+            )
+            self.files["/symbols/%s/%s" % (pair, name)] = dat
+            names.append(name)
+        self.files["/symbols/%s/list.txt" % pair] = "".join(
+            name + "\n" for name in names
+        ).encode("utf-8")
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Serve a MockDatafeed on localhost. Every request waits for 'latency'
+    seconds and every new connection for 'connectLatency' more, 'errorRate'
+    of the requests fail with 503 and 'truncateRate' of them get their body
+    cut short. The counters of what was served are kept in 'stats'.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        feed,
+        port=0,
+        latency=0.0,
+        connectLatency=0.0,
+        errorRate=0.0,
+        truncateRate=0.0,
+        seed=0,
+    ):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.feed = feed
+        self.latency = latency
+        self.connectLatency = connectLatency
+        self.errorRate = errorRate
+        self.truncateRate = truncateRate
+        self.stats = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def draw(self):
+        with self._lock:
+            return self._random.random()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+        time.sleep(self.server.connectLatency)
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body, length=None):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(code)
+        self.server.count("bytes", len(body))
+
+    def do_GET(self):
+        server = self.server
+        server.count("requests")
+        time.sleep(server.latency)
+
+        body = server.feed.files.get(self.path.split("?")[0])
+        if body is None:
+            self.reply(404, b"")
+        elif server.draw() < server.errorRate:
+            self.reply(503, b"")
+        elif server.draw() < server.truncateRate:
+            self.reply(200, body[: len(body) // 2], len(body))
+            server.count("truncated")
+            self.close_connection = True
+        else:
+            self.reply(200, body)
+
+
+if __name__ == "__main__":
+    argumentParser = argparse.ArgumentParser()
+    argumentParser.add_argument(
+        "-i",
+        "--input-file",
+        dest="inputFile",
+        help="CSV ticks to serve.",
+        required=True,
+    )
+    argumentParser.add_argument("-p", "--pair", dest="pair", default="EURUSD")
+    argumentParser.add_argument("--port", dest="port", type=int, default=8000)
+    argumentParser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds waited per request."
+    )
+    argumentParser.add_argument(
+        "--connect-latency",
+        dest="connectLatency",
+        type=float,
+        default=0.0,
+        help="Seconds waited per new connection.",
+    )
+    argumentParser.add_argument(
+        "--error-rate",
+        dest="errorRate",
+        type=float,
+        default=0.0,
+        help="Fraction of the requests failing with 503.",
+    )
+    argumentParser.add_argument(
+        "--truncate-rate",
+        dest="truncateRate",
+        type=float,
+        default=0.0,
+        help="Fraction of the bodies cut short.",
+    )
+    argumentParser.add_argument(
+        "--closed-weekends",
+        dest="closedWeekends",
+        action="store_true",
+        help="Answer 404 for the weekend hours.",
+    )
+    args = argumentParser.parse_args()
+
+    feed = MockDatafeed(
+        read_ticks(args.inputFile), args.pair, closedWeekends=args.closedWeekends
+    )
+    server = MockServer(
+        feed,
+        args.port,
+        args.latency,
+        args.connectLatency,
+        args.errorRate,
+        args.truncateRate,
+    )
+    print("Serving %d files on %s" % (len(feed.files), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(dict(server.stats))
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import mmap
+import struct
+import tempfile
+from copy import copy
+
+import bstruct
+import bstruct_defs
+from bstruct import (
+    Array,
+    BStruct,
+    BStructArray,
+    Pointer,
+    Tail,
+    get_fields_size,
+    pretty_print_string,
+)
+from bstruct_defs import SymbolsRaw, TicksRaw
+
+
+class Sample(BStruct):
+    _endianness = "<"
+    _fields = [
+        ("name", "4s", pretty_print_string),
+        ("value", "I"),
+        ("pair", "2H"),
+        ("price", "d"),
+    ]
+    _size = get_fields_size(_fields)
+
+
+class TestBStruct(unittest.TestCase):
+    def setUp(self):
+        self.buf = struct.pack("<4sIHHd", b"ab\0\0", 7, 1, 2, 1.5)
+
+    def test_compiled(self):
+        self.assertEqual(20, Sample._struct.size)
+        self.assertEqual(("name", "value", "pair", "price"), Sample._names)
+
+    def test_decode(self):
+        s = Sample(b"\xff" + self.buf, 1)
+        self.assertEqual(b"ab\0\0", s.name)
+        self.assertEqual(7, s.value)
+        self.assertEqual((1, 2), s.pair)
+        self.assertEqual(1.5, s.price)
+
+    def test_repack(self):
+        s = Sample(self.buf)
+        self.assertEqual(self.buf, bytes(s.repack()))
+        s.value = 9
+        s.pair = (3, 4)
+        self.assertEqual(
+            struct.pack("<4sIHHd", b"ab\0\0", 9, 3, 4, 1.5), bytes(s.repack())
+        )
+
+    def test_slots(self):
+        s = Sample(self.buf)
+        self.assertFalse(hasattr(s, "__dict__"))
+        with self.assertRaises(AttributeError):
+            s.unknown = 1
+
+    def test_copy(self):
+        s = Sample(self.buf)
+        c = copy(s)
+        c.value = 1
+        self.assertEqual(7, s.value)
+
+    def test_str(self):
+        self.assertIn("name = ab\n", str(Sample(self.buf)))
+
+    def test_lazy(self):
+        s = Sample(b"\xff" + self.buf, 1, lazy=True)
+        self.assertEqual(1.5, s.price)
+        self.assertEqual(1, s._values.count(1.5))
+        self.assertEqual(3, sum(1 for v in s._values if v is bstruct._UNDECODED))
+        self.assertEqual((1, 2), s.pair)
+        self.assertEqual(self.buf, bytes(s.repack()))
+        with self.assertRaises(struct.error):
+            Sample(self.buf[:-1], lazy=True)
+
+    def test_lazy_copy(self):
+        s = Sample(self.buf, lazy=True)
+        c = copy(s)
+        c.value = 1
+        self.assertEqual(7, s.value)
+        self.assertEqual(str(Sample(self.buf)), str(c).replace("= 1\n", "= 7\n"))
+
+    def test_format_fields(self):
+        s = Sample(self.buf, lazy=True)
+        self.assertEqual("price = 1.5\nname = ab\n", s.format_fields(["price", "name"]))
+        self.assertIs(bstruct._UNDECODED, s._values[1])
+        with self.assertRaises(AttributeError):
+            s.format_fields(["nope"])
+
+    def test_bind(self):
+        with tempfile.TemporaryFile() as fp:
+            fp.write(self.buf * 3)
+            fp.flush()
+            with mmap.mmap(fp.fileno(), 0) as m:
+                s = Sample.bind(m, Sample._size)
+                s.value = 9
+                s.pair = (3, 4)
+                c = copy(s)
+                c.price = 2.5
+                del s, c
+            fp.seek(0)
+            self.assertEqual(
+                self.buf + struct.pack("<4sIHHd", b"ab\0\0", 9, 3, 4, 1.5) + self.buf,
+                fp.read(),
+            )
+
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                with self.assertRaises(TypeError):
+                    Sample.bind(m)
+
+    def test_to_dict(self):
+        s = Sample(self.buf)
+        self.assertEqual(
+            {"name": "ab", "value": 7, "pair": [1, 2], "price": 1.5}, s.to_dict()
+        )
+        self.assertEqual({"price": 1.5}, s.to_dict(["price"]))
+
+    def test_iter_plain(self):
+        rows = list(Sample.iter_plain(self.buf * 3, ["pair", "value", "name"]))
+        self.assertEqual([[[1, 2], 7, "ab"]] * 3, rows)
+        self.assertEqual([[7]], list(Sample.iter_plain(self.buf, ["value"])))
+
+    def test_defs(self):
+        buf = bytes(range(256)) * 8
+        self.assertEqual(buf[: SymbolsRaw._size], bytes(SymbolsRaw(buf).repack()))
+        self.assertEqual(buf[: TicksRaw._size], bytes(TicksRaw(buf).repack()))
+        self.assertEqual(1508, len(SymbolsRaw(buf).unknown_1))
+        self.assertEqual(str(SymbolsRaw(buf)), str(SymbolsRaw(buf, lazy=True)))
+
+
+class Item(BStruct):
+    _endianness = "<"
+    _fields = [("extra", "B"), ("value", "H"), ("tail", Tail(lambda n: 2 * n, "extra"))]
+    _size = get_fields_size(_fields)
+
+
+class Node(BStruct):
+    _endianness = "<"
+    _fields = [
+        ("count", "B"),
+        ("target", "H"),
+        ("items", Array(Item, count="count")),
+        ("rest", Array(Item, until=lambda item: item.value == 0)),
+        ("pointed", Pointer(Item, "target")),
+    ]
+    _size = get_fields_size(_fields)
+
+
+class TestDynamicFields(unittest.TestCase):
+    def setUp(self):
+        self.buf = (
+            struct.pack("<BH", 2, 3)
+            + struct.pack("<BH", 1, 10)
+            + b"ab"
+            + struct.pack("<BH", 0, 11)
+            + struct.pack("<BH", 2, 12)
+            + b"cdef"
+            + struct.pack("<BH", 0, 0)
+            + b"END"
+        )
+
+    def test_layout(self):
+        self.assertEqual(3, Item._size)
+        self.assertEqual(3, Node._size)
+        self.assertEqual(("count", "target"), Node._names)
+        self.assertEqual("count = 2\ntarget = 3\n", str(Node(self.buf)))
+
+    def test_values(self):
+        node = Node(self.buf)
+        self.assertEqual([10, 11], [i.value for i in node.items])
+        self.assertEqual([b"ab", b""], [i.tail for i in node.items])
+        self.assertEqual([12], [i.value for i in node.rest])
+        self.assertEqual(b"cdef", node.rest[0].tail)
+        self.assertEqual(10, node.pointed.value)
+        self.assertEqual(len(self.buf) - 3, node._end())
+
+    def test_walk(self):
+        node = Node(self.buf, lazy=True)
+        self.assertEqual([3, 8], list(Node.items.offsets(node)))
+        self.assertEqual([11], list(Node.rest.offsets(node)))
+        self.assertEqual([12], [i.value for i in Node.rest.iter(node, lazy=True)])
+
+    def test_fixed_after_dynamic(self):
+        with self.assertRaises(TypeError):
+
+            class Broken(BStruct):
+                _endianness = "<"
+                _fields = [("tail", Tail(len)), ("value", "H")]
+
+
+@unittest.skipIf(bstruct.np is None, "NumPy is not available")
+class TestBStructArray(unittest.TestCase):
+    def setUp(self):
+        self.buf = b"".join(
+            struct.pack("<12sIddII", b"EURUSD", 1000 + i, 1.0 + i, 1.1 + i, i, 0)
+            for i in range(10)
+        )
+
+    def test_dtype_size(self):
+        for name in dir(bstruct_defs):
+            strucc = getattr(bstruct_defs, name)
+            if isinstance(strucc, type) and "_fields" in strucc.__dict__:
+                dtype = BStructArray.dtype_of(strucc)
+                self.assertEqual(strucc._size, dtype.itemsize, name)
+                self.assertEqual(len(strucc._names), len(dtype.names), name)
+
+    def test_columns(self):
+        ticks = BStructArray(TicksRaw, self.buf)
+        self.assertEqual(10, len(ticks))
+        self.assertEqual(list(range(1000, 1010)), ticks["time"].tolist())
+        self.assertEqual(b"EURUSD", ticks["symbol"][0])
+
+    def test_filter(self):
+        ticks = BStructArray(TicksRaw, self.buf)
+        sub = ticks.where(ticks["bid"] > 5.0, symbol="EURUSD")
+        self.assertEqual([1005, 1006, 1007, 1008, 1009], sub["time"].tolist())
+        self.assertEqual(0, len(ticks.where(symbol="GBPUSD")))
+
+    def test_materialize(self):
+        ticks = BStructArray(TicksRaw, self.buf)
+        last = ticks[-1]
+        self.assertIsInstance(last, TicksRaw)
+        self.assertEqual(1009, last.time)
+        self.assertEqual(1007, ticks[5:][2].time)
+        self.assertEqual(self.buf[:40], bytes(next(iter(ticks)).repack()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import datetime
+
+import csv_format
+from csv_format import TimestampFormatter, format_timestamps, price_format
+
+
+class TestTimestampFormatter(unittest.TestCase):
+    def setUp(self):
+        # Cross a few day, month and year boundaries
+        self.timestamps = range(1388447000, 1388447000 + 5 * 86400, 3607)
+
+    def test_matches_strftime(self):
+        fmt = TimestampFormatter()
+        for t in self.timestamps:
+            dt = datetime.datetime.fromtimestamp(t, datetime.timezone.utc)
+            self.assertEqual("{:%Y.%m.%d %H:%M:%S}".format(dt), fmt(t))
+
+    def test_separator_and_millis(self):
+        fmt = TimestampFormatter("-")
+        self.assertEqual("2014-01-02 13:00:02.013", fmt(1388667602, 13))
+
+    def test_from_datetime(self):
+        fmt = TimestampFormatter()
+        dt = datetime.datetime(2018, 1, 1, 0, 0, 8, 571428)
+        self.assertEqual("2018.01.01 00:00:08.571", fmt.fromDatetime(dt, millis=True))
+
+    @unittest.skipIf(csv_format.np is None, "NumPy is not available")
+    def test_vectorized(self):
+        fmt = TimestampFormatter()
+        self.assertEqual(
+            [fmt(t) for t in self.timestamps],
+            format_timestamps(list(self.timestamps)).tolist(),
+        )
+
+    def test_price_format(self):
+        self.assertEqual("1.36500", price_format(5)(1.365))
+        self.assertEqual("101.250", price_format(3)(101.25))
+
+
+if __name__ == "__main__":
+    unittest.main()
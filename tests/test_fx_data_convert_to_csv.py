@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import importlib.util
+import os
+import struct
+import tempfile
+
+from tests.test_hcc_reader import build_hcc
+
+spec = importlib.util.spec_from_file_location(
+    "fx_data_convert_to_csv",
+    os.path.join(os.path.dirname(__file__), "..", "fx-data-convert-to-csv.py"),
+)
+fx_data_convert_to_csv = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fx_data_convert_to_csv)
+# Found by name when the worker processes unpickle their jobs
+sys.modules["fx_data_convert_to_csv"] = fx_data_convert_to_csv
+
+np = fx_data_convert_to_csv.np
+
+# 2019.01.02 05:00
+HOUR = 1546405200
+
+
+def hst400_rows(n):
+    return [
+        (HOUR + 60 * i, 1.1 + i / 1e4, 1.0 + i / 1e4, 1.2 + i / 1e4, 1.15, 10.5 * i)
+        for i in range(n)
+    ]
+
+
+def hst401_rows(n):
+    return [
+        (HOUR + 60 * i, 1.1, 1.2 + i / 1e4, 1.0 - i / 1e4, 1.15, 3 * i, 12, 2**40 + i)
+        for i in range(n)
+    ]
+
+
+def fxt_rows(n):
+    return [
+        (HOUR + i // 3 * 60, 1.1, 1.2, 1.0, 1.1 + i / 1e5, i + 1, HOUR + 20 * i, 4)
+        for i in range(n)
+    ]
+
+
+def write_history(path, cls, rows):
+    """A file of the cls format holding the rows"""
+    header = bytearray(cls.headerLength)
+    header[0:4] = struct.pack("<i", cls.version)
+    with open(path, "wb") as fp:
+        fp.write(header)
+        fp.write(b"".join(struct.pack(cls.rowFormat, *row) for row in rows))
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, cls, rows):
+        path = os.path.join(self.tmp.name, "%s.bin" % cls.__name__)
+        write_history(path, cls, rows)
+        return cls(path)
+
+
+@unittest.skipIf(np is None, "NumPy is not available")
+class TestColumns(HistoryTestCase):
+    def assertColumns(self, names, rows, columns, timeColumns):
+        self.assertEqual(list(names), list(columns))
+        for i, name in enumerate(names):
+            values = [row[i] for row in rows]
+            if name in timeColumns:
+                self.assertEqual("datetime64[s]", str(columns[name].dtype))
+                self.assertEqual(values, columns[name].astype("int64").tolist())
+            else:
+                self.assertEqual(values, columns[name].tolist(), name)
+
+    def test_hst400(self):
+        rows = hst400_rows(5)
+        data = self.load(fx_data_convert_to_csv.HST509, rows)
+        self.assertColumns(
+            ["timestamp", "open", "low", "high", "close", "volume"],
+            rows,
+            data.columns(),
+            data.timeColumns,
+        )
+
+    def test_hst401(self):
+        rows = hst401_rows(5)
+        data = self.load(fx_data_convert_to_csv.HST, rows)
+        self.assertColumns(
+            ["timestamp", "open", "high", "low", "close", "volume", "spread"]
+            + ["realVolume"],
+            rows,
+            data.columns(),
+            data.timeColumns,
+        )
+
+    def test_fxt(self):
+        rows = fxt_rows(7)
+        data = self.load(fx_data_convert_to_csv.FXT, rows)
+        self.assertColumns(
+            ["barTimestamp", "open", "high", "low", "close", "volume"]
+            + ["tickTimestamp", "flag"],
+            rows,
+            data.columns(),
+            data.timeColumns,
+        )
+
+    def test_chunks(self):
+        rows = fxt_rows(10)
+        data = self.load(fx_data_convert_to_csv.FXT, rows)
+        chunks = list(data.iterColumns(chunkRows=4))
+        self.assertEqual([4, 4, 2], [len(chunk) for chunk in chunks])
+        self.assertEqual(
+            [row[4] for row in rows],
+            np.concatenate([chunk["close"] for chunk in chunks]).tolist(),
+        )
+
+    def test_write_npz(self):
+        rows = hst401_rows(3)
+        columns = self.load(fx_data_convert_to_csv.HST, rows).columns()
+        path = os.path.join(self.tmp.name, "out.npz")
+        fx_data_convert_to_csv.write_columns(columns, path, "npz")
+        with np.load(path) as npz:
+            self.assertEqual(sorted(columns), sorted(npz.files))
+            for name in columns:
+                self.assertEqual(columns[name].tolist(), npz[name].tolist())
+
+        path = os.path.join(self.tmp.name, "out.npy")
+        fx_data_convert_to_csv.write_columns(columns, path, "npy")
+        records = np.load(path)
+        self.assertEqual([row[5] for row in rows], records["volume"].tolist())
+        self.assertEqual(
+            [row[0] for row in rows], records["timestamp"].astype("int64").tolist()
+        )
+
+
+@unittest.skipIf(np is None, "NumPy is not available")
+class TestSummary(HistoryTestCase):
+    def test_fxt_volume(self):
+        # The volume of a tick is the running total of its bar
+        rows = [
+            (HOUR, 1.1, 1.2, 1.0, 1.1, volume, HOUR + i, 4)
+            for i, volume in enumerate([1, 2, 3])
+        ] + [
+            (HOUR + 60, 1.1, 1.2, 1.0, 1.1, volume, HOUR + 60 + i, 4)
+            for i, volume in enumerate([5, 6, 10, 11])
+        ]
+        data = self.load(fx_data_convert_to_csv.FXT, rows)
+        self.assertEqual(14.0, data.summary().asDict()["periods"][0]["volume"])
+
+        # Whatever the chunk boundaries
+        state = {}
+        volumes = [
+            data.summaryVolume(chunk, state).tolist()
+            for chunk in data.iterColumns(chunkRows=2)
+        ]
+        self.assertEqual([[1, 1], [1, 5], [1, 4], [1]], volumes)
+
+
+class TestHcc(HistoryTestCase):
+    def test_cache_index(self):
+        path = os.path.join(self.tmp.name, "EURUSD.hcc")
+        with open(path, "wb") as fp:
+            fp.write(build_hcc([[(HOUR + i, 1.1, i % 2) for i in range(3)]]))
+
+        expected = (
+            "2019.01.02 05:00:00,1.10000,2.10000,0.10000,1.10000\r\n"
+            "2019.01.02 05:00:01,1.10000,2.10000,0.10000,1.10000\r\n"
+            "2019.01.02 05:00:02,1.10000,2.10000,0.10000,1.10000\r\n"
+        )
+        for _ in range(2):
+            data = fx_data_convert_to_csv.HCC(path, cacheIndex=True)
+            data.toCsv(os.path.join(self.tmp.name, "out.csv"))
+            data.reader.close()
+            with open(os.path.join(self.tmp.name, "out.csv"), newline="") as fp:
+                self.assertEqual(expected, fp.read())
+            self.assertTrue(os.path.exists(path + ".idx"))
+
+
+class TestCsv(HistoryTestCase):
+    """The CSV text, as written field by field before the row templates"""
+
+    def csv(self, data):
+        path = os.path.join(self.tmp.name, "out.csv")
+        data.toCsv(path)
+        with open(path, "rb") as fp:
+            return fp.read().decode("ascii")
+
+    def test_hst401(self):
+        data = self.load(
+            fx_data_convert_to_csv.HST,
+            [
+                (HOUR, 1.1, 1.2, 1.0, 1.15, 0, 12, 2**40),
+                (HOUR + 19 * 3600 + 60, 1.123456, 1.2, 0.999995, 1.15, 42, 0, 7),
+            ],
+        )
+        self.assertEqual(
+            "2019.01.02 05:00:00,1.10000,1.20000,1.00000,1.15000,0,12,1099511627776\r\n"
+            "2019.01.03 00:01:00,1.12346,1.20000,0.99999,1.15000,42,0,7\r\n",
+            self.csv(data),
+        )
+
+    def test_hst400(self):
+        data = self.load(
+            fx_data_convert_to_csv.HST509, [(HOUR, 1.1, 1.0, 1.2, 1.15, 10.555)]
+        )
+        self.assertEqual(
+            "2019.01.02 05:00:00,1.10000,1.20000,1.00000,1.15000,10.55\r\n",
+            self.csv(data),
+        )
+        self.assertEqual(
+            "2019.01.02 05:00:00,  1.10000,  1.20000,  1.00000,  1.15000,       10.55",
+            str(data),
+        )
+
+    def test_fxt(self):
+        data = self.load(
+            fx_data_convert_to_csv.FXT,
+            [
+                (HOUR, 1.1, 1.2, 1.0, 1.100005, 1, HOUR + 59, 4),
+                (HOUR + 19 * 3600, 1.1, 1.2, 1.0, 112.345, 2, HOUR + 19 * 3600 + 1, 0),
+            ],
+        )
+        expected = (
+            "2019.01.02 05:00:00,1.10000,1.20000,1.00000,1.10000,1,"
+            "2019.01.02 05:00:59,4\r\n"
+            "2019.01.03 00:00:00,1.10000,1.20000,1.00000,112.34500,2,"
+            "2019.01.03 00:00:01,0\r\n"
+        )
+        self.assertEqual(expected, self.csv(data))
+        self.assertEqual(expected.replace("\r\n", "\n")[:-1], str(data))
+
+    def test_empty(self):
+        data = self.load(fx_data_convert_to_csv.FXT, [])
+        self.assertEqual("", self.csv(data))
+
+
+class TestCsvParallel(HistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.minRows = fx_data_convert_to_csv.PARALLEL_MIN_ROWS
+        # Several ranges out of a few records
+        fx_data_convert_to_csv.PARALLEL_MIN_ROWS = 4
+
+    def tearDown(self):
+        fx_data_convert_to_csv.PARALLEL_MIN_ROWS = self.minRows
+        super().tearDown()
+
+    def assertSameCsv(self, data):
+        serial = os.path.join(self.tmp.name, "serial.csv")
+        parallel = os.path.join(self.tmp.name, "parallel.csv")
+        data.toCsv(serial)
+        data.toCsvParallel(parallel, 3)
+        with open(serial, "rb") as a, open(parallel, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+        # No part is left behind
+        self.assertFalse(
+            [name for name in os.listdir(self.tmp.name) if name.startswith(".parts-")]
+        )
+
+    @unittest.skipIf(
+        not hasattr(os, "copy_file_range"), "os.copy_file_range is not available"
+    )
+    def test_copy_file_range(self):
+        calls = []
+        copy_file_range = os.copy_file_range
+
+        def counted(*args):
+            calls.append(args)
+            return copy_file_range(*args)
+
+        os.copy_file_range = counted
+        try:
+            self.assertSameCsv(self.load(fx_data_convert_to_csv.FXT, fxt_rows(30)))
+            self.assertSameCsv(self.load(fx_data_convert_to_csv.HST, hst401_rows(9)))
+        finally:
+            os.copy_file_range = copy_file_range
+        self.assertTrue(calls)
+
+    def test_fallback(self):
+        copy_file_range = getattr(os, "copy_file_range", None)
+        if copy_file_range is not None:
+            del os.copy_file_range
+        try:
+            self.assertSameCsv(self.load(fx_data_convert_to_csv.FXT, fxt_rows(30)))
+            self.assertSameCsv(self.load(fx_data_convert_to_csv.HST, hst401_rows(9)))
+        finally:
+            if copy_file_range is not None:
+                os.copy_file_range = copy_file_range
+
+    def test_unsupported(self):
+        # Copies between some file systems fail, the rest is copied by hand
+        copy_file_range = getattr(os, "copy_file_range", None)
+
+        def unsupported(*args):
+            raise OSError(18, "Invalid cross-device link")
+
+        os.copy_file_range = unsupported
+        try:
+            self.assertSameCsv(self.load(fx_data_convert_to_csv.FXT, fxt_rows(30)))
+        finally:
+            if copy_file_range is None:
+                del os.copy_file_range
+            else:
+                os.copy_file_range = copy_file_range
+
+
+if __name__ == "__main__":
+    unittest.main()
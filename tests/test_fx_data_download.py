@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import unittest.mock
+
+import tick_store
+from http_pool import HttpPool
+from tests.mock_datafeed import MockDatafeed, MockServer
+
+spec = importlib.util.spec_from_file_location(
+    "fx_data_download",
+    os.path.join(os.path.dirname(__file__), "..", "fx-data-download.py"),
+)
+fx_data_download = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fx_data_download)
+
+# 2019.01.02 05:00
+HOUR = 1546405200
+
+
+def bi5(*ticks):
+    return b"".join(struct.pack(">iiiff", *tick) for tick in ticks)
+
+
+class TestFormatBi5(unittest.TestCase):
+    def format(self, data, point=100000, numpy=True):
+        np = fx_data_download.np
+        if not numpy:
+            fx_data_download.np = None
+        try:
+            return fx_data_download.format_bi5(data, HOUR, point)
+        finally:
+            fx_data_download.np = np
+
+    def test_rows(self):
+        data = bi5((5, 112345, 112340, 1.5, 0.125), (3599999, 99999, 100000, 12.0, 3.0))
+        expected = (
+            b"2019.01.02 05:00:00.005,1.12340,1.12345,0.12,1.50\r\n"
+            b"2019.01.02 05:59:59.999,1.00000,0.99999,3.00,12.00\r\n"
+        )
+        self.assertEqual(expected, self.format(data + b"\0\0"))
+        self.assertEqual(expected, self.format(data, numpy=False))
+        self.assertEqual(
+            b"2019.01.02 05:00:00.005,112.340,112.345,0.12,1.50\r\n",
+            self.format(data[:20], 1000),
+        )
+        self.assertEqual(b"", self.format(b""))
+
+    def test_out_of_hour(self):
+        data = bi5((3600500, 1, 2, 0.5, 0.25))
+        self.assertEqual(
+            b"2019.01.02 06:00:00.500,0.00002,0.00001,0.25,0.50\r\n", self.format(data)
+        )
+
+    @unittest.skipIf(fx_data_download.np is None, "NumPy is not available")
+    def test_vectorized(self):
+        rnd = random.Random(1)
+        data = bi5(
+            *(
+                (
+                    t,
+                    rnd.randrange(200000),
+                    rnd.randrange(200000),
+                    rnd.choice([0.125, 0.375, 2.675, rnd.random() * 100]),
+                    rnd.random(),
+                )
+                for t in sorted(rnd.randrange(3600000) for _ in range(5000))
+            )
+        )
+        for point in (1000, 100000):
+            self.assertEqual(
+                self.format(data, point, numpy=False), self.format(data, point)
+            )
+
+
+class TestBi5Records(unittest.TestCase):
+    def test_records(self):
+        data = bi5((5, 112345, 112340, 1.5, 0.125), (3599999, 99999, 100000, 12.0, 3.0))
+        expected = tick_store.RECORD.pack(
+            HOUR * 1000 + 5, 112340, 112345, 0.125, 1.5
+        ) + tick_store.RECORD.pack(HOUR * 1000 + 3599999, 100000, 99999, 3.0, 12.0)
+        self.assertEqual(expected, fx_data_download.bi5_records(data + b"\0", HOUR))
+
+        np = fx_data_download.np
+        fx_data_download.np = None
+        try:
+            self.assertEqual(expected, fx_data_download.bi5_records(data, HOUR))
+        finally:
+            fx_data_download.np = np
+
+    def test_store_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ds = fx_data_download.Dukascopy("USDJPY", 2019, 1, 2, 5, dest=tmp)
+            self.assertEqual(
+                tmp + "/2019/01/2019-01-02_ticks.bin", ds.store_path("day")
+            )
+            self.assertEqual(tmp + "/2019/2019-01_ticks.bin", ds.store_path("month"))
+            self.assertEqual(1000, ds.point)
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fetch(self, feed, hours, **options):
+        """Download the EURUSD hours, as fetch_all does, from the feed"""
+        with MockServer(feed, **options) as server:
+
+            class Dukascopy(fx_data_download.Dukascopy):
+                base_url = server.url + "/datafeed"
+                http = HttpPool()
+
+            manifests = fx_data_download.Manifests(self.tmp.name)
+            downloads = (
+                Dukascopy(pair, year, month, day, hour, dest=self.tmp.name + "/" + pair)
+                for (pair, year, month, day, hour) in hours
+            )
+            with contextlib.redirect_stdout(io.StringIO()):
+                fx_data_download.fetch_all(downloads, False, 2, manifests=manifests)
+            manifests.save()
+            Dukascopy.http.close()
+        return server.stats
+
+    def hours(self, *starts):
+        for start in starts:
+            tm = fx_data_download.time.gmtime(start)
+            yield ("EURUSD", tm.tm_year, tm.tm_mon, tm.tm_mday, tm.tm_hour)
+
+    def test_record(self):
+        ticks = [(HOUR * 1000 + 5, 1.1, 1.2, 1.0, 1.0)]
+        feed = MockDatafeed(ticks)
+        (path,) = feed.files
+        feed.files[path.replace("05h", "06h")] = b""
+        stats = self.fetch(feed, self.hours(HOUR, HOUR + 3600, HOUR + 7200))
+        # Hours without ticks aren't asked for again and again
+        self.assertEqual(3, stats["requests"])
+
+        manifestFile = self.tmp.name + "/EURUSD/manifest.json"
+        with open(manifestFile) as fp:
+            hours = json.load(fp)["hours"]
+        self.assertEqual([str(HOUR), str(HOUR + 3600), str(HOUR + 7200)], list(hours))
+        status, size, crc, fetched = hours[str(HOUR)]
+        self.assertEqual(("ok", len(feed.files[path])), (status, size))
+        self.assertEqual("%08x" % fx_data_download.zlib.crc32(feed.files[path]), crc)
+        self.assertEqual(["empty", 0], hours[str(HOUR + 3600)][:2])
+        self.assertEqual(["missing", None, None], hours[str(HOUR + 7200)][:3])
+
+        manifest = fx_data_download.Manifest(manifestFile)
+        self.assertEqual(HOUR + 7200, manifest.watermark())
+        self.assertTrue(manifest.done(HOUR + 3600))
+        self.assertFalse(manifest.done(HOUR + 10800))
+
+    def test_update(self):
+        ticks = [(HOUR * 1000 + 3600000 * i, 1.1, 1.2, 1.0, 1.0) for i in range(4)]
+        feed = MockDatafeed(ticks)
+        stats = self.fetch(feed, self.hours(HOUR, HOUR + 3600), errorRate=1.0)
+        self.assertEqual(10, stats[503])
+        self.fetch(feed, self.hours(HOUR + 7200))
+
+        manifests = fx_data_download.Manifests(self.tmp.name)
+        self.assertEqual([HOUR, HOUR + 3600], manifests["EURUSD"].failed())
+        self.assertEqual(HOUR + 7200, manifests["EURUSD"].watermark())
+        # The failed hours, then the ones after the watermark, up to the
+        # last complete one
+        update = fx_data_download.hours_to_update(
+            ["EURUSD"], manifests, HOUR + 5 * 3600 + 10
+        )
+        self.assertEqual(
+            list(self.hours(HOUR, HOUR + 3600, HOUR + 3 * 3600, HOUR + 4 * 3600)),
+            list(update),
+        )
+
+        self.fetch(feed, self.hours(HOUR, HOUR + 3600, HOUR + 3 * 3600))
+        manifests = fx_data_download.Manifests(self.tmp.name)
+        self.assertEqual([], manifests["EURUSD"].failed())
+        self.assertEqual(HOUR + 3 * 3600, manifests["EURUSD"].watermark())
+
+        # A new pair starts with its first hour
+        first = fx_data_download.all_currencies["AUDJPY"]
+        update = fx_data_download.hours_to_update(["AUDJPY"], manifests, first + 7300)
+        self.assertEqual(
+            [("AUDJPY", 2007, 3, 30, 16), ("AUDJPY", 2007, 3, 30, 17)], list(update)
+        )
+
+    def test_recent(self):
+        manifest = fx_data_download.Manifest(self.tmp.name + "/manifest.json")
+        now = int(fx_data_download.time.time())
+
+        def record(start, status):
+            tm = fx_data_download.time.gmtime(start)
+            ds = fx_data_download.Dukascopy(
+                "EURUSD", tm.tm_year, tm.tm_mon, tm.tm_mday, tm.tm_hour, self.tmp.name
+            )
+            ds.status = status
+            manifest.record(ds)
+
+        record(now // 3600 * 3600, "ok")
+        self.assertEqual({}, manifest.hours)
+        # A missing hour might just not be published yet
+        record(now // 3600 * 3600 - 7200, "missing")
+        self.assertEqual([now // 3600 * 3600 - 7200], manifest.failed())
+
+
+class FakeHour:
+    """Stands for a Dukascopy hour, counting the downloads in flight"""
+
+    def __init__(self, n, tracker, fail=False):
+        self.n = n
+        self.url = "hour %d" % n
+        self.status = None
+        self.tracker = tracker
+        self.fail = fail
+
+    def download(self):
+        tracker = self.tracker
+        with tracker["lock"]:
+            tracker["running"] += 1
+            tracker["maxRunning"] = max(tracker["maxRunning"], tracker["running"])
+        # Later hours finish first
+        time.sleep(0.002 * (self.n % 4))
+        with tracker["lock"]:
+            tracker["running"] -= 1
+        if self.fail:
+            raise ValueError("bad hour")
+        self.status = "ok"
+
+    def bi5_to_ticks(self):
+        return self.n
+
+
+class TestFetchAll(unittest.TestCase):
+    def setUp(self):
+        self.tracker = dict(lock=threading.Lock(), running=0, maxRunning=0)
+        self.appended = []
+        self.maxPending = 0
+
+    def append(self, ds, records):
+        self.appended.append(records)
+
+    def downloads(self, count, failed=()):
+        for n in range(count):
+            # Hours started but not appended yet
+            self.maxPending = max(self.maxPending, n - len(self.appended))
+            yield FakeHour(n, self.tracker, n in failed)
+
+    def fetch_all(self, downloads, jobs):
+        store = unittest.mock.Mock(append=self.append)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            fx_data_download.fetch_all(downloads, False, jobs, store)
+        return out.getvalue()
+
+    def test_order(self):
+        self.fetch_all(self.downloads(40), 4)
+        self.assertEqual(list(range(40)), self.appended)
+
+    def test_window(self):
+        self.fetch_all(self.downloads(40), 3)
+        self.assertLessEqual(self.tracker["maxRunning"], 3)
+        self.assertLessEqual(self.maxPending, 2 * 3)
+
+        self.setUp()
+        self.fetch_all(self.downloads(10), 1)
+        self.assertEqual(1, self.tracker["maxRunning"])
+        self.assertEqual(0, self.maxPending)
+
+    def test_failed_hour(self):
+        for jobs in (1, 4):
+            self.setUp()
+            downloads = list(self.downloads(12, failed=(3, 7)))
+            out = self.fetch_all(downloads, jobs)
+            self.assertIn("bad hour, so skipping hour 3.", out)
+            # The failed hours have nothing to store, the others are stored
+            self.assertEqual(
+                [n if n not in (3, 7) else b"" for n in range(12)], self.appended
+            )
+            self.assertEqual(["failed"] * 2, [downloads[3].status, downloads[7].status])
+
+
+class StoredHour(FakeHour):
+    point = 100000
+
+    def __init__(self, n, tracker, fail, dest):
+        super().__init__(n, tracker, fail)
+        self.dest = dest
+
+    def store_path(self, period):
+        return os.path.join(self.dest, "ticks.bin")
+
+    def bi5_to_ticks(self):
+        return tick_store.RECORD.pack(HOUR * 1000 + self.n, 1, 2, 1.0, 1.0)
+
+
+class TestFetchAllStore(unittest.TestCase):
+    def test_failed_hour(self):
+        tracker = dict(lock=threading.Lock(), running=0, maxRunning=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            for jobs in (1, 4):
+                path = os.path.join(tmp, "ticks.bin")
+                if os.path.exists(path):
+                    os.remove(path)
+                store = fx_data_download.TickStores("day")
+                downloads = (StoredHour(n, tracker, n == 2, tmp) for n in range(6))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    fx_data_download.fetch_all(downloads, False, jobs, store)
+                store.close()
+                with open(path, "rb") as fp:
+                    times = [t[0] for t in tick_store.iter_ticks(fp)]
+                self.assertEqual([HOUR * 1000 + n for n in (0, 1, 3, 4, 5)], times)
+
+
+if __name__ == "__main__":
+    unittest.main()
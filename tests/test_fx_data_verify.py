@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import importlib.util
+import os
+import tempfile
+import time
+
+from bstruct_defs import FxtHeader
+
+spec = importlib.util.spec_from_file_location(
+    "fx_data_verify",
+    os.path.join(os.path.dirname(__file__), "..", "fx-data-verify.py"),
+)
+fx_data_verify = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fx_data_verify)
+
+# 2019.01.02 05:00
+HOUR = 1546405200
+
+# One tick every 20 seconds, for 3 minutes
+TICKS = [(HOUR + 20 * i, 1.12 + i / 100000) for i in range(9)]
+
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csvFile = os.path.join(self.tmp.name, "ticks.csv")
+        self.fxtFile = os.path.join(self.tmp.name, "EURUSD1_0.fxt")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, ticks, records):
+        """The CSV of the ticks, the FXT of the (tick, close) records"""
+        with open(self.csvFile, "w") as fp:
+            for t, bid in ticks:
+                fp.write(
+                    "%s.000,%.5f,%.5f,1,1\n"
+                    % (time.strftime("%Y.%m.%d %H:%M:%S", time.gmtime(t)), bid, bid)
+                )
+
+        header = bytearray(FxtHeader._size)
+        fields = FxtHeader.bind(header)
+        fields.headerVersion = fx_data_verify.FXT_VERSION
+        fields.timeframe = 1
+        fields.modelType = 0
+        with open(self.fxtFile, "wb") as fp:
+            fp.write(header)
+            for t, close in records:
+                bar = t - t % 60
+                fp.write(
+                    fx_data_verify.FXT_RECORD.pack(
+                        bar, close, close, close, close, 1, t, 0
+                    )
+                )
+
+    def verify(self):
+        return fx_data_verify.verify(self.csvFile, self.fxtFile, 1e-8)
+
+    def assertDivergence(self, message):
+        with self.assertRaises(fx_data_verify.Divergence) as cm:
+            self.verify()
+        self.assertIn(message, str(cm.exception))
+
+    def offset(self, i):
+        return "offset 0x%x" % (FxtHeader._size + i * fx_data_verify.FXT_RECORD.size)
+
+    def test_clean(self):
+        self.write(TICKS, TICKS)
+        self.assertEqual((9, 9, 3), self.verify())
+
+    def test_close(self):
+        records = list(TICKS)
+        records[4] = (records[4][0], records[4][1] + 0.001)
+        self.write(TICKS, records)
+        self.assertDivergence("FXT record 4 (%s), CSV line 5" % self.offset(4))
+
+    def test_missing_tick(self):
+        self.write(TICKS, TICKS[:6] + TICKS[7:])
+        self.assertDivergence("FXT record 6 (%s), CSV line 7" % self.offset(6))
+
+    def test_extra_lines(self):
+        self.write(TICKS, TICKS[:7])
+        self.assertDivergence(
+            "FXT ends after 7 records (%s), CSV line 8 is left" % self.offset(7)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import os
+import tempfile
+from struct import pack
+
+import hcc_reader
+from hcc_reader import HccReader
+
+
+def build_hcc(tables):
+    """Build a HCC file holding the given tables of (time, price, extra) rows"""
+    header = pack("<I", 501) + bytes(224)
+    body = bytearray()
+    base = len(header) + 18 * (len(tables) + 1)
+    index = bytearray()
+
+    for rows in tables:
+        off = base + len(body)
+        index += pack("<IIHII", 0, 0, 0, 0, off)
+        body += pack("<H", 0x81)
+        body += "LABEL".ljust(32, "\0").encode("utf-16-le")
+        body += bytes(18) + pack("<I", len(rows)) + bytes(101)
+        for t, price, extra in rows:
+            sep = 0x00088884 | (extra << 20)
+            body += pack("<IIdddd", sep, t, price, price + 1, price - 1, price)
+            body += b"\xff" * extra
+
+    return header + index + bytes(18) + body
+
+
+class TestHccReader(unittest.TestCase):
+    def setUp(self):
+        self.tables = [
+            [(1000 + i, float(i), i % 3) for i in range(50)],
+            [(5000 + i, float(i), 0) for i in range(20)],
+        ]
+        fd, self.path = tempfile.mkstemp(suffix=".hcc")
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(build_hcc(self.tables))
+
+    def tearDown(self):
+        for p in (self.path, self.path + hcc_reader.INDEX_CACHE_SUFFIX):
+            if os.path.exists(p):
+                os.remove(p)
+
+    def check_reader(self):
+        with HccReader(self.path) as hcc:
+            self.assertEqual(2, len(hcc.tables))
+            self.assertEqual(70, len(hcc))
+            self.assertEqual("LABEL", hcc.tables[0].label)
+
+            cols = hcc.tables[0].read(10, 13)
+            self.assertEqual([1010, 1011, 1012], [int(x) for x in cols["time"]])
+            self.assertEqual([11.0, 12.0, 13.0], [float(x) for x in cols["high"]])
+
+            cols = hcc.tables[1].read()
+            self.assertEqual(20, len(cols["close"]))
+
+            cols = hcc.read_between(1045, 5002)
+            self.assertEqual(
+                [1045, 1046, 1047, 1048, 1049, 5000, 5001],
+                [int(x) for x in cols["time"]],
+            )
+
+    def test_extent(self):
+        with HccReader(self.path) as hcc:
+            # With and without trailing bytes
+            t0, t1 = hcc.tables
+            self.assertEqual((t0.table.off, t1.table.off, 1000, 1049), t0.extent())
+            self.assertEqual(
+                (t1.table.off, os.path.getsize(self.path), 5000, 5019), t1.extent()
+            )
+            self.assertIsNone(t1._offsets)
+
+    def test_read(self):
+        self.check_reader()
+
+    @unittest.skipIf(hcc_reader.np is None, "NumPy is not available")
+    def test_read_without_numpy(self):
+        np, hcc_reader.np = hcc_reader.np, None
+        try:
+            self.check_reader()
+        finally:
+            hcc_reader.np = np
+
+    def test_index_cache(self):
+        with HccReader(self.path, cache_index=True) as hcc:
+            offsets = list(hcc.tables[0].offsets)
+        self.assertTrue(os.path.exists(self.path + hcc_reader.INDEX_CACHE_SUFFIX))
+
+        with HccReader(self.path, cache_index=True) as hcc:
+            self.assertIsNotNone(hcc.tables[0]._offsets)
+            self.assertEqual(offsets, list(hcc.tables[0].offsets))
+
+    @unittest.skipIf(hcc_reader.np is None, "NumPy is not available")
+    def test_read_paths(self):
+        # Fixed stride or not, the records match the ones decoded one by one
+        with HccReader(self.path) as hcc:
+            ranges = [(0, 0, 50), (0, 3, 4), (0, 7, 8), (1, 0, 20), (1, 5, 9)]
+            expected = []
+            for table, start, stop in ranges:
+                cols = hcc.tables[table].read(start, stop)
+                expected.append({name: cols[name].tolist() for name in cols})
+
+            np, hcc_reader.np = hcc_reader.np, None
+            try:
+                for (table, start, stop), cols in zip(ranges, expected):
+                    self.assertEqual(cols, hcc.tables[table].read(start, stop))
+            finally:
+                hcc_reader.np = np
+
+    def test_corrupt_record_header(self):
+        data = bytearray(build_hcc(self.tables))
+        data[data.index(b"\x81\x00L\x00")] = 0
+        with open(self.path, "wb") as fp:
+            fp.write(data)
+        with HccReader(self.path) as hcc:
+            with self.assertRaises(ValueError):
+                hcc.tables[0].rows
+
+    def test_corrupt_index_cache(self):
+        with HccReader(self.path, cache_index=True) as hcc:
+            offsets = [list(t.offsets) for t in hcc.tables]
+        cachePath = self.path + hcc_reader.INDEX_CACHE_SUFFIX
+        with open(cachePath, "rb") as fp:
+            data = fp.read()
+
+        for corrupt in (data[:10], data[:-4], data[:-8], data + b"\0"):
+            with open(cachePath, "wb") as fp:
+                fp.write(corrupt)
+            # Rebuilt and saved again
+            with HccReader(self.path, cache_index=True) as hcc:
+                self.assertIsNone(hcc.tables[0]._offsets)
+                self.assertEqual(offsets, [list(t.offsets) for t in hcc.tables])
+            with open(cachePath, "rb") as fp:
+                self.assertEqual(data, fp.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
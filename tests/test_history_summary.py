@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import json
+
+import history_summary
+from history_summary import HistorySummary
+
+
+@unittest.skipIf(history_summary.np is None, "NumPy is not available")
+class TestHistorySummary(unittest.TestCase):
+    def setUp(self):
+        day = 86400
+        self.time = [0, 60, 120, day - 60, day + 600, day + 660, 2 * day]
+        self.low = [1.0, 0.5, 1.0, 1.0, 2.0, 1.5, 3.0]
+        self.high = [1.5, 1.0, 2.5, 1.0, 2.5, 2.0, 3.5]
+        self.volume = [1, 2, 3, 4, 5, 6, 7]
+
+    def check(self, summary):
+        d = json.loads(summary.toJson())
+        self.assertEqual(7, d["count"])
+        self.assertEqual(
+            ["1970-01-01", "1970-01-02", "1970-01-03"],
+            [p["period"] for p in d["periods"]],
+        )
+        self.assertEqual([4, 2, 1], [p["count"] for p in d["periods"]])
+        self.assertEqual([0.5, 1.5, 3.0], [p["low"] for p in d["periods"]])
+        self.assertEqual([2.5, 2.5, 3.5], [p["high"] for p in d["periods"]])
+        self.assertEqual([10.0, 11.0, 7.0], [p["volume"] for p in d["periods"]])
+        self.assertEqual(
+            [86400 - 180, 660, 86400 - 660], [p["maxGap"] for p in d["periods"]]
+        )
+        self.assertEqual(86400 - 180, d["maxGap"])
+        self.assertEqual("1970.01.01 23:59:00", d["maxGapAt"])
+
+    def test_single_chunk(self):
+        summary = HistorySummary("day")
+        summary.update(self.time, self.low, self.high, self.volume)
+        self.check(summary)
+
+    def test_split_chunks(self):
+        summary = HistorySummary("day")
+        for a, b in ((0, 2), (2, 5), (5, 7)):
+            summary.update(
+                self.time[a:b], self.low[a:b], self.high[a:b], self.volume[a:b]
+            )
+        self.check(summary)
+
+    def test_month(self):
+        summary = HistorySummary("month")
+        summary.update(self.time, self.low, self.high)
+        d = summary.asDict()
+        self.assertEqual(1, len(d["periods"]))
+        self.assertEqual("1970-01", d["periods"][0]["period"])
+        # No volume rather than a volume of 0
+        self.assertIsNone(d["periods"][0]["volume"])
+        self.assertIsNone(json.loads(summary.toJson())["periods"][0]["volume"])
+        self.assertEqual("-", str(summary).splitlines()[-1].split()[-2])
+
+
+if __name__ == "__main__":
+    unittest.main()
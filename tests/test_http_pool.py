@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import base64
+import gzip
+import os
+import tempfile
+import threading
+import unittest.mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+
+from http_pool import HttpPool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body, **headers):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/data/"):
+            self.reply(200, self.path.encode("utf-8"))
+        elif self.path == "/text":
+            body = b"line 1\nline 2\n"
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                self.reply(200, gzip.compress(body), Content_Encoding="gzip")
+            else:
+                self.reply(200, body)
+        elif self.path == "/moved":
+            self.reply(302, b"", Location="/data/moved")
+        elif self.path == "/close":
+            self.reply(200, b"bye", Connection="close")
+            self.close_connection = True
+        else:
+            self.reply(404, b"not found")
+
+
+class ProxyHandler(Handler):
+    """Answers the absolute URLs sent to an HTTP proxy with what it got"""
+
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get("Proxy-Authorization")))
+        self.reply(200, self.path.encode("utf-8"))
+
+
+class TestHttpPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.url = "http://127.0.0.1:%d" % cls.server.server_address[1]
+        threading.Thread(
+            target=cls.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.connections = 0
+        self.pool = HttpPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_keep_alive(self):
+        for i in range(20):
+            self.assertEqual(b"/data/%d" % i, self.pool.get(self.url + "/data/%d" % i))
+        self.assertEqual(1, Handler.connections)
+
+    def test_reconnect(self):
+        self.assertEqual(b"bye", self.pool.get(self.url + "/close"))
+        self.assertEqual(b"/data/1", self.pool.get(self.url + "/data/1"))
+        self.assertEqual(2, Handler.connections)
+
+        # An idle connection closed by the server is replaced
+        for conn in self.pool._idle.values():
+            conn[0].sock.close()
+        self.assertEqual(b"/data/2", self.pool.get(self.url + "/data/2"))
+
+    def test_gzip(self):
+        pool = HttpPool(compress=True)
+        self.assertEqual(b"line 1\nline 2\n", pool.get(self.url + "/text"))
+        self.assertEqual(b"line 1\nline 2\n", self.pool.get(self.url + "/text"))
+        pool.close()
+
+    def test_errors(self):
+        self.assertEqual(b"/data/moved", self.pool.get(self.url + "/moved"))
+        with self.assertRaises(HTTPError) as cm:
+            self.pool.get(self.url + "/missing")
+        self.assertEqual(404, cm.exception.code)
+        # The connection survives the error
+        self.pool.get(self.url + "/data/1")
+        self.assertEqual(1, Handler.connections)
+
+    def test_threads(self):
+        def work(n):
+            for i in range(10):
+                self.pool.get(self.url + "/data/%d" % (n * 10 + i))
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLessEqual(Handler.connections, 4)
+
+    def test_retrieve(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data")
+            self.assertEqual(7, self.pool.retrieve(self.url + "/data/x", path))
+            with open(path, "rb") as fp:
+                self.assertEqual(b"/data/x", fp.read())
+            with self.assertRaises(HTTPError):
+                self.pool.retrieve(self.url + "/missing", path + "2")
+            self.assertFalse(os.path.exists(path + "2"))
+
+
+class TestProxy(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = []
+        for handler in (Handler, ProxyHandler):
+            server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+            threading.Thread(
+                target=server.serve_forever, args=(0.05,), daemon=True
+            ).start()
+            cls.servers.append(server)
+        cls.url = "http://127.0.0.1:%d" % cls.servers[0].server_address[1]
+        cls.proxy = "127.0.0.1:%d" % cls.servers[1].server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.shutdown()
+            server.server_close()
+
+    def setUp(self):
+        ProxyHandler.requests = []
+
+    def test_http(self):
+        pool = HttpPool(proxies={"http": "http://user:p%40ss@" + self.proxy})
+        for i in range(3):
+            self.assertEqual(
+                b"http://example.invalid/data/%d?x=1" % i,
+                pool.get("http://example.invalid/data/%d?x=1" % i),
+            )
+        pool.close()
+        self.assertEqual(3, len(ProxyHandler.requests))
+        self.assertEqual(
+            "Basic " + base64.b64encode(b"user:p@ss").decode("ascii"),
+            ProxyHandler.requests[0][1],
+        )
+
+    def test_environment(self):
+        environ = {"http_proxy": "http://" + self.proxy, "no_proxy": "127.0.0.1"}
+        with unittest.mock.patch.dict(os.environ, environ):
+            pool = HttpPool()
+        self.assertEqual(
+            b"http://example.invalid/a", pool.get("http://example.invalid/a")
+        )
+        # Hosts in no_proxy are reached directly
+        self.assertEqual(b"/data/1", pool.get(self.url + "/data/1"))
+        pool.close()
+        self.assertEqual([("http://example.invalid/a", None)], ProxyHandler.requests)
+
+    def test_https_tunnel(self):
+        pool = HttpPool(proxies={"https": "http://" + self.proxy})
+        conn, reused = pool._connect(("https", "example.invalid:8443"))
+        self.assertFalse(reused)
+        self.assertEqual(self.proxy, "%s:%d" % (conn.host, conn.port))
+        self.assertEqual(
+            ("example.invalid", 8443), (conn._tunnel_host, conn._tunnel_port)
+        )
+
+        # Without a proxy for the scheme, the connection is direct
+        conn, _ = HttpPool(proxies={})._connect(("https", "example.invalid"))
+        self.assertEqual(("example.invalid", 443), (conn.host, conn.port))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import os
+import tempfile
+from struct import pack
+
+import inventory
+from tests.test_hcc_reader import build_hcc
+
+
+def hst(symbol, period, times):
+    header = pack("<i64s12siiii52s", 401, b"", symbol, period, 5, 0, 0, b"")
+    return header + b"".join(
+        pack("<i4xddddQiQ", t, 1.0, 1.0, 1.0, 1.0, 1, 0, 0) for t in times
+    )
+
+
+def fxt(symbol, period, model, times):
+    header = bytearray(728)
+    header[0:4] = pack("<I", 405)
+    header[196:208] = symbol.ljust(12, b"\0")
+    header[208:216] = pack("<ii", period, model)
+    return bytes(header) + b"".join(
+        pack("<i4xddddQii", t, 1.0, 1.0, 1.0, 1.0, 1, t, 0) for t in times
+    )
+
+
+class TestInventory(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = self.dir.name
+        os.makedirs(os.path.join(self.root, "history", "srv"))
+        os.makedirs(os.path.join(self.root, "tester", "history"))
+        self.write("history/srv/EURUSD60.hst", hst(b"EURUSD", 60, [3600, 7200]))
+        self.write("tester/history/EURUSD1_2.fxt", fxt(b"EURUSD", 1, 2, [60, 120, 180]))
+        self.write("history/srv/symbols.raw", bytes(2 * 1936))
+        self.write("history/srv/notes.txt", b"ignored")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, data):
+        with open(os.path.join(self.root, name), "wb") as fp:
+            fp.write(data)
+
+    def test_scan(self):
+        entries = {os.path.basename(e["path"]): e for e in inventory.scan(self.root)}
+        self.assertEqual(
+            ["EURUSD1_2.fxt", "EURUSD60.hst", "symbols.raw"], sorted(entries)
+        )
+
+        e = entries["EURUSD60.hst"]
+        self.assertEqual(
+            ("hst", "EURUSD", 60, 401),
+            (e["type"], e["symbol"], e["timeframe"], e["version"]),
+        )
+        self.assertEqual((2, 3600, 7200), (e["records"], e["first"], e["last"]))
+
+        e = entries["EURUSD1_2.fxt"]
+        self.assertEqual(("EURUSD", 1, 2), (e["symbol"], e["timeframe"], e["model"]))
+        self.assertEqual((3, 60, 180), (e["records"], e["first"], e["last"]))
+
+        self.assertEqual(2, entries["symbols.raw"]["records"])
+
+    def test_errors(self):
+        self.write("history/srv/broken.fxt", b"junk")
+        entries = {os.path.basename(e["path"]): e for e in inventory.scan(self.root)}
+        self.assertIn("error", entries["broken.fxt"])
+
+    def test_corrupt_hcc(self):
+        os.makedirs(os.path.join(self.root, "bases", "EURUSD"))
+        data = bytearray(build_hcc([[(1000, 1.0, 0)]]))
+        # Clobber the magic of the record header
+        data[data.index(b"\x81\x00L\x00")] = 0x80
+        self.write("bases/EURUSD/2019.hcc", data)
+        entries = {os.path.basename(e["path"]): e for e in inventory.scan(self.root)}
+        self.assertIn("magic", entries["2019.hcc"]["error"])
+        self.assertEqual(2, entries["EURUSD60.hst"]["records"])
+
+    def test_cache(self):
+        cache = os.path.join(self.root, "inventory.json")
+        first = inventory.scan(self.root, cache)
+
+        # Unchanged files are not read again
+        describe = inventory.describe
+        read = []
+        inventory.describe = lambda path: read.append(path) or describe(path)
+        try:
+            self.assertEqual(first, inventory.scan(self.root, cache))
+            self.assertEqual([], read)
+
+            self.write("history/srv/EURUSD60.hst", hst(b"EURUSD", 60, [3600]))
+            os.utime(os.path.join(self.root, "history/srv/EURUSD60.hst"), (0, 0))
+            entries = inventory.scan(self.root, cache)
+            self.assertEqual(1, len(read))
+            self.assertEqual(1, entries[0]["records"])
+        finally:
+            inventory.describe = describe
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import contextlib
+import importlib.util
+import io
+import os
+import tempfile
+from urllib.error import ContentTooShortError, HTTPError
+
+from http_pool import HttpPool
+from tests import mock_datafeed
+from tests.mock_datafeed import MockDatafeed, MockServer, minute_bars, read_ticks
+
+spec = importlib.util.spec_from_file_location(
+    "fx_data_download",
+    os.path.join(os.path.dirname(__file__), "..", "fx-data-download.py"),
+)
+fx_data_download = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fx_data_download)
+
+# 2019.01.04 is a Friday
+CSV = "".join(
+    "2019.01.%02d %02d:%02d:%02d.250,1.%05d,1.%05d,1.00000,2.50000\n"
+    % (day, hour, minute, 7 * minute % 60, 12000 + minute, 12010 + minute)
+    for day in (4, 5)
+    for hour in (0, 1)
+    for minute in range(0, 60, 7)
+)
+
+
+class TestMockDatafeed(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "ticks.csv")
+        with open(path, "w") as fp:
+            fp.write(CSV)
+        self.ticks = read_ticks(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def download(self, server, day, hour):
+        class Dukascopy(fx_data_download.Dukascopy):
+            base_url = server.url + "/datafeed"
+            http = HttpPool()
+
+        ds = Dukascopy("EURUSD", 2019, 1, day, hour, dest=self.tmp.name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ds.download()
+            ds.bt5_to_csv()
+        Dukascopy.http.close()
+        return ds.path.replace("bi5", "csv")
+
+    def test_read_ticks(self):
+        self.assertEqual(36, len(self.ticks))
+        self.assertEqual((1546560000250, 1.12, 1.1201, 1.0, 2.5), self.ticks[0])
+
+    def test_bi5(self):
+        with MockServer(MockDatafeed(self.ticks)) as server:
+            path = self.download(server, 4, 1)
+        with open(path) as fp:
+            rows = fp.read().splitlines()
+        self.assertEqual(9, len(rows))
+        self.assertEqual("2019.01.04 01:07:49.250,1.12007,1.12017,1.00,2.50", rows[1])
+        self.assertEqual(1, server.stats["connections"])
+
+    def test_closed_hours(self):
+        feed = MockDatafeed(self.ticks, closedWeekends=True)
+        self.assertEqual(2, len(feed.files))
+        with MockServer(feed) as server:
+            path = self.download(server, 5, 0)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(1, server.stats[404])
+
+    def test_failures(self):
+        pool = HttpPool()
+        feed = MockDatafeed(self.ticks)
+        url = "/datafeed/EURUSD/2019/00/04/00h_ticks.bi5"
+        with MockServer(feed, errorRate=1.0) as server:
+            with self.assertRaises(HTTPError) as cm:
+                pool.get(server.url + url)
+            self.assertEqual(503, cm.exception.code)
+        with MockServer(feed, truncateRate=1.0) as server:
+            with self.assertRaises(ContentTooShortError):
+                pool.get(server.url + url)
+        with MockServer(feed, errorRate=0.5, seed=1) as server:
+            for i in range(20):
+                try:
+                    self.assertEqual(feed.files[url], pool.get(server.url + url))
+                except HTTPError:
+                    pass
+            self.assertEqual(20, server.stats[200] + server.stats[503])
+            self.assertLess(0, server.stats[503])
+        pool.close()
+
+    @unittest.skipIf(mock_datafeed.metaquotes is None, "lzo is not available")
+    def test_dat(self):
+        metaquotes = mock_datafeed.metaquotes
+        feed = MockDatafeed(self.ticks)
+        (name,) = feed.files["/symbols/EURUSD/list.txt"].decode().split()
+        head, data = metaquotes.decode_body(feed.files["/symbols/EURUSD/" + name])
+        bars = metaquotes.decompress(data, 2019, 1)
+        self.assertEqual(
+            [bar[1:] for bar in minute_bars(self.ticks)],
+            [[b["open"], b["high"], b["low"], b["close"], b["volume"]] for b in bars],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
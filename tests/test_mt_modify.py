@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import contextlib
+import io
+import mmap
+import os
+import tempfile
+import unittest.mock
+
+from bstruct_defs import FxtHeader, SymbolSel, SymbolsRaw
+from mt_modify import (
+    FxtHeaderBundle,
+    InvalidArgument,
+    RecordFile,
+    RecordIndex,
+    SymbolSelBundle,
+    SymbolsRawBundle,
+    apply_in_place,
+    modify_record,
+    run_script,
+)
+
+
+def symbol(name, digits=5):
+    rec = bytearray(SymbolsRaw._size)
+    rec[0:12] = name.encode("utf-8").ljust(12, b"\0")
+    obj = SymbolsRaw.bind(rec)
+    obj.digits = digits
+    return bytes(rec)
+
+
+class TestRecordFile(unittest.TestCase):
+    def setUp(self):
+        self.names = ["AUDUSD", "EURUSD", "GBPUSD", "USDJPY"]
+        self.records = RecordFile(
+            bytearray(b"".join(symbol(n) for n in self.names)), SymbolsRawBundle
+        )
+
+    def names_of(self, records):
+        return [records.name_at(i) for i in range(len(records))]
+
+    def test_find(self):
+        self.assertEqual(2, self.records.find("GBPUSD"))
+        self.assertIsNone(self.records.find("EUR"))
+
+    def test_insert_delete(self):
+        self.assertEqual(2, self.records.insert(symbol("EURUSDm")))
+        self.assertEqual(0, self.records.insert(symbol("AAA")))
+        self.assertEqual(6, self.records.insert(symbol("ZZZ")))
+        self.assertEqual(
+            ["AAA", "AUDUSD", "EURUSD", "EURUSDm", "GBPUSD", "USDJPY", "ZZZ"],
+            self.names_of(self.records),
+        )
+
+        self.records.delete(3)
+        self.records.delete(0)
+        self.records.delete(4)
+        self.assertEqual(self.names, self.names_of(self.records))
+
+    def test_modify(self):
+        rec = self.records.record(1)
+        modify_record(rec, ["digits=3", "spread = 12"])
+        self.assertEqual((3, 12), (rec.digits, rec.spread))
+        self.assertEqual(3, SymbolsRaw(self.records.raw(1)).digits)
+
+        # Nothing is written when a change is invalid
+        with self.assertRaises(ValueError):
+            modify_record(rec, ["digits=4", "spread=x"])
+        self.assertEqual(3, SymbolsRaw(self.records.raw(1)).digits)
+
+    def test_reposition(self):
+        modify_record(self.records.record(0), ["name=ZZZ"])
+        self.assertEqual(3, self.records.reposition(0))
+        modify_record(self.records.record(2), ["name=AAA"])
+        self.assertEqual(0, self.records.reposition(2))
+        self.assertEqual(1, self.records.reposition(1))
+        self.assertEqual(
+            ["AAA", "EURUSD", "GBPUSD", "ZZZ"], self.names_of(self.records)
+        )
+
+    def test_sort(self):
+        records = RecordFile(
+            bytearray(b"".join(symbol(n) for n in reversed(self.names))),
+            SymbolsRawBundle,
+        )
+        self.assertFalse(records.is_sorted())
+        records.sort()
+        self.assertTrue(records.is_sorted())
+        self.assertEqual(self.names, self.names_of(records))
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as fp:
+            fp.write(self.records.buf)
+            fp.flush()
+            records = RecordFile(mmap.mmap(fp.fileno(), 0), SymbolsRawBundle, fp)
+            records.insert(symbol("CADJPY"))
+            records.delete(records.find("USDJPY"))
+            records.record(0).digits = 2
+            records.buf.flush()
+            records.buf.close()
+
+            fp.seek(0)
+            records = RecordFile(bytearray(fp.read()), SymbolsRawBundle)
+            self.assertEqual(
+                ["AUDUSD", "CADJPY", "EURUSD", "GBPUSD"], self.names_of(records)
+            )
+            self.assertEqual(2, records.record(0).digits)
+
+    def test_no_mremap(self):
+        class NoResize(mmap.mmap):
+            # As on macOS
+            def resize(self, size):
+                raise SystemError("mmap: resizing not available--no mremap()")
+
+        with tempfile.TemporaryFile() as fp:
+            fp.write(self.records.buf)
+            fp.flush()
+            records = RecordFile(NoResize(fp.fileno(), 0), SymbolsRawBundle, fp)
+            records.insert(symbol("CADJPY"))
+            records.delete(records.find("GBPUSD"))
+            records.buf.close()
+            self.assertEqual(4 * SymbolsRaw._size, os.fstat(fp.fileno()).st_size)
+
+            fp.seek(0)
+            records = RecordFile(bytearray(fp.read()), SymbolsRawBundle)
+            self.assertEqual(
+                ["AUDUSD", "CADJPY", "EURUSD", "USDJPY"], self.names_of(records)
+            )
+
+    def test_failed_shrink(self):
+        with tempfile.TemporaryFile() as fp:
+            fp.write(self.records.buf)
+            fp.flush()
+            records = RecordFile(mmap.mmap(fp.fileno(), 0), SymbolsRawBundle, fp)
+            with unittest.mock.patch("mt_modify.os.ftruncate", side_effect=OSError):
+                with self.assertRaises(OSError):
+                    records.delete(1)
+            # The file is left as it was
+            self.assertEqual(self.records.buf, records.buf[:])
+            records.buf.close()
+
+    def test_delete_last(self):
+        with tempfile.TemporaryFile() as fp:
+            fp.write(symbol("EURUSD"))
+            fp.flush()
+            records = RecordFile(mmap.mmap(fp.fileno(), 0), SymbolsRawBundle, fp)
+            records.delete(0)
+            self.assertEqual(0, len(records))
+            self.assertEqual(0, os.fstat(fp.fileno()).st_size)
+
+
+class TestRecordIndex(unittest.TestCase):
+    def setUp(self):
+        self.data = b"".join(symbol(n) for n in ["AUDUSD", "EURUSD", "GBPUSD"])
+
+    def test_script(self):
+        records = RecordIndex(self.data, SymbolsRawBundle)
+        for op in [
+            {"key": "EURUSD", "add": "EURUSDm", "modify": {"digits": 3}},
+            {"key": "GBPUSD", "modify": ["name=AAA", "spread=12"]},
+            {"key": "AUDUSD", "delete": True},
+        ]:
+            records.apply(op)
+
+        out = RecordFile(bytearray(records.serialize()), SymbolsRawBundle)
+        self.assertEqual(
+            ["AAA", "EURUSD", "EURUSDm"], [out.name_at(i) for i in range(len(out))]
+        )
+        self.assertEqual([12, 0, 0], [out.record(i).spread for i in range(3)])
+        self.assertEqual([5, 5, 3], [out.record(i).digits for i in range(3)])
+
+    def test_invalid(self):
+        records = RecordIndex(self.data, SymbolsRawBundle)
+        for op in [
+            {"key": "USDJPY", "delete": True},
+            {"key": "EURUSD", "add": "GBPUSD"},
+            {"key": "EURUSD", "modify": {"name": "AUDUSD"}},
+            {"key": "EURUSD"},
+        ]:
+            with self.assertRaises(InvalidArgument):
+                records.apply(op)
+        with self.assertRaises(ValueError):
+            records.apply({"key": "EURUSD", "modify": ["digits=3", "spread=x"]})
+        self.assertEqual(self.data, records.serialize())
+
+
+class TestBundles(unittest.TestCase):
+    def test_sel(self):
+        rec = bytearray(SymbolSel._size)
+        rec[0:6] = b"EURUSD"
+        records = RecordFile(bytearray(b"MAGC" + rec), SymbolSelBundle)
+        self.assertEqual(0, records.find("EURUSD"))
+        rec[0:6] = b"AUDUSD"
+        # Left unsorted, after the magic
+        self.assertEqual(1, records.insert(bytes(rec)))
+        self.assertEqual(b"MAGC", records.buf[:4])
+        self.assertEqual("AUDUSD", records.name_at(1))
+
+    def test_fxt_header(self):
+        header = bytearray(FxtHeader._size)
+        header[196:202] = b"EURUSD"
+        ticks = bytes(range(200))
+        data = bytes(header) + ticks
+
+        records = RecordFile(bytearray(data), FxtHeaderBundle)
+        self.assertEqual(1, len(records))
+        modify_record(records.record(0), ["spread=25", "stopLevel=7"])
+        self.assertEqual(ticks, records.buf[FxtHeader._size :])
+        with self.assertRaises(InvalidArgument):
+            records.delete(0)
+
+        inPlace = RecordFile(bytearray(data), FxtHeaderBundle)
+        apply_in_place(inPlace, {"modify": {"spread": 25, "stopLevel": 7}})
+        with self.assertRaises(InvalidArgument):
+            apply_in_place(inPlace, {"key": "EURUSD", "add": "GBPUSD"})
+        with self.assertRaises(InvalidArgument):
+            apply_in_place(inPlace, {"key": "GBPUSD", "modify": {"spread": 1}})
+        self.assertEqual(records.buf, inPlace.buf)
+        self.assertEqual(
+            (25, 7), (FxtHeader(records.buf).spread, FxtHeader(records.buf).stopLevel)
+        )
+
+    def test_fxt_script(self):
+        header = bytearray(FxtHeader._size)
+        header[196:202] = b"EURUSD"
+        data = bytes(header) + bytes(range(200))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "EURUSD.fxt")
+            with open(path, "wb") as fp:
+                fp.write(data)
+            inode = os.stat(path).st_ino
+
+            run_script(path, FxtHeaderBundle, [{"modify": {"spread": 25}}])
+            with open(path, "rb") as fp:
+                out = fp.read()
+            self.assertEqual(25, FxtHeader(out).spread)
+            self.assertEqual(data[FxtHeader._size :], out[FxtHeader._size :])
+            # Modified in place, not rewritten
+            self.assertEqual(inode, os.stat(path).st_ino)
+
+            # Nothing is written when an operation fails
+            with contextlib.redirect_stdout(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    run_script(
+                        path,
+                        FxtHeaderBundle,
+                        [{"modify": {"spread": 30}}, {"modify": {"spread": "x"}}],
+                    )
+            with open(path, "rb") as fp:
+                self.assertEqual(out, fp.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
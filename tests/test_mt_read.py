@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import contextlib
+import io
+import os
+import tempfile
+from struct import pack
+
+from bstruct_defs import TicksRaw
+from mt_read import (
+    Follower,
+    bisect_time,
+    dump_hcc_content,
+    index_hcc_content,
+    parse_time,
+    select_records,
+)
+from tests.test_hcc_reader import build_hcc
+
+
+def ticks(*times):
+    return b"".join(pack("<12sIddII", b"EURUSD", t, 1.0, 1.1, 0, 0) for t in times)
+
+
+class TestFollower(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "ticks.raw")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, data, mode="ab"):
+        with open(self.path, mode) as fp:
+            fp.write(data)
+
+    def poll(self, follower):
+        return b"".join(bytes(buf) for buf in follower.poll())
+
+    def test_growth(self):
+        follower = Follower(self.path, 0, 40)
+        self.assertEqual(b"", self.poll(follower))
+
+        self.write(ticks(1, 2))
+        self.assertEqual(ticks(1, 2), self.poll(follower))
+        self.assertEqual(b"", self.poll(follower))
+
+        # Partial records are left for later
+        data = ticks(3)
+        self.write(data[:25])
+        self.assertEqual(b"", self.poll(follower))
+        self.write(data[25:])
+        self.assertEqual(ticks(3), self.poll(follower))
+
+    def test_truncation(self):
+        follower = Follower(self.path, 0, 40)
+        self.write(ticks(1, 2))
+        self.poll(follower)
+
+        self.write(ticks(3), "wb")
+        self.assertEqual(ticks(3), self.poll(follower))
+
+    def test_rotation(self):
+        follower = Follower(self.path, 0, 40)
+        self.write(ticks(1))
+        self.poll(follower)
+
+        # The old file still gets drained
+        self.write(ticks(2))
+        os.rename(self.path, self.path + ".1")
+        self.write(ticks(3, 4))
+        self.assertEqual(ticks(2, 3, 4), self.poll(follower))
+
+    def test_state(self):
+        state = os.path.join(self.dir.name, "state.json")
+        follower = Follower(self.path, 0, 40)
+        self.write(ticks(1, 2))
+        self.poll(follower)
+        follower.save_state(state)
+
+        self.write(ticks(3))
+        follower = Follower(self.path, 0, 40)
+        follower.load_state(state)
+        self.assertEqual(ticks(3), self.poll(follower))
+
+
+class TestSeek(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.data = ticks(10, 20, 20, 30, 40)
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(b"MAGI" + self.data)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def select(self, **kwargs):
+        return select_records(self.path, 4, TicksRaw, **kwargs)
+
+    def test_bisect(self):
+        self.assertEqual(0, bisect_time(self.data, 0, TicksRaw, "time", 5))
+        self.assertEqual(1, bisect_time(self.data, 0, TicksRaw, "time", 20))
+        self.assertEqual(3, bisect_time(self.data, 0, TicksRaw, "time", 21))
+        self.assertEqual(5, bisect_time(self.data, 0, TicksRaw, "time", 41))
+
+    def test_select(self):
+        self.assertEqual((4, 5), self.select(index=-1))
+        self.assertEqual((0, 0), self.select(index=5))
+        self.assertEqual((1, 3), self.select(span=[1, 3]))
+        self.assertEqual((3, 5), self.select(span=[-2, None]))
+        self.assertEqual((3, 4), self.select(at=("time", 25)))
+        self.assertEqual((5, 5), self.select(at=("time", 50)))
+
+    def test_parse_time(self):
+        self.assertEqual(86400, parse_time("86400"))
+        self.assertEqual(86400 + 3600, parse_time("1970.01.02 01:00"))
+        self.assertEqual(86400, parse_time("1970-01-02"))
+        with self.assertRaises(ValueError):
+            parse_time("yesterday")
+
+
+class TestHcc(unittest.TestCase):
+    def assertReadError(self, read, data):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "2019.hcc")
+            with open(path, "wb") as fp:
+                fp.write(data)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                with self.assertRaises(SystemExit) as cm:
+                    read(path)
+        self.assertEqual(1, cm.exception.code)
+        self.assertIn("raised when tried to read the file '%s'" % path, out.getvalue())
+
+    def test_empty(self):
+        self.assertReadError(dump_hcc_content, b"")
+        self.assertReadError(index_hcc_content, b"")
+
+    def test_not_hcc(self):
+        self.assertReadError(index_hcc_content, b"\0" * 300)
+
+    def test_corrupt_table(self):
+        data = bytearray(build_hcc([[(1000, 1.0, 0)]]))
+        data[data.index(b"\x81\x00L\x00")] = 0
+        self.assertReadError(index_hcc_content, bytes(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
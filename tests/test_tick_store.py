@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import sys
+
+sys.path.append("..")
+
+import io
+import os
+import tempfile
+
+from tick_store import RECORD, TickWriter, is_tick_file, iter_ticks
+
+
+def records(*times):
+    return b"".join(RECORD.pack(t, 112345, 112350, 1.5, 2.25) for t in times)
+
+
+class TestTickStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "2019", "ticks.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self):
+        with open(self.path, "rb") as fp:
+            return list(iter_ticks(fp, chunkRecords=2))
+
+    def test_round_trip(self):
+        writer = TickWriter(self.path, 100000)
+        self.assertTrue(writer.append(records(1000, 2000, 3000)))
+        writer.close()
+
+        self.assertTrue(is_tick_file(self.path))
+        self.assertEqual(
+            [(t, 1.12345, 1.1235, 1.5, 2.25) for t in (1000, 2000, 3000)], self.read()
+        )
+
+    def test_resume(self):
+        writer = TickWriter(self.path, 100000)
+        writer.append(records(1000, 2000))
+        writer.close()
+        # A partly written record is dropped
+        with open(self.path, "ab") as fp:
+            fp.write(records(3000)[:10])
+
+        writer = TickWriter(self.path, 100000)
+        self.assertFalse(writer.append(records(2000)))
+        self.assertFalse(writer.append(b""))
+        self.assertTrue(writer.append(records(3000, 4000)))
+        writer.close()
+        self.assertEqual([1000, 2000, 3000, 4000], [t[0] for t in self.read()])
+
+        with self.assertRaises(ValueError):
+            TickWriter(self.path, 1000)
+
+    def test_resume_partial_hour(self):
+        hour = records(*range(1000, 1010))
+        writer = TickWriter(self.path, 100000)
+        writer.append(records(500))
+        # Interrupted in the middle of the hour
+        writer.fp.write(hour[: 4 * RECORD.size + 7])
+        writer.fp.close()
+
+        writer = TickWriter(self.path, 100000)
+        self.assertEqual(1003, writer.last)
+        self.assertTrue(writer.append(hour))
+        self.assertFalse(writer.append(hour))
+        writer.close()
+        self.assertEqual([500] + list(range(1000, 1010)), [t[0] for t in self.read()])
+
+    def test_not_a_tick_file(self):
+        with self.assertRaises(ValueError):
+            list(iter_ticks(io.BytesIO(b"2019.01.01 00:00:00.000,1.1,1.2,1,1\n")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary tick files, written by fx-data-download.py straight from the
+.bi5 files and read by fx-data-convert-from-csv.py, skipping the CSV text.
+
+A 16-byte header (magic, version, point) is followed by 24-byte little-endian
+records: the time in milliseconds since the epoch (int64), the bid and ask
+prices in points (int32), the prices being these divided by the point of the
+header, and the bid and ask volumes (float32). The records are in time order.
+"""
+
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"FXTK"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIII")
+RECORD = struct.Struct("<qiiff")
+
+if np is not None:
+    DTYPE = np.dtype(
+        [
+            ("time", "<i8"),
+            ("bid", "<i4"),
+            ("ask", "<i4"),
+            ("bidVolume", "<f4"),
+            ("askVolume", "<f4"),
+        ]
+    )
+
+
+def read_header(fp):
+    """The point of the tick file, ValueError if it isn't one"""
+    data = fp.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError("Not a tick file")
+    magic, version, point, _ = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("Not a tick file")
+    if version != VERSION:
+        raise ValueError("Unsupported tick file version %d" % version)
+    return point
+
+
+def is_tick_file(path):
+    with open(path, "rb") as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+class TickWriter:
+    """
+    Append records to a tick file, created when missing. Records which
+    aren't newer than the ones already in the file are skipped, so that an
+    interrupted download can be resumed, even in the middle of an hour.
+    """
+
+    def __init__(self, path, point):
+        self.path = path
+        self.last = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.fp = open(path, "a+b")
+        self.fp.seek(0)
+        size = os.fstat(self.fp.fileno()).st_size
+        if size == 0:
+            self.fp.write(HEADER.pack(MAGIC, VERSION, point, 0))
+            return
+
+        if read_header(self.fp) != point:
+            self.fp.close()
+            raise ValueError("%s holds prices with another point" % path)
+        # Drop a partly written record
+        count = (size - HEADER.size) // RECORD.size
+        self.fp.truncate(HEADER.size + count * RECORD.size)
+        if count:
+            self.fp.seek(HEADER.size + (count - 1) * RECORD.size)
+            self.last = RECORD.unpack(self.fp.read(RECORD.size))[0]
+
+    def _first_new(self, records):
+        """Index of the first record newer than the file, by bisection"""
+        lo, hi = 0, len(records) // RECORD.size
+        if self.last is None:
+            return lo
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(records, mid * RECORD.size)[0] <= self.last:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def append(self, records):
+        """Append the packed records, but the ones already in the file"""
+        start = self._first_new(records) * RECORD.size
+        if start >= len(records):
+            return False
+        self.fp.write(memoryview(records)[start:])
+        self.last = RECORD.unpack_from(records, len(records) - RECORD.size)[0]
+        return True
+
+    def close(self):
+        self.fp.close()
+
+
+def iter_ticks(fp, chunkRecords=1 << 16):
+    """
+    Yield (time in ms, bid, ask, bid volume, ask volume) of the tick file
+    opened in binary mode
+    """
+    point = read_header(fp)
+    while True:
+        chunk = fp.read(chunkRecords * RECORD.size)
+        chunk = chunk[: len(chunk) - len(chunk) % RECORD.size]
+        if not chunk:
+            break
+        for t, bid, ask, bidVolume, askVolume in RECORD.iter_unpack(chunk):
+            yield (t, bid / point, ask / point, bidVolume, askVolume)